@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import src.checkpoint as checkpoint
+
+# ============== 分析、作图的缓存 =============
+# 每张图、每份分析文本按其输入结果数组、参数，及生成函数（代码、引用的模块常量如颜色线型）的哈希作键，
+# 键与上次相同且输出文件仍在时跳过；键表{输出文件: 键}用checkpoint原子地保存
+# 未命中的输出总在进程池中生成（只有一项时也是），子进程作图用Agg后端，本进程的matplotlib后端不受影响；
+# matplotlib只在作图时导入，只做仿真时不必加载
+
+# 并行生成的进程数，None时为CPU核数
+N_WORKERS = None
+
+
+# 一项输出：render(fileName, **arrays, **params)写出fileName
+#   fileName：输出文件
+#   render：生成函数，须为模块级函数，可在子进程中调用
+#   arrays：{名字: 输入数组}
+#   params：{名字: 参数}，可转为json
+class Task:
+    __slots__ = ("fileName", "render", "arrays", "params")
+
+    def __init__(self, fileName, render, arrays, params=None):
+        self.fileName = fileName
+        self.render = render
+        self.arrays = arrays
+        self.params = {} if params is None else params
+
+
+# 生成输出的子进程的初始化：作图用Agg后端
+def useAgg():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+# 输出的键：输入数组的类型、形状、内容，参数，生成函数的代码及其引用的模块常量
+# 生成函数调用的同一包内的函数（含经模块属性调用的，如equilibrium.getMetrics）逐层计入，其常量、代码改变时键也改变
+def getKey(task):
+    digest = hashlib.sha256()
+    for name in sorted(task.arrays):
+        array = np.ascontiguousarray(task.arrays[name])
+        digest.update(f"{name}:{array.dtype.str}:{array.shape}".encode())
+        digest.update(array.tobytes())
+    digest.update(json.dumps(task.params, sort_keys=True, default=str).encode())
+    package = task.render.__module__.split(".")[0]
+    updateFuncDigest(digest, task.render, package, set())
+    return digest.hexdigest()
+
+
+# 把函数的代码及其引用的模块常量、包内函数计入digest
+# 输入：
+#   digest：hashlib的摘要
+#   func：函数
+#   package：包名，只追踪该包内的函数
+#   seen：已计入的函数的代码，避免重复、递归
+def updateFuncDigest(digest, func, package, seen):
+    if func.__code__ in seen:
+        return
+    seen.add(func.__code__)
+    digest.update(f"{func.__module__}.{func.__qualname__}".encode())
+    updateCodeDigest(digest, func.__code__, func.__globals__, package, seen)
+
+
+# 代码对象计入digest：字节码、常量（嵌套的代码对象如推导式逐层计入），及引用的名字
+def updateCodeDigest(digest, code, globalVars, package, seen):
+    digest.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            updateCodeDigest(digest, const, globalVars, package, seen)
+        else:
+            digest.update(repr(const).encode())
+    for name in code.co_names:
+        value = globalVars.get(name)
+        if isinstance(value, types.ModuleType) and value.__name__.split(".")[0] == package:
+            # 经模块属性引用的常量、函数：co_names中该模块有的属性
+            for attrName in code.co_names:
+                updateValueDigest(digest, f"{name}.{attrName}", getattr(value, attrName, None), package, seen)
+        else:
+            updateValueDigest(digest, name, value, package, seen)
+
+
+# 常量计入名字和值，包内的函数计入其代码
+def updateValueDigest(digest, name, value, package, seen):
+    if isinstance(value, (str, int, float, tuple)):
+        digest.update(f"{name}={value!r}".encode())
+    elif isinstance(value, types.FunctionType) and value.__module__.split(".")[0] == package:
+        updateFuncDigest(digest, value, package, seen)
+
+
+# 生成各项输出，跳过命中缓存的
+# 输入：
+#   tasks：Task列表
+#   cacheFileName：键表文件
+#   nWorkers：并行进程数，None时为N_WORKERS
+# 返回：
+#   hits：各项是否命中
+def run(tasks, cacheFileName, nWorkers=None):
+    if nWorkers is None:
+        nWorkers = N_WORKERS
+    keys = checkpoint.load(cacheFileName) or {}
+    newKeys = [getKey(task) for task in tasks]
+    hits = [keys.get(os.path.abspath(task.fileName)) == key and os.path.exists(task.fileName)
+            for task, key in zip(tasks, newKeys)]
+    misses = [task for task, hit in zip(tasks, hits) if not hit]
+
+    if misses:
+        # mmap的数组复制为普通数组再传给子进程
+        with ProcessPoolExecutor(max_workers=nWorkers, initializer=useAgg) as executor:
+            futures = [executor.submit(task.render, task.fileName,
+                                       **{name: np.array(array) for name, array in task.arrays.items()},
+                                       **task.params) for task in misses]
+            for future in futures:
+                future.result()
+
+    if misses:
+        for task, key, hit in zip(tasks, newKeys, hits):
+            if not hit:
+                keys[os.path.abspath(task.fileName)] = key
+        checkpoint.save(cacheFileName, keys)
+    return hits
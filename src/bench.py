@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import numpy.random as random
+
+import src.core as core
+import src.exp1 as exp1
+import src.network as network
+
+# ============== module vars =============
+
+# 网格
+MESH_LENS = [5, 10, 20]
+N_PACKETS_LIST = [20, 100]
+# 每项计时重复次数，取最小值
+N_REPEATS = 3
+SEED = 0
+# 比基线慢超过该比例视为退化
+REGRESSION_THRESHOLD = 0.2
+
+# 文件
+BENCH_PATH = os.path.join(os.path.dirname(__file__), "..", "bench")
+BENCH_RES_FNAME = os.path.join(BENCH_PATH, "results.json")
+BENCH_BASELINE_FNAME = os.path.join(BENCH_PATH, "baseline.json")
+
+
+# ============== benchmark =============
+
+# 对MESH_LEN、包数网格计时core的热点函数和一整轮exp1.getPacketsLatencies
+# 输入：
+#   meshLens：MESH_LEN列表
+#   nPacketsList：每轮包数列表
+#   nRepeats：每项计时重复次数
+#   seed：随机种子，每个网格点重新设置
+# 返回：
+#   results：{"网格点/函数名": {"meshLen", "nPackets", "name", "seconds", "peakBytes"}}
+def runBench(meshLens=MESH_LENS, nPacketsList=N_PACKETS_LIST, nRepeats=N_REPEATS, seed=SEED):
+    results = {}
+    savedMeshLen = core.MESH_LEN
+    try:
+        for meshLen in meshLens:
+            setMeshLen(meshLen)
+            for nPackets in nPacketsList:
+                random.seed(seed)
+                cases = getCases(nPackets)
+                for name, func in cases:
+                    seconds = timeIt(func, nRepeats)
+                    peakBytes = peakMemory(func)
+                    key = f"{meshLen}x{meshLen}/{nPackets}/{name}"
+                    results[key] = {"meshLen": meshLen, "nPackets": nPackets, "name": name, "seconds": seconds,
+                                    "peakBytes": peakBytes}
+                    print(f"{key}: {seconds * 1e3:.3f} ms, {peakBytes / 2**20:.2f} MiB")
+    finally:
+        setMeshLen(savedMeshLen)
+    return results
+
+
+# 一个网格点上要计时的函数，输入由上一轮路由得到，各函数只读
+# 输入：
+#   nPackets：每轮包数
+# 返回：
+#   cases：[(名字, 无参函数)]
+def getCases(nPackets):
+    state = exp1.newRunState(1)
+    bandwidths = state["bandwidths"]
+    # 先跑一轮，使延迟、选路非平凡
+    lastLatencies, _, _ = exp1.getPacketsLatencies(state["latencies"], core.genPackets(nPackets), bandwidths)
+    packets = core.genPackets(nPackets)
+    D, PI = core.getShortestPaths(lastLatencies)
+    linkLatencies = core.getLatencies(packets, PI, bandwidths)
+    packetsActualLatencies = core.getPacketsActualLatencies(packets, PI, linkLatencies)
+    # 缓冲区已分配好的网络
+    net = network.fromBandwidths(bandwidths, nPackets)
+
+    return [
+        ("getShortestPaths", lambda: core.getShortestPaths(lastLatencies)),
+        ("getLatencies", lambda: core.getLatencies(packets, PI, bandwidths)),
+        ("getPacketsActualLatencies", lambda: core.getPacketsActualLatencies(packets, PI, linkLatencies)),
+        ("getPacketOptLatency", lambda: core.getPacketOptLatency(packets, 0, PI, bandwidths,
+                                                                 packetsActualLatencies[0])),
+        ("getPacketsOptLatencies", lambda: core.getPacketsOptLatencies(packets, PI, bandwidths,
+                                                                       packetsActualLatencies)),
+        ("getModifiedLatencies", lambda: core.getModifiedLatencies(lastLatencies)),
+        ("exp1.getPacketsLatencies", lambda: exp1.getPacketsLatencies(lastLatencies, packets, bandwidths)),
+        ("network.getPacketsLatencies", lambda: network.getPacketsLatencies(net, lastLatencies, packets)),
+    ]
+
+
+# 设置core的网格大小
+def setMeshLen(meshLen):
+    core.MESH_LEN = meshLen
+    core.N_NODES = meshLen**2
+
+
+# 重复nRepeats次，取最短用时
+def timeIt(func, nRepeats):
+    best = float("inf")
+    for _ in range(nRepeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# 运行一次的峰值内存（tracemalloc，只统计Python/NumPy分配）
+def peakMemory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# 与基线比较
+# 输入：
+#   results, baseline：runBench的结果
+#   threshold：用时超过基线(1+threshold)倍视为退化
+# 返回：
+#   regressions：[(键, 基线用时, 本次用时)]
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for key, res in results.items():
+        if key not in baseline:
+            continue
+        baseSeconds = baseline[key]["seconds"]
+        if res["seconds"] > baseSeconds * (1 + threshold):
+            regressions.append((key, baseSeconds, res["seconds"]))
+    return regressions
+
+
+def save(results, fileName):
+    os.makedirs(os.path.dirname(os.path.abspath(fileName)), exist_ok=True)
+    with open(fileName, "w") as file:
+        json.dump({"numpy": np.__version__, "python": sys.version.split()[0], "results": results}, file, indent=2)
+
+
+def read(fileName):
+    with open(fileName) as file:
+        return json.load(file)["results"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark core hot paths across mesh sizes and packet counts.")
+    parser.add_argument("--mesh-lens", type=int, nargs="+", default=MESH_LENS)
+    parser.add_argument("--packets", type=int, nargs="+", default=N_PACKETS_LIST)
+    parser.add_argument("--repeats", type=int, default=N_REPEATS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", default=BENCH_RES_FNAME)
+    parser.add_argument("--baseline", default=BENCH_BASELINE_FNAME)
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = runBench(args.mesh_lens, args.packets, args.repeats, args.seed)
+    save(results, args.out)
+    print(f"Results location: {args.out}")
+
+    if args.save_baseline:
+        save(results, args.baseline)
+        print(f"Baseline location: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with, run with --save-baseline to make one")
+        return 0
+
+    regressions = compare(results, read(args.baseline), args.threshold)
+    for key, baseSeconds, seconds in regressions:
+        print(f"Regression: {key}: {baseSeconds * 1e3:.3f} ms -> {seconds * 1e3:.3f} ms")
+    if regressions:
+        return 1
+    print(f"No regression over {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
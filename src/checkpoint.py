@@ -0,0 +1,44 @@
+import os
+import pickle
+import tempfile
+
+# ============== 检查点 =============
+# 长时间实验定期保存完整状态（各边延迟、各轮指标、随机数状态、当前轮等），
+# 中断后可由最近的检查点继续，结果与不中断时完全相同
+
+
+# 原子地保存检查点：先写同目录下的临时文件，再替换，中途中断不会留下不完整的检查点
+# 输入：
+#   fileName：检查点文件名
+#   state：要保存的状态，可pickle
+def save(fileName, state):
+    dirName = os.path.dirname(os.path.abspath(fileName))
+    fd, tmpFileName = tempfile.mkstemp(dir=dirName, prefix=".tmp-", suffix=".ckpt")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmpFileName, fileName)
+    except BaseException:
+        if os.path.exists(tmpFileName):
+            os.remove(tmpFileName)
+        raise
+
+
+# 读检查点
+# 输入：
+#   fileName：检查点文件名
+# 返回：
+#   state：保存的状态，不存在时为None
+def load(fileName):
+    if not os.path.exists(fileName):
+        return None
+    with open(fileName, "rb") as file:
+        return pickle.load(file)
+
+
+# 实验正常结束后删除检查点
+def remove(fileName):
+    if os.path.exists(fileName):
+        os.remove(fileName)
@@ -0,0 +1,138 @@
+import argparse
+import sys
+
+import numpy as np
+import numpy.random as random
+
+import src.core as core
+import src.exp1 as exp1
+import src.incremental as incremental
+import src.network as network
+
+# ============== 等价性检查 =============
+# 对随机网络跑多轮实验，检查替代实现与参照实现的结果完全相同，不同时返回非0
+
+# 检查的网络数、每个网络的轮数、每轮包数
+N_SEEDS = 20
+N_TURNS = 20
+N_PACKETS = 60
+# 暴力检查最优延迟的情形：(网格边长, 包数, 带宽下限, 带宽上限（不含）)，网格小到可枚举所有简单路径
+# 第二种为重载，偏离后的路径延迟超过MAX_LANRTENCY
+BEST_RESPONSE_CASES = [(4, N_PACKETS, 2, 4), (3, 4000, 1, 2)]
+# 暴力检查时选路所用各边延迟的范围
+ROUTING_LATENCY_RANGE = (1, 10)
+
+
+# 增量全源最短路与Floyd-Warshall的D、PI是否逐轮相同
+# 按exp1的两组推进：改进前为上一轮延迟，改进后为其getModifiedLatencies；每组一个引擎，修补上一轮的结果
+# 输入：
+#   nSeeds, nTurns, nPackets：网络数、每个网络的轮数、每轮包数
+# 返回：
+#   mismatches：[(种子, 轮, 组)]，D或PI不同的轮
+#   nChecked：检查的轮数
+def checkIncremental(nSeeds=N_SEEDS, nTurns=N_TURNS, nPackets=N_PACKETS):
+    mismatches = []
+    nChecked = 0
+    for seed in range(nSeeds):
+        random.seed(seed)
+        state = exp1.newRunState(nTurns)
+        bandwidths = state["bandwidths"]
+        net = network.fromBandwidths(bandwidths, nPackets)
+        engines = [incremental.ShortestPathsEngine(bandwidths), incremental.ShortestPathsEngine(bandwidths)]
+        latencies = state["latencies"]
+        for turn in range(nTurns):
+            for arm, (engine, armLatencies) in enumerate(zip(engines, [latencies,
+                                                                       core.getModifiedLatencies(latencies)])):
+                D, PI = core.getShortestPaths(armLatencies)
+                engineD, enginePI = incremental.getShortestPaths(engine, armLatencies)
+                nChecked += 1
+                if not (np.array_equal(D, engineD) and np.array_equal(PI, enginePI)):
+                    mismatches.append((seed, turn, arm))
+            latencies, _, _ = network.getPacketsLatencies(net, latencies, core.genPackets(nPackets))
+    return mismatches, nChecked
+
+
+# "bestResponse"的最优延迟是否与枚举所有简单路径的结果相同
+# 每轮随机取选路所用的各边延迟与包，求各包的实际延迟、"bestResponse"最优延迟，逐类与暴力结果比较
+# 输入：
+#   nSeeds, nTurns：网络数、每个网络的轮数
+#   cases：BEST_RESPONSE_CASES的格式
+# 返回：
+#   mismatches：[(网格边长, 种子, 轮, 包编号, bestResponse结果, 暴力结果)]
+#   nChecked：检查的包数
+def checkBestResponse(nSeeds=N_SEEDS, nTurns=N_TURNS, cases=None):
+    if cases is None:
+        cases = BEST_RESPONSE_CASES
+    mismatches = []
+    nChecked = 0
+    for meshLen, nPackets, lowBandwidth, highBandwidth in cases:
+        for seed in range(nSeeds):
+            random.seed(seed)
+            bandwidths = core.getBandwidths(core.genMesh(meshLen), lowBandwidth, highBandwidth)
+            nNodes = bandwidths.shape[0]
+            neighbors = core.getNeighbors(bandwidths)
+            for turn in range(nTurns):
+                routingLatencies = np.where(bandwidths != 0, random.randint(*ROUTING_LATENCY_RANGE, bandwidths.shape),
+                                            core.MAX_LANRTENCY).astype(int)
+                _, PI = core.getShortestPaths(routingLatencies)
+                packets = np.asarray(core.genPackets(nPackets, nNodes))
+                linkLatencies = core.getLatencies(packets, PI, bandwidths)
+                packetsActualLatencies = core.getPacketsActualLatencies(packets, PI, linkLatencies)
+                packetsOptLatencies = core.getPacketsOptLatencies(packets, PI, bandwidths, packetsActualLatencies,
+                                                                  method="bestResponse")
+                # 同一(src, dst)的包结果相同，每类查第一个
+                _, iPackets = np.unique(packets @ [nNodes, 1], return_index=True)
+                for iPacket in iPackets:
+                    bruteForce = getBruteForceOptLatency(packets, iPacket, PI, bandwidths,
+                                                         packetsActualLatencies[iPacket], neighbors)
+                    nChecked += 1
+                    if packetsOptLatencies[iPacket] != bruteForce:
+                        mismatches.append((meshLen, seed, turn, iPacket, packetsOptLatencies[iPacket], bruteForce))
+    return mismatches, nChecked
+
+
+# 包i单方面偏离时的最优延迟：深度优先枚举src到dst的所有简单路径，
+# 各边延迟为core.getLeaveOneOutLatencies，与实际延迟取小
+def getBruteForceOptLatency(packets, iPacket, PI, bandwidths, packetActualLatency, neighbors):
+    tmpLatencies = core.getLeaveOneOutLatencies(packets, iPacket, PI, bandwidths)
+    src, dst = packets[iPacket]
+    best = packetActualLatency
+    # (节点, 已走的延迟, 路径上的节点)
+    stack = [(src, 0, {src})]
+    while stack:
+        u, latency, visited = stack.pop()
+        if u == dst:
+            best = min(best, latency)
+            continue
+        for v in neighbors[u]:
+            if v not in visited:
+                stack.append((v, latency + int(tmpLatencies[u, v]), visited | {v}))
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that alternative implementations give exactly the same "
+                                                 "results as the reference ones.")
+    parser.add_argument("--seeds", type=int, default=N_SEEDS)
+    parser.add_argument("--turns", type=int, default=N_TURNS)
+    parser.add_argument("--packets", type=int, default=N_PACKETS)
+    args = parser.parse_args(argv)
+
+    failed = False
+    mismatches, nChecked = checkIncremental(args.seeds, args.turns, args.packets)
+    print(f"incremental vs Floyd-Warshall D/PI: {nChecked - len(mismatches)}/{nChecked} rounds equal")
+    for seed, turn, arm in mismatches:
+        print(f"  mismatch: seed {seed}, round {turn}, {'improved' if arm else 'original'}")
+    failed |= bool(mismatches)
+
+    mismatches, nChecked = checkBestResponse(args.seeds, args.turns)
+    print(f"bestResponse vs brute-force simple paths: {nChecked - len(mismatches)}/{nChecked} packets equal")
+    for meshLen, seed, turn, iPacket, optLatency, bruteForce in mismatches:
+        print(f"  mismatch: mesh {meshLen}, seed {seed}, round {turn}, packet {iPacket}: "
+              f"{optLatency} vs {bruteForce}")
+    failed |= bool(mismatches)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,283 +1,676 @@
-import numpy as np
-import numpy.random as random
-import math
-
-#================ module vars ==============
-MESH_LEN = 5
-N_NODES = MESH_LEN**2
-MAX_LANRTENCY = 1e3
-# 每轮包数
-N_PACKETS = 20
-
-#=========== 初始图 =================
-
-# 获取邻接表
-# 返回：
-#   edges：邻接表
-def genMesh():
-    # 邻接表
-    edges = [[]] * N_NODES
-
-    # 第一行
-    for nodeI in range(0, MESH_LEN):
-        if nodeI == 0:
-            edges[nodeI] = [nodeI + 1, nodeI + MESH_LEN]
-        elif nodeI == MESH_LEN - 1:
-            edges[nodeI] = [nodeI - 1, nodeI + MESH_LEN]
-        else:
-            edges[nodeI] = [nodeI - 1, nodeI + 1, nodeI + MESH_LEN]
-    # 中间行
-    for row in range(1, MESH_LEN - 1):
-        for col in range(0, MESH_LEN):
-            nodeI = row * MESH_LEN + col
-            if nodeI == row * MESH_LEN:
-                edges[nodeI] = [nodeI - MESH_LEN, nodeI + 1, nodeI + MESH_LEN]
-            elif nodeI == (row + 1) * MESH_LEN - 1:
-                edges[nodeI] = [nodeI - MESH_LEN, nodeI - 1, nodeI + MESH_LEN]
-            else:
-                edges[nodeI] = [nodeI-MESH_LEN, nodeI-1, nodeI+1, nodeI+MESH_LEN]
-    # 最后一行
-    for nodeI in range((MESH_LEN-1)*MESH_LEN, MESH_LEN**2):
-        if nodeI == (MESH_LEN-1)*MESH_LEN:
-            edges[nodeI] = [nodeI-MESH_LEN, nodeI+1]
-        elif nodeI == MESH_LEN**2-1:
-            edges[nodeI] = [nodeI-MESH_LEN, nodeI-1]
-        else:
-            edges[nodeI] = [nodeI-MESH_LEN, nodeI-1, nodeI+1]
-    return edges
-
-# 设置带宽
-# 输入：
-#   edges：邻接表
-#   lowBandwidth：最小带宽
-#   highBandwidth：最大带宽
-# 返回：
-#   bandwidths：记录各边带宽的二维矩阵
-def getBandwidths(edges, lowBandwidth, highBandwidth):
-    # 不存在的边带宽为0
-    bandwidths = np.zeros((N_NODES, N_NODES),int)
-    for src in range(len(edges)):
-        for dst in edges[src]:
-            bandwidths[src, dst] = random.randint(lowBandwidth, highBandwidth)
-    return bandwidths
-
-
-
-#=========== 求最短路径 ==============
-
-# Floyd-Warshall求所有节点对最短路径
-# 输入：
-#   latencies：当前各边延迟，相当于距离
-# 返回：
-#   D1：记录各节点对最短距离的二维矩阵
-#   PI1：最短路径的前驱节点矩阵
-def getShortestPaths(latencies):
-    n = N_NODES
-    # 距离
-    D0 = latencies.copy()
-    # 前驱节点
-    PI0 = np.full((n,n),-1,int)
-    for i in range(n):
-        for j in range(n):
-            if i!=j and latencies[i,j]<MAX_LANRTENCY:
-                PI0[i,j] = i
-
-    for k in range(0,n):
-        D1 = np.full((n,n), MAX_LANRTENCY, int)
-        PI1 = np.full((n,n),-1,int)
-        for i in range(0,n):
-            for j in range(0,n):
-                D1[i,j] = min(D0[i,j], D0[i,k]+D0[k,j])
-                if D0[i,j]<= D0[i,k]+D0[k,j]:
-                    PI1[i,j] = PI0[i,j]
-                else:
-                    PI1[i,j] = PI0[k,j]
-        D0 = D1.copy()
-        PI0 = PI1.copy()
-    return D1, PI1
-
-
-
-
-#============ 生成包，更新延迟 ==============
-
-# 产生包
-# 输入：
-#   nPackets：包数
-# 返回：
-#   packets：记录每个包src和dst的列表
-def genPackets(nPackets = N_PACKETS):
-    packets = []
-    for packetI in range(0, nPackets):
-        src = random.randint(0, N_NODES)
-        dst = random.randint(0, N_NODES)
-        while dst==src:
-            dst = random.randint(0, N_NODES)
-        packets.append([src, dst])
-    return packets
-
-
-# 由packets的选路信息PI，以及网络bandwidths，确定各链路latencies
-# 输入：
-#   packets：记录包src和dst的列表
-#   PI：所有节点对最短路径的前驱节点矩阵
-#   bandwidths：记录各边带宽的二维矩阵
-# 返回：
-#   latencies：记录各边延迟的二维矩阵
-def getLatencies(packets, PI, bandwidths):
-    # 求flows：二维矩阵，记录每条边的流量
-    flows = np.zeros((N_NODES, N_NODES), int)
-    for packet in packets:
-        src = packet[0]
-        mid = packet[1]
-        pre = PI[src,mid]
-        # mesh保证所有节点对一定连通
-        while(pre!=src):
-            flows[pre, mid] += 1
-            mid = pre
-            pre = PI[src, mid]
-        flows[pre,mid] += 1
-
-    # 求latencies
-    latencies = np.full((N_NODES,N_NODES), MAX_LANRTENCY, int)
-    for i in range(N_NODES):
-        for j in range(N_NODES):
-            if bandwidths[i,j]!=0:
-                # i,j有边
-                latencies[i,j] = math.ceil(flows[i,j]/bandwidths[i,j])
-    return latencies
-
-
-
-
-# ================ 第t轮实际选路 ==================
-
-# 求第t轮各包实际延迟
-# 输入：
-#   packets：包
-#   PI: 第t轮实际选路前驱节点矩阵
-#   actualLinkLatencies：第t轮实际选路造成的各边延迟
-# 返回：
-#   packetsActualLatencies：各包第t轮实际延迟
-def getPacketsActualLatencies(packets, PI, actualLinkLatencies):
-    packetsActualLatencies = np.zeros(len(packets), int)
-
-    for i in range(len(packets)):
-        packet = packets[i]
-        packetsActualLatencies[i] = getPacketLatency(packet, PI, actualLinkLatencies)
-
-    return packetsActualLatencies
-
-
-# 由当前轮选路、各边延迟，求packet延迟
-# 输入：
-#   packet：待求延迟的包
-#   PI：当前轮选路前驱节点矩阵
-#   linkLatencies：当前轮选路造成的各边延迟
-# 输出：
-#   packetLatency：packet延迟
-def getPacketLatency(packet, PI, linkLatencies):
-    src = packet[0]
-    dst = packet[1]
-    cur = dst
-    pre = PI[src, dst]
-    packetLatency = 0
-    while pre != src:
-        packetLatency += linkLatencies[pre, cur]
-        cur = pre
-        pre = PI[src, pre]
-    packetLatency += linkLatencies[pre, cur]
-    return packetLatency
-
-
-
-#============================ 第t轮最优选路 ========================
-
-# 求第t轮各包最优延迟
-# 输入：
-#   packets：所有包
-#   PI：第t轮实际选路前驱节点矩阵
-#   bandwidths：各边带宽
-# 返回：
-#   packetsOptLatencies：各包第t轮最优延迟
-def getPacketsOptLatencies(packets, PI, bandwidths, packetsActualLatencies):
-    packetsOptLatencies = np.zeros(len(packets), int)
-
-    for i in range(len(packets)):
-        packetsOptLatencies[i] = getPacketOptLatency(packets, i, PI, bandwidths, packetsActualLatencies[i])
-
-    return packetsOptLatencies
-
-
-# 求packet_i的最优延迟
-# 输入：
-#   packets：所有包
-#   iPacket：第i个包编号
-#   PI：第t轮实际选路前驱节点矩阵
-#   bandwidths：各边带宽
-# 返回：
-#   packet_i的最优延迟
-def getPacketOptLatency(packets, iPacket, PI, bandwidths, packetActualLatency):
-    # 求tmpFlows：packets[iPacket]作最优选路时，各边的流量
-    # 相当于实际选路的flows_minusI，然后各边再+1流量，表i选该边增加的流量
-
-    # 先将各边+1流量加上
-    tmpFlows = np.full((N_NODES, N_NODES), 1, int)
-    # 再加上实际选路的flows_minusI
-    for i in range(len(packets)):
-        packet = packets[i]
-        if(i==iPacket):
-            packet_i = packet
-            continue
-        src = packet[0]
-        mid = packet[1]
-        pre = PI[src,mid]
-        # mesh保证所有节点对一定连通
-        while(pre!=src):
-            tmpFlows[pre, mid] += 1
-            mid = pre
-            pre = PI[src, mid]
-        tmpFlows[pre,mid] += 1
-
-    # 由tmpFlows，求各边tmpLatencies
-    tmpLatencies = np.full((N_NODES,N_NODES), MAX_LANRTENCY, int)
-    for i in range(N_NODES):
-        for j in range(N_NODES):
-            if bandwidths[i,j]!=0:
-                # i,j有边
-                tmpLatencies[i,j] = math.ceil(tmpFlows[i,j]/bandwidths[i,j])
-
-    # 由tmpLatencies，求packet_i的最优延迟
-    tmpD, tmpPI = getShortestPaths(tmpLatencies)
-    tmpLinkLatencies = getLatencies(packets, tmpPI, bandwidths)
-    tmpPacketLatency = getPacketLatency(packet_i, tmpPI, tmpLinkLatencies)
-    return min(tmpPacketLatency, packetActualLatency)
-
-
-
-#=============================== 改进选路依据--各边延迟 ======================
-
-# t-1轮的高延迟，导致t轮各包倾向避开高延迟的边，继而导致不均衡，减小高延迟以改进
-# 输入：
-#   actualLinkLatencies：t-1轮各边延迟
-# 输出：
-#   latencies：改进后的延迟
-def getModifiedLatencies(orginalLinkLatencies):
-    latencies = orginalLinkLatencies.copy()
-
-    # 求小于MAX_LATENCY的延迟的均值
-    selectedLatencies = []
-    for i in range(latencies.shape[0]):
-        for j in range(latencies.shape[1]):
-            if latencies[i, j] < MAX_LANRTENCY:
-                selectedLatencies.append(latencies[i, j])
-    selectedLatencies = np.array(selectedLatencies)
-    selectedLatenciesMean = np.mean(selectedLatencies)
-
-    # 将小于MAX_LATENCY，且大于均值的延迟，降到均值
-    for i in range(latencies.shape[0]):
-        for j in range(latencies.shape[1]):
-            if latencies[i, j] < MAX_LANRTENCY and latencies[i, j] >= selectedLatenciesMean:
-                latencies[i, j] = selectedLatenciesMean
-
-    return latencies
\ No newline at end of file
+import numpy as np
+import numpy.random as random
+import math
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import src.jit as jit
+import src.profiling as profiling
+import src.topology as topology
+import src.traffic as traffic
+
+#================ module vars ==============
+MESH_LEN = 5
+N_NODES = MESH_LEN**2
+MAX_LANRTENCY = 1e3
+# 每轮包数
+N_PACKETS = 20
+# 求包最优延迟的方法
+#   "apsp"：原实现，全源最短路后所有包重新选路，res中的结果由其求得
+#   "bestResponse"：其余包选路不变，单源Dijkstra求包i单方面偏离的最优延迟，快得多；需求输入、ensemble只用该方法
+OPT_LATENCY_METHOD = "apsp"
+# 每轮实际选路的全源最短路方法
+#   "floydWarshall"：每轮从头求
+#   "incremental"：incremental.ShortestPathsEngine修补上一轮的结果，距离相等时的选路与"floydWarshall"相同
+SHORTEST_PATHS_METHOD = "floydWarshall"
+# 沿前驱回溯路径的实现
+#   "auto"：装有Numba时用jit编译的版本，否则用NumPy版本
+#   "numba"：jit编译的版本，未装Numba时报错
+#   "python"：NumPy版本
+PATH_WALK_BACKEND = "auto"
+
+# 是否用jit编译的路径回溯，见PATH_WALK_BACKEND
+def useJit():
+    if PATH_WALK_BACKEND == "python":
+        return False
+    if PATH_WALK_BACKEND == "numba":
+        if not jit.isAvailable():
+            raise ImportError("PATH_WALK_BACKEND is 'numba' but numba is not installed or failed to import")
+        return True
+    if PATH_WALK_BACKEND == "auto":
+        return jit.isAvailable()
+    raise ValueError(f"unknown path walk backend: {PATH_WALK_BACKEND}")
+
+#=========== 初始图 =================
+
+# 获取邻接表
+# 输入：
+#   meshLen：网格边长，None时为MESH_LEN
+# 返回：
+#   edges：邻接表
+def genMesh(meshLen=None):
+    if meshLen is None:
+        meshLen = MESH_LEN
+    return topology.toEdges(*topology.genMesh(meshLen))
+
+# 设置带宽，所有边的带宽一次抽取，顺序与逐边抽取相同
+# 输入：
+#   edges：邻接表
+#   lowBandwidth：最小带宽
+#   highBandwidth：最大带宽
+#   rng：numpy.random.RandomState或Generator，None时为全局随机状态
+# 返回：
+#   bandwidths：记录各边带宽的二维矩阵
+def getBandwidths(edges, lowBandwidth, highBandwidth, rng=None):
+    if rng is None:
+        rng = random
+    # 不存在的边带宽为0
+    bandwidths = np.zeros((len(edges), len(edges)),int)
+    srcs = np.repeat(np.arange(len(edges)), [len(neighbors) for neighbors in edges])
+    dsts = np.array([dst for neighbors in edges for dst in neighbors], int)
+    bandwidths[srcs, dsts] = getRandomIntegers(rng, lowBandwidth, highBandwidth, len(srcs))
+    return bandwidths
+
+
+# [low, high)内的随机整数，rng为numpy.random.RandomState（含全局随机状态）或Generator
+def getRandomIntegers(rng, low, high, size=None):
+    if isinstance(rng, random.Generator):
+        return rng.integers(low, high, size=size)
+    return rng.randint(low, high, size=size)
+
+
+
+#=========== 求最短路径 ==============
+
+# Floyd-Warshall求所有节点对最短路径
+# 每个k的松弛对整个矩阵做一次广播（min-plus），原地更新D、PI
+# 第k轮中D的第k行、第k列不会变（D[k,k]>=0），故原地更新与逐轮拷贝结果一致；
+# 仅在严格更短时更新前驱，与原三重循环的相等时保留PI0[i,j]一致
+# 前面可以有批维度，如(R, N, N)为R个网络，各自独立求最短路径
+# 输入：
+#   latencies：当前各边延迟，相当于距离
+#   buffers：ShortestPathsBuffers，None时新分配
+# 返回：
+#   D：记录各节点对最短距离的二维矩阵
+#   PI：最短路径的前驱节点矩阵
+#   给出buffers时D、PI即buffers中的数组，下次用同一buffers调用前有效
+def getShortestPaths(latencies, buffers=None):
+    profiling.count("apspCalls")
+    n = latencies.shape[-1]
+    if buffers is None:
+        buffers = ShortestPathsBuffers(n, latencies.shape[:-2])
+    D, PI, viaK, shorter = buffers.D, buffers.PI, buffers.viaK, buffers.shorter
+    # 距离
+    np.copyto(D, latencies, casting="unsafe")
+    # 前驱节点：有边处为起点
+    hasEdge = shorter
+    np.less(latencies, MAX_LANRTENCY, out=hasEdge)
+    hasEdge[..., np.arange(n), np.arange(n)] = False
+    PI.fill(-1)
+    np.copyto(PI, np.arange(n)[:, None], where=hasEdge)
+
+    for k in range(n):
+        # viaK[i,j] = D[i,k] + D[k,j]
+        np.add(D[..., :, k, None], D[..., None, k, :], out=viaK)
+        np.less(viaK, D, out=shorter)
+        np.copyto(D, viaK, where=shorter)
+        np.copyto(PI, PI[..., k, None, :], where=shorter)
+    return D, PI
+
+
+# getShortestPaths的工作缓冲区，多轮、多个包复用，不必每次分配N_NODES*N_NODES的数组
+#   D, PI：距离、前驱节点矩阵
+#   viaK, shorter：松弛时的中间结果
+class ShortestPathsBuffers:
+    __slots__ = ("D", "PI", "viaK", "shorter")
+
+    # batchShape：批维度，如(R,)
+    # dtype：距离的类型，各边延迟为小数时为float
+    def __init__(self, nNodes, batchShape=(), dtype=int):
+        shape = tuple(batchShape) + (nNodes, nNodes)
+        self.D = np.empty(shape, dtype)
+        self.PI = np.empty(shape, int)
+        self.viaK = np.empty(shape, dtype)
+        self.shorter = np.empty(shape, bool)
+
+
+
+
+#============ 生成包，更新延迟 ==============
+
+# 产生包
+# 输入：
+#   nPackets：包数
+#   nNodes：节点数，None时为N_NODES
+#   rng：numpy.random.RandomState，None时为全局随机状态
+# 返回：
+#   packets：记录每个包src和dst的列表
+def genPackets(nPackets = N_PACKETS, nNodes = None, rng = None):
+    if nNodes is None:
+        nNodes = N_NODES
+    if rng is None:
+        rng = random
+    packets = []
+    for packetI in range(0, nPackets):
+        src = rng.randint(0, nNodes)
+        dst = rng.randint(0, nNodes)
+        while dst==src:
+            dst = rng.randint(0, nNodes)
+        packets.append([src, dst])
+    return packets
+
+
+# 由packets的选路信息PI，以及网络bandwidths，确定各链路latencies
+# 输入：
+#   packets：记录包src和dst的列表，或traffic.Demand
+#   PI：所有节点对最短路径的前驱节点矩阵
+#   bandwidths：记录各边带宽的二维矩阵
+#   out：写入结果的二维矩阵，None时新分配
+# 返回：
+#   latencies：记录各边延迟的二维矩阵
+def getLatencies(packets, PI, bandwidths, out=None):
+    # 求flows：二维矩阵，记录每条边的流量
+    pairs, counts = getPairs(packets)
+    flows = getIncidenceFlows(getIncidence(pairs, PI), counts).reshape(PI.shape)
+    # 求latencies
+    return getLinkLatencies(flows, bandwidths, out)
+
+
+# 由各边流量、带宽求各边延迟ceil(flow/bandwidth)，无边处为MAX_LANRTENCY
+# 输入：
+#   flows：各边流量的二维矩阵
+#   bandwidths：记录各边带宽的二维矩阵
+#   out：写入结果的二维矩阵，None时新分配
+# 返回：
+#   latencies：记录各边延迟的二维矩阵
+def getLinkLatencies(flows, bandwidths, out=None):
+    latencies = np.empty(flows.shape, int) if out is None else out
+    latencies.fill(MAX_LANRTENCY)
+    hasEdge = bandwidths != 0
+    latencies[hasEdge] = -(-flows[hasEdge] // bandwidths[hasEdge])
+    return latencies
+
+
+
+
+#============================ 包-边关联矩阵 ========================
+
+# 一轮选路的包-边关联矩阵，COO稀疏存储：包rows[k]经过边cols[k]
+# 各边流量为按列求和，各包延迟为与各边延迟向量的矩阵-向量乘
+#   nPackets：包数
+#   nEdges：边数；稠密矩阵中边(pre, cur)编号为pre*N_NODES+cur，共N_NODES**2条
+#   rows, cols：非零元的行（包）、列（边）
+class Incidence:
+    __slots__ = ("nPackets", "nEdges", "rows", "cols")
+
+    def __init__(self, nPackets, nEdges, rows, cols):
+        self.nPackets = nPackets
+        self.nEdges = nEdges
+        self.rows = rows
+        self.cols = cols
+
+
+# 所有包同步沿前驱节点矩阵回溯，每步处理所有未到src的包
+# PI为(R, N, N)的R个网络时，packets为(R, P, 2)，第r个网络的包i为第r*P+i行，
+# 边(pre, cur)为第(r*N+pre)*N+cur列
+# 输入：
+#   packets：所有包
+#   PI：选路前驱节点矩阵
+# 返回：
+#   incidence：包-边关联矩阵
+def getIncidence(packets, PI):
+    n = PI.shape[-1]
+    PI = PI.reshape(-1, n, n)
+    packets = np.asarray(packets, int).reshape(-1, 2)
+    # 各包所在网络
+    batches = np.repeat(np.arange(PI.shape[0]), len(packets) // PI.shape[0])
+    srcs = packets[:, 0]
+    curs = packets[:, 1].copy()
+    if useJit():
+        rows, cols = jit.walkIncidence(PI, batches, srcs, curs)
+        profiling.count("pathWalkSteps", len(rows))
+        return Incidence(len(packets), PI.shape[0] * n * n, rows, cols)
+
+    active = np.flatnonzero(srcs != curs)
+    rows = []
+    cols = []
+    while active.size > 0:
+        pres = PI[batches[active], srcs[active], curs[active]]
+        rows.append(active)
+        cols.append((batches[active] * n + pres) * n + curs[active])
+        curs[active] = pres
+        active = active[pres != srcs[active]]
+    if rows:
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+    else:
+        rows = np.zeros(0, int)
+        cols = np.zeros(0, int)
+    profiling.count("pathWalkSteps", len(rows))
+    return Incidence(len(packets), PI.shape[0] * n * n, rows, cols)
+
+
+# 各边流量：关联矩阵按列求和
+# 输入：
+#   incidence：包-边关联矩阵
+#   counts：各行代表的包数，None时每行一个包
+# 返回：
+#   flows：长度为nEdges的一维数组
+def getIncidenceFlows(incidence, counts=None):
+    if counts is None:
+        return np.bincount(incidence.cols, minlength=incidence.nEdges)
+    weights = counts[incidence.rows]
+    return np.bincount(incidence.cols, weights=weights, minlength=incidence.nEdges).astype(int)
+
+
+# 包与traffic.Demand统一为(src, dst)对及各对包数
+# 需求的各对只回溯一次路径，流量按包数加权，同一对的包延迟相同，代价随不同的对数增长
+# 输入：
+#   packets：记录包src和dst的列表，或traffic.Demand
+# 返回：
+#   pairs：包列表原样返回，需求为各(src, dst)对的(K, 2)数组
+#   counts：各对包数，包列表时为None
+def getPairs(packets):
+    if isinstance(packets, traffic.Demand):
+        return np.stack([packets.srcs, packets.dsts], axis=1), packets.counts
+    return packets, None
+
+
+# 各包延迟：关联矩阵乘各边延迟向量
+# 输入：
+#   incidence：包-边关联矩阵
+#   linkLatencies：各边延迟，二维矩阵时按pre*N_NODES+cur展平
+# 返回：
+#   packetsLatencies：各包延迟
+def getIncidenceLatencies(incidence, linkLatencies):
+    weights = np.ravel(linkLatencies)[incidence.cols]
+    return np.bincount(incidence.rows, weights=weights, minlength=incidence.nPackets).astype(int)
+
+
+# 由关联矩阵拆出各包经过的边
+# 返回：
+#   paths：paths[i]为包i的(pres, curs)
+def getIncidencePaths(incidence, nNodes):
+    if incidence.nPackets == 0:
+        return []
+    order = np.argsort(incidence.rows, kind="stable")
+    splits = np.cumsum(np.bincount(incidence.rows, minlength=incidence.nPackets))[:-1]
+    cols = incidence.cols[order]
+    return [(edgeCols // nNodes, edgeCols % nNodes) for edgeCols in np.split(cols, splits)]
+
+
+#============================ 流量统计 ========================
+
+# 依次给出各包偏离时的各边延迟tmpLatencies
+# 包i偏离时，i路径外的边流量为flows+1，i路径上的边流量为flows-1+1=flows，
+# 故先求一次各边flows+1的延迟，每个包只重算自己路径上的边，用完再恢复
+# 输入：
+#   paths：各包经过的边
+#   flows：本轮各边流量
+#   bandwidths：各边带宽
+#   out：用作tmpLatencies的二维矩阵，None时新分配
+# 返回：
+#   依次为各包的tmpLatencies；为同一缓冲区，只在下一个包之前有效
+def iterLeaveOneOutLatencies(paths, flows, bandwidths, out=None):
+    hasEdge = bandwidths != 0
+    tmpLatencies = np.empty(flows.shape, int) if out is None else out
+    tmpLatencies.fill(MAX_LANRTENCY)
+    tmpLatencies[hasEdge] = -(-(flows[hasEdge] + 1) // bandwidths[hasEdge])
+    for pres, curs in paths:
+        saved = tmpLatencies[pres, curs]
+        tmpLatencies[pres, curs] = -(-flows[pres, curs] // bandwidths[pres, curs])
+        yield tmpLatencies
+        tmpLatencies[pres, curs] = saved
+
+
+
+# ================ 第t轮实际选路 ==================
+
+# 求第t轮各包实际延迟
+# 输入：
+#   packets：包，或traffic.Demand
+#   PI: 第t轮实际选路前驱节点矩阵
+#   actualLinkLatencies：第t轮实际选路造成的各边延迟
+# 返回：
+#   packetsActualLatencies：各包第t轮实际延迟；需求时为各(src, dst)对的延迟
+def getPacketsActualLatencies(packets, PI, actualLinkLatencies):
+    pairs, _ = getPairs(packets)
+    return getIncidenceLatencies(getIncidence(pairs, PI), actualLinkLatencies)
+
+
+# 由当前轮选路、各边延迟，求packet延迟
+# 输入：
+#   packet：待求延迟的包
+#   PI：当前轮选路前驱节点矩阵
+#   linkLatencies：当前轮选路造成的各边延迟
+# 输出：
+#   packetLatency：packet延迟
+def getPacketLatency(packet, PI, linkLatencies):
+    src = packet[0]
+    dst = packet[1]
+    if useJit():
+        return jit.walkPacketLatency(PI, linkLatencies, src, dst)
+    cur = dst
+    pre = PI[src, dst]
+    packetLatency = 0
+    while pre != src:
+        packetLatency += linkLatencies[pre, cur]
+        cur = pre
+        pre = PI[src, pre]
+    packetLatency += linkLatencies[pre, cur]
+    return packetLatency
+
+
+
+#============================ 第t轮最优选路 ========================
+
+# 求第t轮各包最优延迟
+# 输入：
+#   packets：所有包，或traffic.Demand（只支持method为"bestResponse"，同一对的包最优延迟相同）
+#   PI：第t轮实际选路前驱节点矩阵
+#   bandwidths：各边带宽
+#   method：求最优延迟的方法，见OPT_LATENCY_METHOD；None时为OPT_LATENCY_METHOD，需求时为"bestResponse"
+#   executor：concurrent.futures的线程池或进程池，None时串行；
+#             进程池时本轮只读数组放入共享内存，各任务不复制
+#   nChunks：并行时包分成的块数，None时为CPU核数
+#   neighbors：各节点邻居列表，None时由bandwidths求
+#   buffers：OptLatencyBuffers，串行时复用，并行时各块自行分配
+# 返回：
+#   packetsOptLatencies：各包第t轮最优延迟；需求时为各(src, dst)对的最优延迟
+def getPacketsOptLatencies(packets, PI, bandwidths, packetsActualLatencies, method=None, executor=None, nChunks=None,
+                           neighbors=None, buffers=None):
+    packets, counts = getPairs(packets)
+    if method is None:
+        method = OPT_LATENCY_METHOD if counts is None else "bestResponse"
+    if method not in ("bestResponse", "apsp"):
+        raise ValueError(f"unknown opt latency method: {method}")
+    if counts is not None and method != "bestResponse":
+        raise ValueError(f"opt latency method {method} does not accept a demand")
+
+    profiling.count("packetsEvaluated", len(packets))
+    # 本轮流量只统计一次，各包的flows_minusI由总流量减去该包路径得到
+    packetsArray = np.asarray(packets, int).reshape(-1, 2)
+    flows = getIncidenceFlows(getIncidence(packetsArray, PI), counts).reshape(PI.shape)
+    # 同一(src, dst)的包在PI下路径相同，偏离问题、实际延迟也相同：
+    # 每类只求第一个包iPackets[c]，结果按classes分给同类各包
+    _, iPackets, classes = np.unique(packetsArray[:, 0] * PI.shape[0] + packetsArray[:, 1], return_index=True,
+                                     return_inverse=True)
+    classes = classes.reshape(-1)
+    nClasses = len(iPackets)
+    profiling.count("optLatencyCacheMisses", nClasses)
+    profiling.count("optLatencyCacheHits", len(packets) - nClasses)
+    if executor is None:
+        return getRangeOptLatencies(packets, PI, bandwidths, flows, packetsActualLatencies, method, 0, nClasses,
+                                    neighbors, buffers, iPackets)[classes]
+
+    if nChunks is None:
+        nChunks = os.cpu_count() or 1
+    bounds = np.linspace(0, nClasses, min(nChunks, nClasses) + 1).astype(int)
+    ranges = [(bounds[k], bounds[k + 1]) for k in range(len(bounds) - 1)]
+    packets = packetsArray
+    packetsActualLatencies = np.asarray(packetsActualLatencies, int)
+
+    if isinstance(executor, ProcessPoolExecutor):
+        arrays = {"packets": packets, "PI": PI, "bandwidths": bandwidths, "flows": flows,
+                  "packetsActualLatencies": packetsActualLatencies, "iPackets": iPackets}
+        shms, descriptors = toSharedMemory(arrays)
+        try:
+            futures = [executor.submit(getSharedRangeOptLatencies, descriptors, method, start, stop)
+                       for start, stop in ranges]
+            results = [future.result() for future in futures]
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+    else:
+        # 线程共享同一份数组
+        futures = [executor.submit(getRangeOptLatencies, packets, PI, bandwidths, flows, packetsActualLatencies, method,
+                                   start, stop, None, None, iPackets) for start, stop in ranges]
+        results = [future.result() for future in futures]
+
+    classesOptLatencies = np.zeros(nClasses, int)
+    for (start, stop), result in zip(ranges, results):
+        classesOptLatencies[start:stop] = result
+    return classesOptLatencies[classes]
+
+
+# 求第start到stop-1个包的最优延迟
+# 输入：
+#   packets, PI, bandwidths, packetsActualLatencies, method：同getPacketsOptLatencies
+#   flows：本轮所有包造成的各边流量
+#   start, stop：包编号范围，iPackets给出时为iPackets中的范围
+#   neighbors, buffers：同getPacketsOptLatencies
+#   iPackets：要求的包编号，None时为所有包
+# 返回：
+#   这些包的最优延迟
+def getRangeOptLatencies(packets, PI, bandwidths, flows, packetsActualLatencies, method, start, stop, neighbors=None,
+                         buffers=None, iPackets=None):
+    if iPackets is None:
+        iPackets = np.arange(len(packets))
+    iPackets = iPackets[start:stop]
+    packetsOptLatencies = np.zeros(stop - start, int)
+    incidence = getIncidence(np.asarray(packets, int).reshape(-1, 2)[iPackets], PI)
+    paths = getIncidencePaths(incidence, PI.shape[0])
+    if neighbors is None:
+        neighbors = getNeighbors(bandwidths)
+    if buffers is None:
+        buffers = OptLatencyBuffers(PI.shape[0])
+    for k, tmpLatencies in enumerate(iterLeaveOneOutLatencies(paths, flows, bandwidths, buffers.tmpLatencies)):
+        i = iPackets[k]
+        if method == "bestResponse":
+            packetsOptLatencies[k] = getPacketBestResponseLatency(packets, i, PI, bandwidths, packetsActualLatencies[i],
+                                                                  neighbors, tmpLatencies)
+        else:
+            packetsOptLatencies[k] = getPacketOptLatency(packets, i, PI, bandwidths, packetsActualLatencies[i],
+                                                         tmpLatencies, buffers)
+    return packetsOptLatencies
+
+
+# 求各包最优延迟时的工作缓冲区，本轮各包、各轮复用
+#   tmpLatencies：包i偏离时的各边延迟
+#   shortestPaths：method为"apsp"时每个包重新求全源最短路的缓冲区
+#   linkLatencies：method为"apsp"时所有包重新选路造成的各边延迟
+class OptLatencyBuffers:
+    __slots__ = ("tmpLatencies", "shortestPaths", "linkLatencies")
+
+    def __init__(self, nNodes):
+        self.tmpLatencies = np.empty((nNodes, nNodes), int)
+        self.shortestPaths = ShortestPathsBuffers(nNodes)
+        self.linkLatencies = np.empty((nNodes, nNodes), int)
+
+
+# 子进程中由共享内存取数组，求iPackets中第start到stop-1个包的最优延迟
+def getSharedRangeOptLatencies(descriptors, method, start, stop):
+    shms, arrays = fromSharedMemory(descriptors)
+    try:
+        return getRangeOptLatencies(arrays["packets"], arrays["PI"], arrays["bandwidths"], arrays["flows"],
+                                    arrays["packetsActualLatencies"], method, start, stop, iPackets=arrays["iPackets"])
+    finally:
+        del arrays
+        for shm in shms:
+            shm.close()
+
+
+# 将数组复制到共享内存
+# 输入：
+#   arrays：{名字: 数组}
+# 返回：
+#   shms：共享内存块，用完由调用者close、unlink
+#   descriptors：{名字: (共享内存名, shape, dtype)}，可传给子进程
+def toSharedMemory(arrays):
+    shms = []
+    descriptors = {}
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        shms.append(shm)
+        descriptors[key] = (shm.name, array.shape, array.dtype.str)
+    return shms, descriptors
+
+
+# 由descriptors挂载共享内存中的数组，不复制
+# 返回：
+#   shms：共享内存块，用完由调用者close
+#   arrays：{名字: 数组}
+def fromSharedMemory(descriptors):
+    shms = []
+    arrays = {}
+    for key, (name, shape, dtype) in descriptors.items():
+        shm = shared_memory.SharedMemory(name=name)
+        shms.append(shm)
+        arrays[key] = np.ndarray(shape, dtype, buffer=shm.buf)
+    return shms, arrays
+
+
+# 求packet_i的最优延迟
+# 输入：
+#   packets：所有包
+#   iPacket：第i个包编号
+#   PI：第t轮实际选路前驱节点矩阵
+#   bandwidths：各边带宽
+#   tmpLatencies：包i偏离时的各边延迟，None时重新统计
+#   buffers：OptLatencyBuffers，None时新分配
+# 返回：
+#   packet_i的最优延迟
+def getPacketOptLatency(packets, iPacket, PI, bandwidths, packetActualLatency, tmpLatencies=None, buffers=None):
+    packet_i = packets[iPacket]
+    if tmpLatencies is None:
+        tmpLatencies = getLeaveOneOutLatencies(packets, iPacket, PI, bandwidths)
+    shortestPaths = None
+    linkLatencies = None
+    if buffers is not None:
+        shortestPaths = buffers.shortestPaths
+        linkLatencies = buffers.linkLatencies
+
+    # 由tmpLatencies，求packet_i的最优延迟
+    tmpD, tmpPI = getShortestPaths(tmpLatencies, shortestPaths)
+    tmpLinkLatencies = getLatencies(packets, tmpPI, bandwidths, linkLatencies)
+    tmpPacketLatency = getPacketLatency(packet_i, tmpPI, tmpLinkLatencies)
+    return min(tmpPacketLatency, packetActualLatency)
+
+
+# 从头统计包i偏离时的各边延迟
+# 输入：
+#   packets：所有包
+#   iPacket：第i个包编号
+#   PI：第t轮实际选路前驱节点矩阵
+#   bandwidths：各边带宽
+# 返回：
+#   tmpLatencies：各边流量为flows_minusI+1时的延迟
+def getLeaveOneOutLatencies(packets, iPacket, PI, bandwidths):
+    # 求tmpFlows：packets[iPacket]作最优选路时，各边的流量
+    # 相当于实际选路的flows_minusI，然后各边再+1流量，表i选该边增加的流量
+
+    nNodes = PI.shape[0]
+    # 先将各边+1流量加上
+    tmpFlows = np.full((nNodes, nNodes), 1, int)
+    # 再加上实际选路的flows_minusI
+    if useJit():
+        packetsArray = np.asarray(packets, int).reshape(-1, 2)
+        jit.walkFlows(PI, packetsArray[:, 0], packetsArray[:, 1], iPacket, tmpFlows)
+    else:
+        for i in range(len(packets)):
+            packet = packets[i]
+            if(i==iPacket):
+                continue
+            src = packet[0]
+            mid = packet[1]
+            pre = PI[src,mid]
+            # mesh保证所有节点对一定连通
+            while(pre!=src):
+                tmpFlows[pre, mid] += 1
+                mid = pre
+                pre = PI[src, mid]
+            tmpFlows[pre,mid] += 1
+
+    # 由tmpFlows，求各边tmpLatencies
+    tmpLatencies = np.full((nNodes,nNodes), MAX_LANRTENCY, int)
+    for i in range(nNodes):
+        for j in range(nNodes):
+            if bandwidths[i,j]!=0:
+                # i,j有边
+                tmpLatencies[i,j] = math.ceil(tmpFlows[i,j]/bandwidths[i,j])
+    return tmpLatencies
+
+
+# 求packet_i单方面偏离时的最优延迟：其余包选路不变，packet_i在flows_minusI+1的各边延迟上
+# 从src做单源最短路，到dst即停止
+# 输入：
+#   packets：所有包
+#   iPacket：第i个包编号
+#   PI：第t轮实际选路前驱节点矩阵
+#   bandwidths：各边带宽
+#   packetActualLatency：packet_i的实际延迟
+#   neighbors：各节点邻居列表，None时由bandwidths求
+#   tmpLatencies：包i偏离时的各边延迟，None时重新统计
+# 返回：
+#   packet_i的最优延迟
+def getPacketBestResponseLatency(packets, iPacket, PI, bandwidths, packetActualLatency, neighbors=None,
+                                 tmpLatencies=None):
+    if neighbors is None:
+        neighbors = getNeighbors(bandwidths)
+    if tmpLatencies is None:
+        tmpLatencies = getLeaveOneOutLatencies(packets, iPacket, PI, bandwidths)
+
+    src, dst = packets[iPacket]
+    return min(getSrcDstLatency(tmpLatencies, neighbors, src, dst), packetActualLatency)
+
+
+# 由带宽矩阵求各节点邻居
+# 输入：
+#   bandwidths：各边带宽
+# 返回：
+#   neighbors：neighbors[u]为u的出边终点列表
+def getNeighbors(bandwidths):
+    return [np.flatnonzero(bandwidths[u]).tolist() for u in range(bandwidths.shape[0])]
+
+
+# 堆优化Dijkstra求src到dst的最短距离
+# 输入：
+#   latencies：各边延迟
+#   neighbors：各节点邻居列表
+#   src, dst：起点、终点
+# 返回：
+#   src到dst的最短距离，不连通时为inf；距离可超过MAX_LANRTENCY（重载时各边延迟之和）
+def getSrcDstLatency(latencies, neighbors, src, dst):
+    dist = {src: 0}
+    heap = [(0, src)]
+    done = set()
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u == dst:
+            return d
+        if u in done:
+            continue
+        done.add(u)
+        row = latencies[u]
+        for v in neighbors[u]:
+            nd = d + int(row[v])
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return math.inf
+
+
+
+#=============================== 改进选路依据--各边延迟 ======================
+
+# t-1轮的高延迟，导致t轮各包倾向避开高延迟的边，继而导致不均衡，减小高延迟以改进
+# 输入：
+#   actualLinkLatencies：t-1轮各边延迟，二维矩阵或graph.Graph各边的一维数组
+# 输出：
+#   latencies：改进后的延迟
+def getModifiedLatencies(orginalLinkLatencies):
+    latencies = orginalLinkLatencies.copy()
+
+    # 求小于MAX_LATENCY的延迟的均值
+    selected = latencies < MAX_LANRTENCY
+    selectedLatenciesMean = np.mean(latencies[selected])
+
+    # 将小于MAX_LATENCY，且大于均值的延迟，降到均值
+    latencies[selected & (latencies >= selectedLatenciesMean)] = selectedLatenciesMean
+
+    return latencies
@@ -0,0 +1,110 @@
+import numpy as np
+
+import src.stopping as stopping
+
+# ============== 公共随机数 =============
+# 拓扑、带宽、流量各用一个np.random.Generator流，由同一种子的SeedSequence按固定顺序派生，互相独立，
+# 也不受全局随机状态的影响：
+#   改进前、后两组本就共用每轮的包；各流独立后，exp2的各nPackets点可用同一种子，共用同一网络的带宽，
+#   点间的差别不再混入带宽的抽样误差
+# 对偶抽样：每轮后一半包由前一半的均匀数u取1-u得到，节点编号i对应N-1-i，在网格上为中心对称的包，
+#   一轮内的流量更均衡，各轮指标的方差更小
+# 方差缩减：改进前后差值的置信区间，按配对（同一轮相减）与按两组独立估计的半宽对比，
+#   两者平方之比即配对时达到同一置信度所需轮数的缩减倍数
+
+# 各流的派生顺序
+COMPONENTS = ["topology", "bandwidths", "traffic"]
+# 对比改进前、后的指标
+RES_NAMES = ["ineqPerCentages", "allPacketsAvgActualLatencies", "allPacketsAvgOptLatencies"]
+
+
+# 各部分的随机流
+#   entropy：种子，同一entropy得到相同的各流
+#   topology, bandwidths, traffic：np.random.Generator
+#   antithetic：每轮的包是否对偶抽样
+class Streams:
+    __slots__ = ("entropy", "topology", "bandwidths", "traffic", "antithetic")
+
+    def __init__(self, entropy, topology, bandwidths, traffic, antithetic):
+        self.entropy = entropy
+        self.topology = topology
+        self.bandwidths = bandwidths
+        self.traffic = traffic
+        self.antithetic = antithetic
+
+
+# 由种子派生各部分的随机流
+# 输入：
+#   seed：整数种子，None时随机取，取到的种子为返回值的entropy
+#   antithetic：是否对偶抽样
+# 返回：
+#   Streams
+def getStreams(seed=None, antithetic=False):
+    seedSeq = np.random.SeedSequence(seed)
+    rngs = [np.random.default_rng(child) for child in seedSeq.spawn(len(COMPONENTS))]
+    return Streams(seedSeq.entropy, *rngs, antithetic)
+
+
+# 均匀随机的包，src != dst，同core.genPackets的分布
+# src = floor(u0*nNodes)，dst = (src + 1 + floor(u1*(nNodes-1))) % nNodes
+# 输入：
+#   nPackets：包数
+#   nNodes：节点数
+#   rng：np.random.Generator
+#   antithetic：后一半包的(u0, u1)取前一半的(1-u0, 1-u1)，nPackets为奇数时最后一个包不配对
+# 返回：
+#   packets：(nPackets, 2)的数组
+def genPackets(nPackets, nNodes, rng, antithetic=False):
+    if antithetic:
+        uniforms = rng.random(((nPackets + 1) // 2, 2))
+        uniforms = np.concatenate([uniforms, 1 - uniforms])[:nPackets]
+    else:
+        uniforms = rng.random((nPackets, 2))
+    srcs = np.minimum((uniforms[:, 0] * nNodes).astype(int), nNodes - 1)
+    offsets = np.minimum((uniforms[:, 1] * (nNodes - 1)).astype(int), nNodes - 2)
+    return np.stack([srcs, (srcs + 1 + offsets) % nNodes], axis=1)
+
+
+# 改进前后差值的方差缩减统计
+# 输入：
+#   results：{指标名: 各轮值}，含RES_NAMES及其Improved
+# 返回：
+#   stats：{指标名: {"meanGap", "pairedHalfWidth", "independentHalfWidth", "correlation", "turnsFactor"}}
+#     meanGap：改进前减改进后的均值
+#     pairedHalfWidth：各轮差值均值的置信区间半宽（批均值法，同stopping）
+#     independentHalfWidth：把两组当作独立样本时差值的半宽
+#     correlation：两组各轮值的相关系数
+#     turnsFactor：(independentHalfWidth/pairedHalfWidth)^2，配对所需轮数的缩减倍数；轮数不足或无法求时为None
+def getVarianceReduction(results):
+    stats = {}
+    for resName in RES_NAMES:
+        original = np.asarray(results[resName], float)
+        improved = np.asarray(results[resName + "Improved"], float)
+        pairedHalfWidth = stopping.getHalfWidth(original - improved)
+        independentHalfWidth = np.hypot(stopping.getHalfWidth(original), stopping.getHalfWidth(improved))
+        correlation = None
+        if len(original) > 1 and np.std(original) > 0 and np.std(improved) > 0:
+            correlation = float(np.corrcoef(original, improved)[0, 1])
+        turnsFactor = None
+        if np.isfinite(independentHalfWidth) and pairedHalfWidth > 0:
+            turnsFactor = float((independentHalfWidth / pairedHalfWidth) ** 2)
+        stats[resName] = {
+            "meanGap": float(np.mean(original - improved)),
+            "pairedHalfWidth": float(pairedHalfWidth),
+            "independentHalfWidth": float(independentHalfWidth),
+            "correlation": correlation,
+            "turnsFactor": turnsFactor,
+        }
+    return stats
+
+
+# 方差缩减统计的文本
+def getAnalysis(stats):
+    lines = ["variance reduction of the original - improved gap (95% half-widths):"]
+    for resName, stat in stats.items():
+        factor = "n/a" if stat["turnsFactor"] is None else f"{stat['turnsFactor']:.2f}x"
+        correlation = "n/a" if stat["correlation"] is None else f"{stat['correlation']:.3f}"
+        lines.append(f"  {resName}: gap {stat['meanGap']:.4f} ± {stat['pairedHalfWidth']:.4f} paired, "
+                     f"± {stat['independentHalfWidth']:.4f} independent, correlation {correlation}, "
+                     f"fewer turns {factor}")
+    return "\n".join(lines)
@@ -0,0 +1,337 @@
+import numpy as np
+import numpy.random as random
+import os
+
+import src.core as core
+import src.exp1 as exp1
+import src.graph as graph
+import src.store as store
+import src.profiling as profiling
+import src.stopping as stopping
+
+# ============== module vars =============
+
+# 副本数
+N_REPLICAS = 32
+# 批量求最优延迟时，每块各包偏离延迟(包数*边数)的元素数上限
+CHUNK_ELEMS = 2**22
+# 不存在的边的距离，相加不溢出
+INF_LATENCY = np.iinfo(int).max // 4
+
+# 文件
+ENSEMBLE_STORE_DIR = os.path.join(exp1.PATH, "ensemble-store")
+
+
+# ======================= ensemble =====================
+
+# R个独立副本（各自的带宽、包流）同步推进，各边的量为(R, N, N)的数组，最短路径、流量、延迟对副本维向量化
+# 第r个副本与random.seed(seeds[r])后、求最优延迟方法同为optLatencyMethod的exp1结果相同
+# 输入：
+#   nReplicas：副本数
+#   nTurns：每个副本的轮数
+#   nPackets：每轮包数
+#   meshLen：网格边长，None时为core.MESH_LEN
+#   seed：随机种子，各副本的种子由它派生；None时随机
+#   verbose：是否打印进度
+#   optLatencyMethod：求最优延迟的方法，"apsp"或"bestResponse"，None时为core.OPT_LATENCY_METHOD
+# 返回：
+#   arrays：各副本的结果，各轮指标为(R, nTurns)，各包延迟为(R, nTurns, nPackets)，及各副本种子seeds
+def ensemble(nReplicas=N_REPLICAS, nTurns=exp1.N_TURNS, nPackets=core.N_PACKETS, meshLen=None, seed=None,
+             verbose=True, optLatencyMethod=None):
+    if meshLen is None:
+        meshLen = core.MESH_LEN
+    if optLatencyMethod is None:
+        optLatencyMethod = core.OPT_LATENCY_METHOD
+    if optLatencyMethod not in OPT_LATENCY_FUNCS:
+        raise ValueError(f"unknown opt latency method: {optLatencyMethod}")
+    seeds = getReplicaSeeds(nReplicas, seed)
+    state = newEnsembleState(seeds, nTurns, nPackets, meshLen, optLatencyMethod)
+    runTurns(state, verbose)
+
+    arrays = getStoreArrays(state)
+    store.save(ENSEMBLE_STORE_DIR, arrays,
+               exp1.getStoreMeta(nTurns, seed, MESH_LEN=meshLen, optLatencyMethod=optLatencyMethod,
+                                 nPackets=nPackets, nReplicas=nReplicas))
+    print(f"\nResults location: {ENSEMBLE_STORE_DIR}")
+    print(getSummary(arrays, optLatencyMethod))
+    if profiling.ENABLED:
+        print(profiling.summary())
+    return arrays
+
+
+# ================== 子函数 =======================
+
+# 由seed派生各副本的整数种子
+def getReplicaSeeds(nReplicas, seed=None):
+    return np.random.SeedSequence(seed).generate_state(nReplicas)
+
+
+# 新建副本组状态：各副本的随机状态、带宽、初始延迟，及各轮指标
+# 输入：
+#   seeds：各副本种子
+#   nTurns, nPackets, meshLen, optLatencyMethod：同ensemble
+# 返回：
+#   state：状态字典
+def newEnsembleState(seeds, nTurns, nPackets, meshLen, optLatencyMethod):
+    nReplicas = len(seeds)
+    edges = core.genMesh(meshLen)
+    rngs = [random.RandomState(int(seed)) for seed in seeds]
+    bandwidths = np.stack([core.getBandwidths(edges, exp1.LOW_BANDWIDTH, exp1.HIGH_BANDWIDTH, rng) for rng in rngs])
+    latencies = np.full(bandwidths.shape, core.MAX_LANRTENCY, int)
+    latencies[bandwidths != 0] = 0
+
+    state = {
+        "seeds": np.asarray(seeds),
+        "rngs": rngs,
+        "nTurns": nTurns,
+        "nPackets": nPackets,
+        "optLatencyMethod": optLatencyMethod,
+        "turn": 0,
+        "bandwidths": bandwidths,
+        "latencies": latencies,
+        "modifiedLatencies": getModifiedLatencies(latencies),
+        "shortestPathsBuffers": core.ShortestPathsBuffers(len(edges), (nReplicas,)),
+    }
+    for resName in exp1.TURN_RES_NAMES:
+        state[resName] = np.zeros((nReplicas, nTurns))
+    for resName in exp1.PACKET_RES_NAMES:
+        state[resName] = np.zeros((nReplicas, nTurns, nPackets), int)
+    return state
+
+
+# 从state["turn"]轮起，各副本同步逐轮选路并统计改进前、后的指标
+def runTurns(state, verbose=True):
+    bandwidths = state["bandwidths"]
+    nNodes = bandwidths.shape[-1]
+    nPackets = state["nPackets"]
+    buffers = state["shortestPathsBuffers"]
+    optLatencyFunc = OPT_LATENCY_FUNCS[state["optLatencyMethod"]]
+
+    for turn in range(state["turn"], state["nTurns"]):
+        if verbose:
+            print(f"{turn}", end=', ')
+        # 各副本各自的包流
+        packets = np.array([core.genPackets(nPackets, nNodes, rng) for rng in state["rngs"]], int)
+        packets = packets.reshape(len(state["rngs"]), nPackets, 2)
+
+        latencies, packetsActualLatencies, packetsOptLatencies = getPacketsLatencies(state["latencies"], packets,
+                                                                                     bandwidths, buffers,
+                                                                                     optLatencyFunc)
+        calStatistics(state, turn, packetsActualLatencies, packetsOptLatencies, exp1.TURN_RES_NAMES[:3],
+                      exp1.PACKET_RES_NAMES[:2])
+
+        _, packetsActualLatenciesImproved, packetsOptLatenciesImproved = getPacketsLatencies(
+            state["modifiedLatencies"], packets, bandwidths, buffers, optLatencyFunc)
+        calStatistics(state, turn, packetsActualLatenciesImproved, packetsOptLatenciesImproved,
+                      exp1.TURN_RES_NAMES[3:], exp1.PACKET_RES_NAMES[2:])
+
+        state["latencies"] = latencies
+        state["modifiedLatencies"] = getModifiedLatencies(latencies)
+        state["turn"] = turn + 1
+        profiling.endRound(turn=turn, nPackets=nPackets, nReplicas=len(state["rngs"]))
+
+
+# 求本轮各副本各包实际、最优延迟
+# 输入：
+#   lastLinkLatencies：上一轮各边延迟，(R, N, N)
+#   packets：(R, P, 2)
+#   bandwidths：(R, N, N)
+#   buffers：(R,)批维度的core.ShortestPathsBuffers，None时新分配
+#   optLatencyFunc：求最优延迟的函数，OPT_LATENCY_FUNCS中的一个，None时为getPacketsOptLatencies
+# 输出：
+#   curLinklatencies：本轮各边延迟，(R, N, N)
+#   packetsActualLatencies, packetsOptLatencies：本轮各包实际、最优延迟，(R, P)
+def getPacketsLatencies(lastLinkLatencies, packets, bandwidths, buffers=None, optLatencyFunc=None):
+    if optLatencyFunc is None:
+        optLatencyFunc = getPacketsOptLatencies
+    shape = packets.shape[:2]
+    with profiling.stage("getShortestPaths"):
+        D, PI = core.getShortestPaths(lastLinkLatencies, buffers)
+    with profiling.stage("getLatencies"):
+        incidence = core.getIncidence(packets, PI)
+        flows = core.getIncidenceFlows(incidence).reshape(bandwidths.shape)
+        curLinklatencies = core.getLinkLatencies(flows, bandwidths)
+
+    with profiling.stage("getPacketsActualLatencies"):
+        packetsActualLatencies = core.getIncidenceLatencies(incidence, curLinklatencies).reshape(shape)
+    with profiling.stage("getPacketsOptLatencies"):
+        packetsOptLatencies = optLatencyFunc(packets, incidence, flows, bandwidths, packetsActualLatencies)
+    return curLinklatencies, packetsActualLatencies, packetsOptLatencies
+
+
+# 各副本各包单方面偏离时的最优延迟：同core的"bestResponse"，
+# 各包偏离时的各边延迟叠成(包数, E)，分块后对整块同时做Bellman-Ford
+# 输入：
+#   packets：(R, P, 2)
+#   incidence：本轮选路的包-边关联矩阵
+#   flows：本轮各边流量，(R, N, N)
+#   bandwidths：(R, N, N)
+#   packetsActualLatencies：(R, P)
+#   chunkElems：每块元素数上限
+# 返回：
+#   packetsOptLatencies：(R, P)
+def getPacketsOptLatencies(packets, incidence, flows, bandwidths, packetsActualLatencies, chunkElems=CHUNK_ELEMS):
+    profiling.count("packetsEvaluated", packets.shape[0] * packets.shape[1])
+    nPackets = packets.shape[1]
+    n = bandwidths.shape[-1]
+    packets = packets.reshape(-1, 2)
+
+    # 任一副本有带宽的边
+    csrGraph = graph.fromEdgeArrays(n, *np.nonzero(np.any(bandwidths != 0, axis=0)))
+    edgeSrcs, edgeDsts = csrGraph.edgeSrc, csrGraph.indices
+    edgeIds = np.full(n * n, -1)
+    edgeIds[edgeSrcs * n + edgeDsts] = np.arange(csrGraph.nEdges)
+
+    # 包偏离时，其路径外的边流量为flows+1，路径上的边为flows
+    edgeBandwidths = bandwidths[:, edgeSrcs, edgeDsts]
+    hasEdge = edgeBandwidths != 0
+    baseLatencies = np.full(edgeBandwidths.shape, INF_LATENCY, int)
+    baseLatencies[hasEdge] = -(-(flows[:, edgeSrcs, edgeDsts][hasEdge] + 1) // edgeBandwidths[hasEdge])
+    order = np.argsort(incidence.rows, kind="stable")
+    rows = incidence.rows[order]
+    cols = incidence.cols[order]
+    pathLatencies = -(-flows.ravel()[cols] // bandwidths.ravel()[cols])
+    # 副本内的边编号
+    cols = edgeIds[cols % (n * n)]
+
+    inEdges = graph.getInEdges(csrGraph)
+    chunk = max(1, chunkElems // max(1, csrGraph.nEdges))
+    dists = np.empty(len(packets), int)
+    for start in range(0, len(packets), chunk):
+        stop = min(start + chunk, len(packets))
+        tmpLatencies = baseLatencies[np.arange(start, stop) // nPackets]
+        lo, hi = np.searchsorted(rows, [start, stop])
+        tmpLatencies[rows[lo:hi] - start, cols[lo:hi]] = pathLatencies[lo:hi]
+        dists[start:stop] = getSrcDstLatencies(edgeSrcs, inEdges, tmpLatencies, packets[start:stop, 0],
+                                               packets[start:stop, 1])
+    return np.minimum(dists.reshape(packetsActualLatencies.shape), packetsActualLatencies)
+
+
+# 批量Bellman-Ford：第b个图上srcs[b]到dsts[b]的最短距离，每次迭代对整批的所有边做一次松弛
+# 距离存为(N, B)，批维度在最后，按入边取起点的距离时为整行连续复制
+# 输入：
+#   edgeSrcs：各边起点
+#   inEdges：graph.getInEdges给出的入边表，补的边延迟为INF_LATENCY
+#   latencies：(B, E)，各图各边延迟，无边处为INF_LATENCY
+#   srcs, dsts：(B,)
+# 返回：
+#   dists：(B,)，不连通时为INF_LATENCY；距离可超过MAX_LANRTENCY
+def getSrcDstLatencies(edgeSrcs, inEdges, latencies, srcs, dsts):
+    nBatch, nEdges = latencies.shape
+    nNodes, maxInDegree = inEdges.shape
+    inSrcs = np.append(edgeSrcs, 0)[inEdges]
+    edgeLatencies = np.full((nEdges + 1, nBatch), INF_LATENCY, int)
+    edgeLatencies[:-1] = latencies.T
+    inLatencies = edgeLatencies[inEdges]
+
+    dist = np.full((nNodes, nBatch), INF_LATENCY, int)
+    dist[srcs, np.arange(nBatch)] = 0
+    for _ in range(nNodes - 1):
+        newDist = dist.copy()
+        for k in range(maxInDegree):
+            np.minimum(newDist, dist[inSrcs[:, k]] + inLatencies[:, k], out=newDist)
+        if np.array_equal(newDist, dist):
+            break
+        dist = newDist
+    return dist[dsts, np.arange(nBatch)]
+
+
+# 各副本各包单方面偏离时的最优延迟：同core的"apsp"，
+# 各包偏离时的各边延迟叠成(包数, N, N)，分块后对整块同时做Floyd-Warshall，
+# 再按各块的前驱节点矩阵让所在副本的所有包重新选路，取该包的延迟
+# 输入、返回：同getPacketsOptLatencies
+def getPacketsApspOptLatencies(packets, incidence, flows, bandwidths, packetsActualLatencies, chunkElems=CHUNK_ELEMS):
+    profiling.count("packetsEvaluated", packets.shape[0] * packets.shape[1])
+    nPackets = packets.shape[1]
+    n = bandwidths.shape[-1]
+    nTotal = packets.shape[0] * nPackets
+
+    order = np.argsort(incidence.rows, kind="stable")
+    rows = incidence.rows[order]
+    # 副本内的边编号
+    cols = incidence.cols[order] % (n * n)
+
+    chunk = max(1, chunkElems // (n * n))
+    optLatencies = np.empty(nTotal, int)
+    for start in range(0, nTotal, chunk):
+        stop = min(start + chunk, nTotal)
+        replicas = np.arange(start, stop) // nPackets
+        # 包偏离时，其路径外的边流量为flows+1，路径上的边为flows
+        tmpFlows = flows[replicas] + 1
+        lo, hi = np.searchsorted(rows, [start, stop])
+        tmpFlows.reshape(stop - start, n * n)[rows[lo:hi] - start, cols[lo:hi]] -= 1
+        tmpBandwidths = bandwidths[replicas]
+        _, tmpPI = core.getShortestPaths(core.getLinkLatencies(tmpFlows, tmpBandwidths))
+
+        tmpIncidence = core.getIncidence(packets[replicas], tmpPI)
+        tmpLinkLatencies = core.getLinkLatencies(core.getIncidenceFlows(tmpIncidence).reshape(tmpPI.shape),
+                                                 tmpBandwidths)
+        tmpPacketsLatencies = core.getIncidenceLatencies(tmpIncidence, tmpLinkLatencies).reshape(-1, nPackets)
+        optLatencies[start:stop] = tmpPacketsLatencies[np.arange(stop - start), np.arange(start, stop) % nPackets]
+    return np.minimum(optLatencies.reshape(packetsActualLatencies.shape), packetsActualLatencies)
+
+
+# 求最优延迟的各方法
+OPT_LATENCY_FUNCS = {
+    "apsp": getPacketsApspOptLatencies,
+    "bestResponse": getPacketsOptLatencies,
+}
+
+
+# 各副本分别做core.getModifiedLatencies
+# 输入：
+#   orginalLinkLatencies：(R, N, N)
+# 返回：
+#   latencies：改进后的延迟
+def getModifiedLatencies(orginalLinkLatencies):
+    latencies = orginalLinkLatencies.copy()
+    selected = latencies < core.MAX_LANRTENCY
+    means = np.where(selected, latencies, 0).sum(axis=(-2, -1)) / selected.sum(axis=(-2, -1))
+    means = np.broadcast_to(means[:, None, None], latencies.shape)
+    replaced = selected & (latencies >= means)
+    latencies[replaced] = means[replaced]
+    return latencies
+
+
+# 由各副本各包实际、最优延迟，统计本轮指标，写入state
+# 输入：
+#   state
+#   turn：本轮id
+#   packetsActualLatencies, packetsOptLatencies：(R, P)
+#   resNames：ineq占比、平均实际延迟、平均最优延迟在state中的名字
+#   packetResNames：各包实际、最优延迟在state中的名字
+def calStatistics(state, turn, packetsActualLatencies, packetsOptLatencies, resNames, packetResNames):
+    if np.any(packetsActualLatencies < packetsOptLatencies):
+        print("\nError: actual latency < opt latency")
+        exit()
+    nPackets = packetsActualLatencies.shape[1]
+    ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies = [state[resName] for resName in resNames]
+    ineqPerCentages[:, turn] = np.count_nonzero(packetsActualLatencies > packetsOptLatencies, axis=1) / nPackets
+    allPacketsAvgActualLatencies[:, turn] = np.mean(packetsActualLatencies, axis=1)
+    allPacketsAvgOptLatencies[:, turn] = np.mean(packetsOptLatencies, axis=1)
+    state[packetResNames[0]][:, turn] = packetsActualLatencies
+    state[packetResNames[1]][:, turn] = packetsOptLatencies
+
+
+# 由状态取出要存入二进制结果的数组
+def getStoreArrays(state):
+    arrays = {resName: state[resName] for resName in exp1.TURN_RES_NAMES + exp1.PACKET_RES_NAMES}
+    arrays["seeds"] = state["seeds"]
+    return arrays
+
+
+# 各指标各副本的全程均值，在副本间的均值及95%置信区间半宽，副本数为R时用自由度R-1的t分位数
+# 输入：
+#   arrays：ensemble的返回
+#   optLatencyMethod：求最优延迟的方法，写在表头
+# 返回：
+#   汇总表
+def getSummary(arrays, optLatencyMethod):
+    lines = [f"optLatencyMethod: {optLatencyMethod}", f"{'metric':<40}{'mean':>12}{'95% CI':>12}"]
+    for resName in exp1.TURN_RES_NAMES:
+        replicaMeans = np.mean(arrays[resName], axis=1)
+        halfWidth = 0.0
+        if len(replicaMeans) > 1:
+            halfWidth = stopping.getTQuantile(len(replicaMeans) - 1) * np.std(replicaMeans, ddof=1) / np.sqrt(len(replicaMeans))
+        lines.append(f"{resName:<40}{np.mean(replicaMeans):>12.4f}{halfWidth:>12.4f}")
+    return "\n".join(lines)
@@ -0,0 +1,181 @@
+import warnings
+
+import numpy as np
+
+import src.core as core
+import src.profiling as profiling
+import src.traffic as traffic
+
+# ============== 均衡、系统最优选路 =============
+# 各边延迟ceil(flow/bandwidth)松弛为连续的仿射函数FREE_FLOW_LATENCY+flow/bandwidth，
+# 各(src, dst)对的包可按任意比例分到多条路径上，用Frank-Wolfe直接求：
+#   均衡（Wardrop）：各对用到的路径延迟相同且最小，没有包能单方面改路降低延迟，为Beckmann势函数的极小点
+#   系统最优：所有包的总延迟Σflow*t(flow)最小
+# 每次迭代按当前各边的梯度（均衡为延迟t，系统最优为边际延迟t+flow*t'）求一次全源最短路，需求全部放到最短路上；
+# 目标为二次函数、Hessian为对角阵order/bandwidth，用共轭Frank-Wolfe：方向与上一方向关于Hessian共轭，
+# 再沿方向精确线搜索，比原始Frank-Wolfe的迭代次数少得多
+# 间隙：当前流量按梯度的总代价超过全部走最短路的比例，为0时即均衡（系统最优）
+# 价格无政府 = 均衡总延迟 / 系统最优总延迟，仿射延迟时不超过4/3；精确解时不小于1，
+# 近似解的比值小于1但在两者间隙之和以内时取1，超出时保留原值并警告
+
+# ceil(flow/bandwidth)-flow/bandwidth在[0, 1)内，取中值
+FREE_FLOW_LATENCY = 0.5
+# 相对间隙不超过GAP_TOL，或迭代MAX_ITERATIONS次后停止
+GAP_TOL = 1e-4
+MAX_ITERATIONS = 500
+# 共轭组合中上一目标点的权重上限，保证方向仍是下降方向
+MAX_CONJUGATE_WEIGHT = 0.99
+
+
+# 求解结果
+#   flows：各边流量的二维矩阵，可为小数
+#   latencies：各边延迟t(flows)，无边处为MAX_LANRTENCY
+#   totalLatency：所有包的总延迟Σflow*t(flow)
+#   avgLatency：每个包的平均延迟
+#   gap：最后的相对间隙
+#   nIterations：迭代次数
+#   converged：gap是否不超过gapTol，否则为迭代maxIterations次后停止
+class Equilibrium:
+    __slots__ = ("flows", "latencies", "totalLatency", "avgLatency", "gap", "nIterations", "converged")
+
+    def __init__(self, flows, latencies, totalLatency, avgLatency, gap, nIterations, converged):
+        self.flows = flows
+        self.latencies = latencies
+        self.totalLatency = totalLatency
+        self.avgLatency = avgLatency
+        self.gap = gap
+        self.nIterations = nIterations
+        self.converged = converged
+
+
+# 每轮nPackets个均匀随机包的期望需求，同core.genPackets的分布
+def getExpectedDemand(nNodes, nPackets):
+    return traffic.getUniformProbs(nNodes) * nPackets
+
+
+# Frank-Wolfe求均衡或系统最优
+# 输入：
+#   bandwidths：各边带宽的二维矩阵
+#   demand：各(src, dst)对包数的二维矩阵（可为小数），或traffic.Demand
+#   systemOptimal：False求均衡，True求系统最优
+#   gapTol, maxIterations：None时为GAP_TOL、MAX_ITERATIONS
+# 返回：
+#   Equilibrium；未收敛时警告
+def solve(bandwidths, demand, systemOptimal=False, gapTol=None, maxIterations=None):
+    if gapTol is None:
+        gapTol = GAP_TOL
+    if maxIterations is None:
+        maxIterations = MAX_ITERATIONS
+    if isinstance(demand, traffic.Demand):
+        demand = traffic.toMatrix(demand)
+    demand = np.asarray(demand, float)
+    n = bandwidths.shape[0]
+    hasEdge = bandwidths != 0
+    invBandwidths = np.zeros((n, n))
+    invBandwidths[hasEdge] = 1 / bandwidths[hasEdge]
+    # 梯度中flow/bandwidth项的系数：均衡为1，系统最优为2
+    order = 2 if systemOptimal else 1
+    srcs, dsts = np.nonzero(demand)
+    pairs = np.stack([srcs, dsts], axis=1)
+    pairDemands = demand[srcs, dsts]
+    buffers = core.ShortestPathsBuffers(n, dtype=float)
+
+    flows, _ = getAllOrNothingFlows(np.full((n, n), FREE_FLOW_LATENCY), hasEdge, pairs, pairDemands, buffers)
+    # Hessian对角元
+    hessian = order * invBandwidths
+    # 共轭的目标点，None时本次为原始Frank-Wolfe方向
+    conjugateFlows = None
+    gap = np.inf
+    nIterations = 0
+    while nIterations < maxIterations:
+        gradient = FREE_FLOW_LATENCY + order * flows * invBandwidths
+        targetFlows, shortestCost = getAllOrNothingFlows(gradient, hasEdge, pairs, pairDemands, buffers)
+        currentCost = np.sum(flows * gradient)
+        gap = (currentCost - shortestCost) / currentCost if currentCost > 0 else 0.0
+        if gap <= gapTol:
+            break
+        # 目标点取上一目标点与本次最短路流量的组合，使方向与上一方向关于Hessian共轭
+        if conjugateFlows is not None:
+            lastDirection = conjugateFlows - flows
+            numerator = np.sum(lastDirection * hessian * (targetFlows - flows))
+            denominator = np.sum(lastDirection * hessian * (targetFlows - conjugateFlows))
+            weight = np.clip(numerator / denominator, 0, MAX_CONJUGATE_WEIGHT) if denominator != 0 else 0.0
+            targetFlows = weight * conjugateFlows + (1 - weight) * targetFlows
+        # 精确线搜索：Σdirection*(gradient+alpha*hessian*direction) = 0
+        direction = targetFlows - flows
+        curvature = np.sum(direction ** 2 * hessian)
+        alpha = 1.0 if curvature == 0 else np.clip(-np.sum(direction * gradient) / curvature, 0, 1)
+        flows += alpha * direction
+        conjugateFlows = targetFlows
+        nIterations += 1
+    profiling.count("equilibriumIterations", nIterations)
+    converged = gap <= gapTol
+    if not converged:
+        warnings.warn(f"{'system optimum' if systemOptimal else 'equilibrium'} not converged: gap {gap:.3g} > "
+                      f"{gapTol:.3g} after {nIterations} iterations", RuntimeWarning)
+
+    latencies = np.full((n, n), core.MAX_LANRTENCY)
+    latencies[hasEdge] = FREE_FLOW_LATENCY + flows[hasEdge] * invBandwidths[hasEdge]
+    totalLatency = np.sum(flows[hasEdge] * latencies[hasEdge])
+    avgLatency = totalLatency / pairDemands.sum() if len(pairDemands) > 0 else 0.0
+    return Equilibrium(flows, latencies, totalLatency, avgLatency, gap, nIterations, converged)
+
+
+# 各对需求全部走按gradient的最短路
+# 路径至多n-1条边，各边代价缩放到小于MAX_LANRTENCY/n，路径距离不会被getShortestPaths当作无边；缩放不改变最短路
+# 输入：
+#   gradient：各边代价
+#   hasEdge：各边是否存在
+#   pairs, pairDemands：有需求的(src, dst)对及其包数
+#   buffers：dtype为float的ShortestPathsBuffers
+# 返回：
+#   flows：各边流量
+#   shortestCost：Σ各对需求*最短路距离
+def getAllOrNothingFlows(gradient, hasEdge, pairs, pairDemands, buffers):
+    n = gradient.shape[0]
+    scale = core.MAX_LANRTENCY / (2 * n * gradient[hasEdge].max())
+    costs = np.full((n, n), core.MAX_LANRTENCY)
+    costs[hasEdge] = gradient[hasEdge] * scale
+    D, PI = core.getShortestPaths(costs, buffers)
+    incidence = core.getIncidence(pairs, PI)
+    flows = np.bincount(incidence.cols, weights=pairDemands[incidence.rows], minlength=n * n).reshape(n, n)
+    return flows, np.dot(pairDemands, D[pairs[:, 0], pairs[:, 1]]) / scale
+
+
+# 同一网络、需求的均衡与系统最优
+# 输入：
+#   bandwidths, demand, gapTol, maxIterations：同solve
+# 返回：
+#   metrics：{"equilibriumAvgLatency", "systemOptimalAvgLatency", "priceOfAnarchy", "equilibriumGap",
+#             "systemOptimalGap", "equilibriumConverged", "systemOptimalConverged",
+#             "equilibriumIterations", "systemOptimalIterations"}
+def getMetrics(bandwidths, demand, gapTol=None, maxIterations=None):
+    ue = solve(bandwidths, demand, False, gapTol, maxIterations)
+    so = solve(bandwidths, demand, True, gapTol, maxIterations)
+    return {
+        "equilibriumAvgLatency": float(ue.avgLatency),
+        "systemOptimalAvgLatency": float(so.avgLatency),
+        "priceOfAnarchy": getPriceOfAnarchy(ue, so),
+        "equilibriumGap": float(ue.gap),
+        "systemOptimalGap": float(so.gap),
+        "equilibriumConverged": bool(ue.converged),
+        "systemOptimalConverged": bool(so.converged),
+        "equilibriumIterations": ue.nIterations,
+        "systemOptimalIterations": so.nIterations,
+    }
+
+
+# 价格无政府：比值小于1但在两者相对间隙之和以内时为近似误差，取1；超出时保留原值并警告
+# 输入：
+#   ue, so：均衡、系统最优的Equilibrium
+def getPriceOfAnarchy(ue, so):
+    if so.totalLatency <= 0:
+        return 1.0
+    priceOfAnarchy = float(ue.totalLatency / so.totalLatency)
+    if priceOfAnarchy >= 1:
+        return priceOfAnarchy
+    if 1 - priceOfAnarchy <= ue.gap + so.gap:
+        return 1.0
+    warnings.warn(f"price of anarchy {priceOfAnarchy:.6g} < 1 beyond the solver gaps "
+                  f"(equilibrium {ue.gap:.3g}, system optimum {so.gap:.3g})", RuntimeWarning)
+    return priceOfAnarchy
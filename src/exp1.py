@@ -1,289 +1,648 @@
-import numpy as np
-import matplotlib.pyplot as plt
-import os
-
-import src.core as core
-
-# ============== module vars =============
-
-# 实验
-N_TURNS = 100
-
-# 画图
-PERCENTAGE_COLOR = "crimson"
-PERCENTAGE_IMPROVED_COLOR = "royalblue"
-
-ACTUAL_COST_COLOR = "red"
-ACTUAL_COST_IMPROVED_COLOR = "orangered"
-OPT_COST_COLOR = "limegreen"
-OPT_COST_IMPROVED_COLOR = "dodgerblue"
-
-NONFEATURE_ORIGIN_LINESTYLE = "solid"
-NONFEATURE_IMPROVED_LINESTYLE = "dashed"
-FEATURE_LINESTYLE = "dotted"
-
-NONFEATURE_ALPHA = 0.7
-FEATURE_ALPHA = 1
-
-# 文件
-PATH = os.path.join(os.path.dirname(__file__), "..", "res")
-FILE_EXT = ".txt"
-EXP1_RES1_FNAME = os.path.join(PATH, "exp1-originalRes" + FILE_EXT)
-EXP1_RES2_FNAME = os.path.join(PATH, "exp1-improvedRes" + FILE_EXT)
-EXP1_ANALYSIS_FNAME = os.path.join(PATH, "exp1-resAnalysis" + FILE_EXT)
-
-RES_NAMES = ["ineqPerCentages", "allPacketsAvgActualLatencies", "allPacketsAvgOptLatencies"]
-
-FIG_PATH = os.path.join(os.path.dirname(__file__), "..", "fig")
-EXP1_FIG1_FNAME = os.path.join(FIG_PATH, "exp1-percentage")
-EXP1_FIG2_FNAME = os.path.join(FIG_PATH, "exp1-cost")
-
-
-# ======================= exp1 =====================
-
-# 对比original、improved的percentage、actual cost、opt cost
-# 输入：
-#   nTurns：实验nTurns轮
-def exp1(nTurns=N_TURNS):
-    # 初始图
-    edges = core.genMesh()
-    bandwidths = core.getBandwidths(edges, 2, 4)
-
-    # 初始latencies
-    latencies = np.full((core.N_NODES, core.N_NODES), core.MAX_LANRTENCY, int)
-    for node in range(core.N_NODES):
-        for neighbor in edges[node]:
-            latencies[node, neighbor] = 0
-    # 初始改进后的延迟
-    modifiedLatencies = core.getModifiedLatencies(latencies)
-
-    # 各轮数据
-    ineqPerCentages = [0] * nTurns
-    allPacketsAvgActualLatencies = [0] * nTurns
-    allPacketsAvgOptLatencies = [0] * nTurns
-    # 改进延迟后的数据
-    ineqPerCentagesImproved = [0] * nTurns
-    allPacketsAvgActualLatenciesImproved = [0] * nTurns
-    allPacketsAvgOptLatenciesImproved = [0] * nTurns
-
-    # 各轮选路，及数据统计
-    print("round ", end='')
-    for turn in range(nTurns):
-        print(f"{turn}", end=', ')
-        packets = core.genPackets(core.N_PACKETS)
-
-        # 本轮改进前的选路
-        # 求本轮各边延迟、各包实际/最优延迟
-        latencies, packetsActualLatencies, packetsOptLatencies = getPacketsLatencies(latencies, packets, bandwidths)
-        calStatistics(turn, packetsActualLatencies, packetsOptLatencies,
-                      ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies)
-
-        # 改进后
-        modifiedLatencies, packetsActualLatenciesImproved, packetsOptLatenciesImproved = getPacketsLatencies(
-            modifiedLatencies, packets, bandwidths)
-        calStatistics(turn, packetsActualLatenciesImproved, packetsOptLatenciesImproved,
-                      ineqPerCentagesImproved, allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved)
-        # 本轮改进后延迟
-        modifiedLatencies = core.getModifiedLatencies(latencies)
-
-    print()
-
-    # 将结果存到文件
-    save(ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies, RES_NAMES, EXP1_RES1_FNAME)
-    save(ineqPerCentagesImproved, allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved,
-         RES_NAMES, EXP1_RES2_FNAME)
-
-
-# 分析结果，并作图
-def analyzeExp1Res(nTurns=N_TURNS):
-    ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies = read(EXP1_RES1_FNAME, RES_NAMES)
-    ineqPerCentagesImproved, allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved = read(
-        EXP1_RES2_FNAME, RES_NAMES)
-
-    analysis = ""
-    resSeparator = "------------------------------------------------------------------\n"
-
-    # 先分析改进前后的ineqPerCentages
-    ineqPerCentagesMean = np.mean(ineqPerCentages)
-    ineqPerCentagesImprovedMean = np.mean(ineqPerCentagesImproved)
-
-    analysis += resSeparator \
-                + f"ineqPerCentages mean of all turns:  {ineqPerCentagesMean}\n" \
-                + f"ineqPerCentages mean of all turns:  {ineqPerCentagesImprovedMean}\n" \
-                + resSeparator \
-                + '\n'
-
-    turns = list(range(1, nTurns + 1))
-
-    plt.figure(figsize=(6.4,5.5), dpi=300)
-    ax = plt.subplot(111)
-    ax.set_title("Proportion of packets with non-minimized costs in each round")
-    ax.set_xlabel("Round")
-    ax.set_ylabel("Proportion")
-    # 改进前
-    ax.plot(turns, ineqPerCentages, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=PERCENTAGE_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Original")
-    ax.axhline(y=ineqPerCentagesMean, linestyle=FEATURE_LINESTYLE, color=PERCENTAGE_COLOR, alpha=FEATURE_ALPHA,
-                label="Original mean")
-    # 改进后
-    ax.plot(turns, ineqPerCentagesImproved, linestyle=NONFEATURE_IMPROVED_LINESTYLE, color=PERCENTAGE_IMPROVED_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Improved")
-    ax.axhline(y=ineqPerCentagesImprovedMean, linestyle=FEATURE_LINESTYLE, color=PERCENTAGE_IMPROVED_COLOR,
-                alpha=FEATURE_ALPHA, label="Improved mean")
-
-    # legend设在坐标图下
-    ax.legend(ncol=2, bbox_to_anchor=(0.78, -0.1))
-    plt.tight_layout()
-    plt.savefig(EXP1_FIG1_FNAME)
-
-    # 分析cost
-    allPacketsAvgActualLatenciesMean, allPacketsAvgOptLatenciesMean = np.mean(allPacketsAvgActualLatencies), np.mean(
-        allPacketsAvgOptLatencies)
-    allPacketsAvgActualLatenciesImprovedMean, allPacketsAvgOptLatenciesImprovedMean = np.mean(
-        allPacketsAvgActualLatenciesImproved), np.mean(allPacketsAvgOptLatenciesImproved)
-
-    analysis += resSeparator \
-                + f"allPacketsAvgActualLatencies mean of all turns:  {allPacketsAvgActualLatenciesMean}\n" \
-                + f"allPacketsAvgOptLatencies mean of all turns:  {allPacketsAvgOptLatenciesMean}\n" \
-                + resSeparator \
-                + f"allPacketsAvgActualLatenciesImproved mean of all turns:  {allPacketsAvgActualLatenciesImprovedMean}\n" \
-                + f"allPacketsAvgOptLatenciesImproved mean of all turns:  {allPacketsAvgOptLatenciesImprovedMean}\n" \
-                + resSeparator \
-                + '\n'
-
-    plt.figure(figsize=(6.4,5.8), dpi=300)
-    ax = plt.subplot(111)
-    ax.set_title("Average cost per packet in each round")
-    ax.set_xlabel("Round")
-    ax.set_ylabel("Cost")
-
-    # actual cost
-    # 改进前
-    ax.plot(turns, allPacketsAvgActualLatencies, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=ACTUAL_COST_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Original actual")
-    ax.axhline(y=allPacketsAvgActualLatenciesMean, linestyle=FEATURE_LINESTYLE, color=ACTUAL_COST_COLOR,
-                alpha=FEATURE_ALPHA, label="Original actual mean")
-    # 改进后
-    ax.plot(turns, allPacketsAvgActualLatenciesImproved, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
-             color=ACTUAL_COST_IMPROVED_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Improved actual")
-    ax.axhline(y=allPacketsAvgActualLatenciesImprovedMean, linestyle=FEATURE_LINESTYLE,
-                color=ACTUAL_COST_IMPROVED_COLOR,
-                alpha=FEATURE_ALPHA, label="Improved actual mean")
-
-    # opt cost
-    # 改进前
-    ax.plot(turns, allPacketsAvgOptLatencies, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=OPT_COST_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Original optimal")
-    ax.axhline(y=allPacketsAvgOptLatenciesMean, linestyle=FEATURE_LINESTYLE, color=OPT_COST_COLOR, alpha=FEATURE_ALPHA,
-                label="Original optimal mean")
-    # 改进后
-    ax.plot(turns, allPacketsAvgOptLatenciesImproved, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
-             color=OPT_COST_IMPROVED_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Improved optimal")
-    ax.axhline(y=allPacketsAvgOptLatenciesImprovedMean, linestyle=FEATURE_LINESTYLE, color=OPT_COST_IMPROVED_COLOR,
-                alpha=FEATURE_ALPHA, label="Improved optimal mean")
-
-    ax.legend(ncol=2, bbox_to_anchor=(0.88, -0.1))
-    plt.tight_layout()
-    plt.savefig(EXP1_FIG2_FNAME)
-
-    # 打印分析，并保存到文件
-    print(analysis)
-    with open(EXP1_ANALYSIS_FNAME, 'w') as file:
-        file.write(analysis)
-    print(f"Figures location: {FIG_PATH}")
-    print(f"Analysis location: {EXP1_ANALYSIS_FNAME}")
-
-
-# ================== 子函数 =======================
-
-# 求本轮各包实际、最优延迟
-# 输入：
-#   lastLinkLatencies：上一轮各边延迟
-#   packets
-#   bandwidths
-# 输出：
-#   curLinklatencies：本轮各边延迟
-#   packetsActualLatencies, packetsOptLatencies：本轮各包实际、最优延迟
-def getPacketsLatencies(lastLinkLatencies, packets, bandwidths):
-    # 这一轮的实际选路
-    D, PI = core.getShortestPaths(lastLinkLatencies)
-    # 这一轮选路造成的延迟
-    curLinklatencies = core.getLatencies(packets, PI, bandwidths)
-
-    # 这一轮各包实际、最优延迟
-    packetsActualLatencies = core.getPacketsActualLatencies(packets, PI, curLinklatencies)
-    packetsOptLatencies = core.getPacketsOptLatencies(packets, PI, bandwidths, packetsActualLatencies)
-
-    return curLinklatencies, packetsActualLatencies, packetsOptLatencies
-
-
-# 由各包实际、最优延迟，统计本轮指标
-# 输入：
-#   turn：本轮id
-#   packetsActualLatencies, packetsOptLatencies：本轮各包实际、最优延迟
-#   ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies：要统计的指标
-def calStatistics(turn, packetsActualLatencies, packetsOptLatencies, ineqPerCentages, allPacketsAvgActualLatencies,
-                  allPacketsAvgOptLatencies):
-    # ineq占比
-    cnt = 0
-    nPackets = len(packetsActualLatencies)
-    for i in range(nPackets):
-        if packetsActualLatencies[i] > packetsOptLatencies[i]:
-            cnt += 1
-        elif packetsActualLatencies[i] < packetsOptLatencies[i]:
-            print("\nError: actual latency < opt latency")
-            exit()
-    ineqPerCentages[turn] = cnt / nPackets
-    # 所有包延迟均值
-    allPacketsAvgActualLatencies[turn] = np.mean(packetsActualLatencies)
-    allPacketsAvgOptLatencies[turn] = np.mean(packetsOptLatencies)
-
-
-# 将实验结果保存到文件
-# 输入：
-#   ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies：实验结果
-#   fileName：文件名
-def save(ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies, resNames, fileName):
-    sep = ','
-    lines = []
-    for res in [ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies]:
-        line = [str(elem) for elem in res]
-        lines.append(sep.join(line) + '\n')
-
-    idLine = 0
-    for resName in resNames:
-        lines.insert(idLine, resName + '\n')
-        idLine += 2
-
-    with open(fileName, 'w') as file:
-        file.writelines(lines)
-
-
-# 将实验结果从文件读到列表
-# 输入：
-#   resFileName
-# 输出：
-#   results：结果列表
-def read(resFileName, resNames):
-    results = [0] * len(resNames)
-
-    with open(resFileName, "r") as file:
-        while True:
-            resName = file.readline().strip()
-            try:
-                idRes = resNames.index(resName)
-            except ValueError:
-                break
-
-            res = file.readline().strip().split(",")
-            results[idRes] = [float(elem) for elem in res]
-
-    return results
-
-
-if __name__ == "__main__":
-    nTurns = 100
-    # exp1(nTurns)
+import numpy as np
+import numpy.random as random
+import os
+
+import src.core as core
+import src.graph as graph
+import src.network as network
+import src.incremental as incremental
+import src.checkpoint as checkpoint
+import src.store as store
+import src.profiling as profiling
+import src.stopping as stopping
+import src.equilibrium as equilibrium
+import src.trace as trace
+import src.crn as crn
+import src.protocols as protocols
+
+# ============== module vars =============
+
+# 实验
+N_TURNS = 100
+# 链路带宽上下界
+LOW_BANDWIDTH = 2
+HIGH_BANDWIDTH = 4
+
+# 画图
+PERCENTAGE_COLOR = "crimson"
+PERCENTAGE_IMPROVED_COLOR = "royalblue"
+
+ACTUAL_COST_COLOR = "red"
+ACTUAL_COST_IMPROVED_COLOR = "orangered"
+OPT_COST_COLOR = "limegreen"
+OPT_COST_IMPROVED_COLOR = "dodgerblue"
+
+NONFEATURE_ORIGIN_LINESTYLE = "solid"
+NONFEATURE_IMPROVED_LINESTYLE = "dashed"
+FEATURE_LINESTYLE = "dotted"
+
+NONFEATURE_ALPHA = 0.7
+FEATURE_ALPHA = 1
+
+# 文件
+PATH = os.path.join(os.path.dirname(__file__), "..", "res")
+FILE_EXT = ".txt"
+EXP1_RES1_FNAME = os.path.join(PATH, "exp1-originalRes" + FILE_EXT)
+EXP1_RES2_FNAME = os.path.join(PATH, "exp1-improvedRes" + FILE_EXT)
+EXP1_ANALYSIS_FNAME = os.path.join(PATH, "exp1-resAnalysis" + FILE_EXT)
+EXP1_CHECKPOINT_FNAME = os.path.join(PATH, "exp1-checkpoint.pkl")
+# 二进制结果目录，含各轮、各包数据
+EXP1_STORE_DIR = os.path.join(PATH, "exp1-store")
+# 逐轮状态的记录目录，见trace
+EXP1_TRACE_DIR = os.path.join(PATH, "exp1-trace")
+
+RES_NAMES = ["ineqPerCentages", "allPacketsAvgActualLatencies", "allPacketsAvgOptLatencies"]
+# 改进前、后各轮指标在实验状态中的名字
+TURN_RES_NAMES = RES_NAMES + [resName + "Improved" for resName in RES_NAMES]
+# 改进前、后各轮各包延迟
+PACKET_RES_NAMES = ["packetsActualLatencies", "packetsOptLatencies",
+                    "packetsActualLatenciesImproved", "packetsOptLatenciesImproved"]
+# 改进后一组的各轮指标、各包延迟；不跑改进后一组（静态度量）时各轮指标为nan，不存各包延迟
+IMPROVED_RES_NAMES = TURN_RES_NAMES[3:] + PACKET_RES_NAMES[2:]
+
+FIG_PATH = os.path.join(os.path.dirname(__file__), "..", "fig")
+EXP1_FIG1_FNAME = os.path.join(FIG_PATH, "exp1-percentage")
+EXP1_FIG2_FNAME = os.path.join(FIG_PATH, "exp1-cost")
+FIG_EXT = ".png"
+# 分析、作图的缓存键表
+ANALYSIS_CACHE_FNAME = os.path.join(PATH, "analysis-cache.pkl")
+
+
+# ======================= exp1 =====================
+
+# 对比original、improved的percentage、actual cost、opt cost
+# 输入：
+#   nTurns：实验nTurns轮
+#   executor：求各包最优延迟用的线程池或进程池，None时串行
+#   checkpointEvery：每checkpointEvery轮保存一次检查点，None时不保存
+#   resume：是否从上次的检查点继续
+#   seed：随机种子，None时沿用全局随机状态
+#   adaptive：是否自适应轮数，各指标均值的置信区间半宽达到relHalfWidths*|均值|时提前停止，nTurns为最大轮数
+#   relHalfWidths：{指标名: 目标相对半宽}，None时为stopping.REL_HALF_WIDTHS
+#   withEquilibrium：是否对同一网络、每轮期望需求求均衡与系统最优，得到均衡间隙、价格无政府，存入结果
+#   recordTrace：是否把每轮的输入延迟、选路、包记录到EXP1_TRACE_DIR，供trace回放
+#   commonRandomNumbers：是否用公共随机数，带宽、流量各用由seed派生的随机流，不用全局随机状态，见crn
+#   antithetic：每轮的包是否对偶抽样，须commonRandomNumbers为True
+#   protocol：选路协议，见protocols，None时按上一轮各边延迟选路
+def exp1(nTurns=N_TURNS, executor=None, checkpointEvery=None, resume=False, seed=None, adaptive=False,
+         relHalfWidths=None, withEquilibrium=False, recordTrace=False, commonRandomNumbers=False,
+         antithetic=False, protocol=None):
+    streams = getStreams(commonRandomNumbers, seed, antithetic)
+    state = None
+    if resume:
+        state = loadRunState(EXP1_CHECKPOINT_FNAME, nTurns)
+    resumed = state is not None
+    if state is None:
+        if seed is not None and streams is None:
+            random.seed(seed)
+        state = newRunState(nTurns, getRelHalfWidths(adaptive, relHalfWidths), streams, protocol)
+    # 从检查点继续时沿用检查点中的随机流
+    streams = state.get("streams")
+
+    saveState = None
+    if checkpointEvery:
+        def saveState(state):
+            checkpoint.save(EXP1_CHECKPOINT_FNAME, state)
+
+    recorder = None
+    if recordTrace:
+        recorder = trace.create(EXP1_TRACE_DIR, state["bandwidths"], core.N_PACKETS, nTurns, resumed)
+
+    # 各轮选路，及数据统计
+    print("round ", end='')
+    runTurns(state, core.N_PACKETS, executor, checkpointEvery=checkpointEvery, saveState=saveState,
+             recorder=recorder)
+    print()
+    if recorder is not None:
+        trace.flush(recorder)
+        print(f"Trace location: {EXP1_TRACE_DIR}")
+    equilibriumMetrics = None
+    if withEquilibrium:
+        equilibriumMetrics = equilibrium.getMetrics(state["bandwidths"],
+                                                    equilibrium.getExpectedDemand(core.N_NODES, core.N_PACKETS))
+        print(getEquilibriumAnalysis(equilibriumMetrics))
+    varianceReduction = crn.getVarianceReduction(state) if state.get("improvedArm", True) else None
+    if streams is not None and varianceReduction is not None:
+        print(crn.getAnalysis(varianceReduction))
+
+    # 将结果存到文件
+    save(*[state[resName] for resName in TURN_RES_NAMES[:3]], RES_NAMES, EXP1_RES1_FNAME)
+    save(*[state[resName] for resName in TURN_RES_NAMES[3:]], RES_NAMES, EXP1_RES2_FNAME)
+    store.save(EXP1_STORE_DIR, getStoreArrays(state),
+               getStoreMeta(state["nTurns"], seed, nPackets=core.N_PACKETS, maxTurns=nTurns,
+                            relHalfWidths=state["relHalfWidths"], equilibrium=equilibriumMetrics,
+                            crnEntropy=None if streams is None else streams.entropy,
+                            antithetic=streams is not None and streams.antithetic,
+                            varianceReduction=varianceReduction, protocol=state.get("protocol"),
+                            improvedArm=state.get("improvedArm", True)))
+    checkpoint.remove(EXP1_CHECKPOINT_FNAME)
+    if profiling.ENABLED:
+        print(profiling.summary())
+
+
+# 对比各选路协议：各协议在同一网络、同样的各轮包上跑exp1的各轮，静态度量的最短路只求一次
+# 静态度量不跑改进后一组，其改进后各指标为nan
+# 输入：
+#   protocolNames：协议名列表，可含protocols.LATENCY
+#   nTurns：轮数
+#   nPackets：每轮包数，None时为N_PACKETS
+#   seed：公共随机数的种子，None时随机取
+# 返回：
+#   means：{协议名: {指标名: 各轮均值}}
+def compareProtocols(protocolNames, nTurns=N_TURNS, nPackets=None, seed=None):
+    if nPackets is None:
+        nPackets = core.N_PACKETS
+    entropy = crn.getStreams(seed).entropy
+    means = {}
+    for protocol in protocolNames:
+        state = newRunState(nTurns, streams=crn.getStreams(entropy), protocol=protocol)
+        runTurns(state, nPackets, verbose=False)
+        means[protocol] = {resName: float(np.mean(state[resName])) for resName in TURN_RES_NAMES}
+
+    print("protocol".ljust(10) + "".join(resName.rjust(40) for resName in TURN_RES_NAMES))
+    for protocol, protocolMeans in means.items():
+        print(protocol.ljust(10) + "".join(f"{protocolMeans[resName]:40.4f}" for resName in TURN_RES_NAMES))
+    return means
+
+
+# 分析结果，并作图
+# 有二进制结果时从中读（mmap，不复制），否则读文本结果
+# 各图、分析文本按输入结果与作图参数缓存，未变时跳过，变了的图并行生成
+# 轮数由结果的长度得到，nTurns只为兼容保留
+def analyzeExp1Res(nTurns=N_TURNS):
+    import src.analysiscache as analysiscache
+    equilibriumMetrics = None
+    if store.exists(EXP1_STORE_DIR):
+        arrays, meta = store.load(EXP1_STORE_DIR)
+        equilibriumMetrics = meta.get("equilibrium")
+        results = {resName: arrays[resName] for resName in TURN_RES_NAMES}
+    else:
+        results = dict(zip(TURN_RES_NAMES, read(EXP1_RES1_FNAME, RES_NAMES) + read(EXP1_RES2_FNAME, RES_NAMES)))
+    results = {resName: np.asarray(res, float) for resName, res in results.items()}
+
+    tasks = [
+        analysiscache.Task(EXP1_FIG1_FNAME + FIG_EXT, plotExp1Percentage,
+                           {resName: results[resName] for resName in ["ineqPerCentages", "ineqPerCentagesImproved"]}),
+        analysiscache.Task(EXP1_FIG2_FNAME + FIG_EXT, plotExp1Cost,
+                           {resName: results[resName] for resName in TURN_RES_NAMES if "Latencies" in resName}),
+        analysiscache.Task(EXP1_ANALYSIS_FNAME, writeExp1Analysis, results,
+                           {"equilibriumMetrics": equilibriumMetrics}),
+    ]
+    analysiscache.run(tasks, ANALYSIS_CACHE_FNAME)
+
+    # 打印分析
+    with open(EXP1_ANALYSIS_FNAME) as file:
+        print(file.read())
+    print(f"Figures location: {FIG_PATH}")
+    print(f"Analysis location: {EXP1_ANALYSIS_FNAME}")
+
+
+# 分析文本：改进前后各指标的均值，及均衡与系统最优
+# 输入：
+#   fileName：分析文本文件
+#   ineqPerCentages, ...：改进前、后的各轮指标
+#   equilibriumMetrics：equilibrium.getMetrics的结果，None时没有
+def writeExp1Analysis(fileName, ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies,
+                      ineqPerCentagesImproved, allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved,
+                      equilibriumMetrics=None):
+    analysis = ""
+    resSeparator = "------------------------------------------------------------------\n"
+
+    # 先分析改进前后的ineqPerCentages
+    analysis += resSeparator \
+                + f"ineqPerCentages mean of all turns:  {np.mean(ineqPerCentages)}\n" \
+                + f"ineqPerCentages mean of all turns:  {np.mean(ineqPerCentagesImproved)}\n" \
+                + resSeparator \
+                + '\n'
+
+    # 分析cost
+    analysis += resSeparator \
+                + f"allPacketsAvgActualLatencies mean of all turns:  {np.mean(allPacketsAvgActualLatencies)}\n" \
+                + f"allPacketsAvgOptLatencies mean of all turns:  {np.mean(allPacketsAvgOptLatencies)}\n" \
+                + resSeparator \
+                + f"allPacketsAvgActualLatenciesImproved mean of all turns:  " \
+                  f"{np.mean(allPacketsAvgActualLatenciesImproved)}\n" \
+                + f"allPacketsAvgOptLatenciesImproved mean of all turns:  {np.mean(allPacketsAvgOptLatenciesImproved)}\n" \
+                + resSeparator \
+                + '\n'
+
+    if not hasImprovedArm(ineqPerCentagesImproved):
+        analysis += "improved arm not run: the routing metric is static, so it would repeat the original arm\n\n"
+
+    # 均衡与系统最优
+    if equilibriumMetrics is not None:
+        analysis += getEquilibriumAnalysis(equilibriumMetrics)
+
+    with open(fileName, 'w') as file:
+        file.write(analysis)
+
+
+# 结果中是否有改进后一组：不跑改进后一组时其各轮指标全为nan
+def hasImprovedArm(improvedValues):
+    return not np.all(np.isnan(improvedValues))
+
+
+# 各轮ineq占比的图
+def plotExp1Percentage(fileName, ineqPerCentages, ineqPerCentagesImproved):
+    import matplotlib.pyplot as plt
+    turns = list(range(1, len(ineqPerCentages) + 1))
+
+    fig = plt.figure(figsize=(6.4,5.5), dpi=300)
+    ax = plt.subplot(111)
+    ax.set_title("Proportion of packets with non-minimized costs in each round")
+    ax.set_xlabel("Round")
+    ax.set_ylabel("Proportion")
+    # 改进前
+    ax.plot(turns, ineqPerCentages, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=PERCENTAGE_COLOR,
+             alpha=NONFEATURE_ALPHA, label="Original")
+    ax.axhline(y=np.mean(ineqPerCentages), linestyle=FEATURE_LINESTYLE, color=PERCENTAGE_COLOR, alpha=FEATURE_ALPHA,
+                label="Original mean")
+    # 改进后
+    if hasImprovedArm(ineqPerCentagesImproved):
+        ax.plot(turns, ineqPerCentagesImproved, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
+                color=PERCENTAGE_IMPROVED_COLOR, alpha=NONFEATURE_ALPHA, label="Improved")
+        ax.axhline(y=np.mean(ineqPerCentagesImproved), linestyle=FEATURE_LINESTYLE, color=PERCENTAGE_IMPROVED_COLOR,
+                   alpha=FEATURE_ALPHA, label="Improved mean")
+
+    # legend设在坐标图下
+    ax.legend(ncol=2, bbox_to_anchor=(0.78, -0.1))
+    plt.tight_layout()
+    plt.savefig(fileName)
+    plt.close(fig)
+
+
+# 各轮平均实际、最优延迟的图
+def plotExp1Cost(fileName, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies,
+                 allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved):
+    import matplotlib.pyplot as plt
+    turns = list(range(1, len(allPacketsAvgActualLatencies) + 1))
+
+    fig = plt.figure(figsize=(6.4,5.8), dpi=300)
+    ax = plt.subplot(111)
+    ax.set_title("Average cost per packet in each round")
+    ax.set_xlabel("Round")
+    ax.set_ylabel("Cost")
+
+    # actual cost
+    # 改进前
+    ax.plot(turns, allPacketsAvgActualLatencies, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=ACTUAL_COST_COLOR,
+             alpha=NONFEATURE_ALPHA, label="Original actual")
+    ax.axhline(y=np.mean(allPacketsAvgActualLatencies), linestyle=FEATURE_LINESTYLE, color=ACTUAL_COST_COLOR,
+                alpha=FEATURE_ALPHA, label="Original actual mean")
+    # 改进后
+    if hasImprovedArm(allPacketsAvgActualLatenciesImproved):
+        ax.plot(turns, allPacketsAvgActualLatenciesImproved, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
+                color=ACTUAL_COST_IMPROVED_COLOR,
+                alpha=NONFEATURE_ALPHA, label="Improved actual")
+        ax.axhline(y=np.mean(allPacketsAvgActualLatenciesImproved), linestyle=FEATURE_LINESTYLE,
+                   color=ACTUAL_COST_IMPROVED_COLOR,
+                   alpha=FEATURE_ALPHA, label="Improved actual mean")
+
+    # opt cost
+    # 改进前
+    ax.plot(turns, allPacketsAvgOptLatencies, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=OPT_COST_COLOR,
+             alpha=NONFEATURE_ALPHA, label="Original optimal")
+    ax.axhline(y=np.mean(allPacketsAvgOptLatencies), linestyle=FEATURE_LINESTYLE, color=OPT_COST_COLOR,
+                alpha=FEATURE_ALPHA, label="Original optimal mean")
+    # 改进后
+    if hasImprovedArm(allPacketsAvgOptLatenciesImproved):
+        ax.plot(turns, allPacketsAvgOptLatenciesImproved, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
+                color=OPT_COST_IMPROVED_COLOR,
+                alpha=NONFEATURE_ALPHA, label="Improved optimal")
+        ax.axhline(y=np.mean(allPacketsAvgOptLatenciesImproved), linestyle=FEATURE_LINESTYLE,
+                   color=OPT_COST_IMPROVED_COLOR, alpha=FEATURE_ALPHA, label="Improved optimal mean")
+
+    ax.legend(ncol=2, bbox_to_anchor=(0.88, -0.1))
+    plt.tight_layout()
+    plt.savefig(fileName)
+    plt.close(fig)
+
+
+# ================== 子函数 =======================
+
+# 均衡、系统最优的分析文本
+# 输入：
+#   equilibriumMetrics：equilibrium.getMetrics的结果
+def getEquilibriumAnalysis(equilibriumMetrics):
+    resSeparator = "------------------------------------------------------------------\n"
+    return resSeparator \
+        + f"equilibrium avg latency per packet (continuous relaxation):  {equilibriumMetrics['equilibriumAvgLatency']}\n" \
+        + f"system optimal avg latency per packet (continuous relaxation):  " \
+          f"{equilibriumMetrics['systemOptimalAvgLatency']}\n" \
+        + f"price of anarchy:  {equilibriumMetrics['priceOfAnarchy']}\n" \
+        + f"equilibrium gap:  {equilibriumMetrics['equilibriumGap']}" \
+          f"{getConvergedNote(equilibriumMetrics, 'equilibrium')}\n" \
+        + f"system optimal gap:  {equilibriumMetrics.get('systemOptimalGap')}" \
+          f"{getConvergedNote(equilibriumMetrics, 'systemOptimal')}\n" \
+        + resSeparator \
+        + '\n'
+
+
+# 均衡或系统最优（prefix为"equilibrium"或"systemOptimal"）未收敛时在间隙后注明
+def getConvergedNote(equilibriumMetrics, prefix):
+    if equilibriumMetrics.get(prefix + "Converged", True):
+        return ""
+    return f" (not converged after {equilibriumMetrics[prefix + 'Iterations']} iterations)"
+
+
+# 自适应轮数的目标相对半宽
+# 返回：
+#   relHalfWidths：不自适应时为None
+def getRelHalfWidths(adaptive, relHalfWidths=None):
+    if not adaptive:
+        return None
+    return dict(stopping.REL_HALF_WIDTHS if relHalfWidths is None else relHalfWidths)
+
+
+# 公共随机数的各随机流
+# 返回：
+#   streams：crn.Streams，不用公共随机数时为None
+def getStreams(commonRandomNumbers, seed=None, antithetic=False):
+    if antithetic and not commonRandomNumbers:
+        raise ValueError("antithetic draws need commonRandomNumbers=True")
+    if not commonRandomNumbers:
+        return None
+    return crn.getStreams(seed, antithetic)
+
+
+# 新建实验状态：初始图、带宽、初始延迟，以及各轮指标
+# 输入：
+#   nTurns：实验轮数，自适应时为最大轮数
+#   relHalfWidths：自适应轮数的目标相对半宽，None时跑满nTurns轮
+#   streams：crn.Streams，给出时带宽、各轮的包由其中的随机流抽取，None时用全局随机状态
+#   protocol：选路协议，见protocols，None时按上一轮各边延迟选路
+# 返回：
+#   state：实验状态字典，可pickle，用于检查点
+def newRunState(nTurns, relHalfWidths=None, streams=None, protocol=None):
+    if protocol is None:
+        protocol = protocols.LATENCY
+    elif protocol != protocols.LATENCY:
+        protocols.getMetric(protocol)
+    improvedArm = protocols.hasImprovedArm(protocol)
+    if relHalfWidths is not None and not improvedArm:
+        relHalfWidths = {resName: relHalfWidth for resName, relHalfWidth in relHalfWidths.items()
+                         if resName not in IMPROVED_RES_NAMES}
+    # 初始图
+    edges = core.genMesh()
+    bandwidths = core.getBandwidths(edges, LOW_BANDWIDTH, HIGH_BANDWIDTH,
+                                    None if streams is None else streams.bandwidths)
+
+    # 初始latencies
+    latencies = np.full((core.N_NODES, core.N_NODES), core.MAX_LANRTENCY, int)
+    for node in range(core.N_NODES):
+        for neighbor in edges[node]:
+            latencies[node, neighbor] = 0
+
+    state = {
+        "nTurns": nTurns,
+        "relHalfWidths": relHalfWidths,
+        "streams": streams,
+        "protocol": protocol,
+        # 是否跑改进后一组，见protocols.hasImprovedArm
+        "improvedArm": improvedArm,
+        "turn": 0,
+        "bandwidths": bandwidths,
+        "latencies": latencies,
+        # 初始改进后的延迟
+        "modifiedLatencies": core.getModifiedLatencies(latencies),
+    }
+    # 各轮数据，改进前、后
+    for resName in TURN_RES_NAMES:
+        state[resName] = [0 if improvedArm or resName not in IMPROVED_RES_NAMES else np.nan] * nTurns
+    # 各轮各包延迟
+    for resName in PACKET_RES_NAMES:
+        state[resName] = [None] * nTurns
+    return state
+
+
+# 由检查点恢复实验状态，并恢复随机数状态
+# 输入：
+#   fileName：检查点文件名
+#   nTurns：实验轮数，须与检查点一致
+# 返回：
+#   state：实验状态，无检查点时为None
+def loadRunState(fileName, nTurns):
+    state = checkpoint.load(fileName)
+    if state is None:
+        return None
+    if state["nTurns"] != nTurns:
+        raise ValueError(f"checkpoint {fileName} is for nTurns={state['nTurns']}, not {nTurns}")
+    random.set_state(state["rngState"])
+    print(f"resume from round {state['turn']}")
+    return state
+
+
+# 从state["turn"]轮起，逐轮选路并统计改进前、后的指标，结果写入state；state["improvedArm"]为False时只跑改进前
+# 自适应轮数时，达到目标相对半宽即停止，各轮结果截到实际轮数，state["nTurns"]改为实际轮数
+# 输入：
+#   state：实验状态
+#   nPackets：每轮包数
+#   executor：求各包最优延迟用的线程池或进程池
+#   verbose：是否打印进度
+#   checkpointEvery, saveState：每checkpointEvery轮调用saveState(state)保存检查点
+#   recorder：trace.Trace，给出时记录每轮的输入延迟、选路、包
+def runTurns(state, nPackets, executor=None, verbose=True, checkpointEvery=None, saveState=None, recorder=None):
+    bandwidths = state["bandwidths"]
+    streams = state.get("streams")
+    # 各轮、改进前后复用同一组缓冲区
+    net = network.fromBandwidths(bandwidths, nPackets)
+    # 按协议选路时，改进前后共用静态度量的最短路缓存
+    routing = protocols.getRouting(state.get("protocol"), bandwidths)
+    improvedArm = state.get("improvedArm", True)
+    # 改进前、后各自修补上一轮的最短路径
+    engine = engineImproved = None
+    if core.SHORTEST_PATHS_METHOD == "incremental":
+        engine = incremental.ShortestPathsEngine(bandwidths)
+        engineImproved = incremental.ShortestPathsEngine(bandwidths)
+    ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies, ineqPerCentagesImproved, \
+        allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved = [state[resName] for resName in
+                                                                                   TURN_RES_NAMES]
+
+    for turn in range(state["turn"], state["nTurns"]):
+        if verbose:
+            print(f"{turn}", end=', ')
+        if streams is None:
+            packets = core.genPackets(nPackets)
+        else:
+            packets = crn.genPackets(nPackets, core.N_NODES, streams.traffic, streams.antithetic)
+
+        # 本轮改进前的选路
+        # 求本轮各边延迟、各包实际/最优延迟
+        latencies, packetsActualLatencies, packetsOptLatencies = getPacketsLatencies(state["latencies"], packets,
+                                                                                     bandwidths, executor=executor,
+                                                                                     net=net, engine=engine,
+                                                                                     routing=routing)
+        # 改进后选路时复用缓冲区，先复制
+        PI = net.lastPI.copy() if recorder is not None else None
+        calStatistics(turn, packetsActualLatencies, packetsOptLatencies,
+                      ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies)
+
+        # 改进后
+        packetsActualLatenciesImproved = packetsOptLatenciesImproved = None
+        if improvedArm:
+            _, packetsActualLatenciesImproved, packetsOptLatenciesImproved = getPacketsLatencies(
+                state["modifiedLatencies"], packets, bandwidths, executor=executor, net=net, engine=engineImproved,
+                routing=routing)
+            calStatistics(turn, packetsActualLatenciesImproved, packetsOptLatenciesImproved, ineqPerCentagesImproved,
+                          allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved)
+        if recorder is not None:
+            # 不跑改进后一组时，改进后的选路与改进前相同
+            trace.record(recorder, turn, state["latencies"], state["modifiedLatencies"], packets, PI,
+                         net.lastPI if improvedArm else PI, latencies)
+
+        for resName, packetsLatencies in zip(PACKET_RES_NAMES, [packetsActualLatencies, packetsOptLatencies,
+                                                                 packetsActualLatenciesImproved,
+                                                                 packetsOptLatenciesImproved]):
+            state[resName][turn] = packetsLatencies
+
+        # 本轮延迟，及改进后延迟
+        state["latencies"] = latencies
+        state["modifiedLatencies"] = core.getModifiedLatencies(latencies)
+        state["turn"] = turn + 1
+        profiling.endRound(turn=turn, nPackets=nPackets)
+
+        if state.get("relHalfWidths") and stopping.isConverged(state, state["turn"], state["relHalfWidths"]):
+            for resName in TURN_RES_NAMES + PACKET_RES_NAMES:
+                del state[resName][state["turn"]:]
+            state["nTurns"] = state["turn"]
+            if verbose:
+                print(f"converged after {state['turn']} rounds", end=' ')
+            break
+
+        if saveState is not None and checkpointEvery and state["turn"] % checkpointEvery == 0:
+            if recorder is not None:
+                trace.flush(recorder)
+            state["rngState"] = random.get_state()
+            saveState(state)
+
+
+# 求本轮各包实际、最优延迟
+# 输入：
+#   lastLinkLatencies：上一轮各边延迟
+#   packets
+#   bandwidths
+#   csrGraph：graph.Graph，给出时各边的量为一维数组，按稀疏图求最短路径；
+#             exp1、exp2的各轮总按稠密矩阵计算，不传csrGraph，稀疏图只供直接调用
+#   executor：求各包最优延迟用的线程池或进程池，None时串行
+#   net：network.Network，其缓冲区在各轮复用；None时由bandwidths新建
+#   engine：incremental.ShortestPathsEngine，给出时修补上一轮的最短路径
+#   routing：protocols.Routing，给出时按其协议的度量选路
+# 输出：
+#   curLinklatencies：本轮各边延迟
+#   packetsActualLatencies, packetsOptLatencies：本轮各包实际、最优延迟
+def getPacketsLatencies(lastLinkLatencies, packets, bandwidths, csrGraph=None, executor=None, net=None, engine=None,
+                        routing=None):
+    if csrGraph is not None:
+        return getPacketsLatenciesSparse(lastLinkLatencies, packets, bandwidths, csrGraph)
+    if net is None:
+        net = network.fromBandwidths(bandwidths, len(packets))
+    return network.getPacketsLatencies(net, lastLinkLatencies, packets, executor, engine, routing)
+
+
+# getPacketsLatencies的稀疏图版本，只对各包的src求最短路径树
+def getPacketsLatenciesSparse(lastLinkLatencies, packets, bandwidths, csrGraph):
+    with profiling.stage("getShortestPaths"):
+        routes = graph.getRoutes(csrGraph, lastLinkLatencies, [packet[0] for packet in packets])
+    with profiling.stage("getLatencies"):
+        incidence = graph.getIncidence(csrGraph, packets, routes)
+        paths = graph.getIncidencePaths(incidence)
+        curLinklatencies = graph.getLinkLatencies(core.getIncidenceFlows(incidence), bandwidths)
+
+    with profiling.stage("getPacketsActualLatencies"):
+        packetsActualLatencies = core.getIncidenceLatencies(incidence, curLinklatencies)
+    with profiling.stage("getPacketsOptLatencies"):
+        packetsOptLatencies = graph.getPacketsOptLatencies(csrGraph, packets, paths, bandwidths,
+                                                           packetsActualLatencies)
+
+    return curLinklatencies, packetsActualLatencies, packetsOptLatencies
+
+
+# 由各包实际、最优延迟，统计本轮指标
+# 输入：
+#   turn：本轮id
+#   packetsActualLatencies, packetsOptLatencies：本轮各包实际、最优延迟
+#   ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies：要统计的指标
+def calStatistics(turn, packetsActualLatencies, packetsOptLatencies, ineqPerCentages, allPacketsAvgActualLatencies,
+                  allPacketsAvgOptLatencies):
+    # ineq占比
+    nPackets = len(packetsActualLatencies)
+    packetsActualLatencies = np.asarray(packetsActualLatencies)
+    packetsOptLatencies = np.asarray(packetsOptLatencies)
+    if np.any(packetsActualLatencies < packetsOptLatencies):
+        print("\nError: actual latency < opt latency")
+        exit()
+    ineqPerCentages[turn] = np.count_nonzero(packetsActualLatencies > packetsOptLatencies) / nPackets
+    # 所有包延迟均值
+    allPacketsAvgActualLatencies[turn] = np.mean(packetsActualLatencies)
+    allPacketsAvgOptLatencies[turn] = np.mean(packetsOptLatencies)
+
+
+# 由实验状态取出要存入二进制结果的数组：各轮指标，及各包延迟（nTurns*nPackets）；不跑改进后一组时不含改进后的各包延迟
+def getStoreArrays(state):
+    arrays = {resName: np.asarray(state[resName], float) for resName in TURN_RES_NAMES}
+    for resName in PACKET_RES_NAMES:
+        if state.get("improvedArm", True) or resName not in IMPROVED_RES_NAMES:
+            arrays[resName] = np.array(state[resName], int)
+    return arrays
+
+
+# 二进制结果的元数据
+def getStoreMeta(nTurns, seed, **kwargs):
+    meta = {
+        "MESH_LEN": core.MESH_LEN,
+        "lowBandwidth": LOW_BANDWIDTH,
+        "highBandwidth": HIGH_BANDWIDTH,
+        "optLatencyMethod": core.OPT_LATENCY_METHOD,
+        "seed": seed,
+        "nTurns": nTurns,
+    }
+    meta.update(kwargs)
+    return meta
+
+
+# 将实验结果保存到文件
+# 输入：
+#   ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies：实验结果
+#   fileName：文件名
+def save(ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies, resNames, fileName):
+    sep = ','
+    lines = []
+    for res in [ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies]:
+        line = [str(elem) for elem in res]
+        lines.append(sep.join(line) + '\n')
+
+    idLine = 0
+    for resName in resNames:
+        lines.insert(idLine, resName + '\n')
+        idLine += 2
+
+    with open(fileName, 'w') as file:
+        file.writelines(lines)
+
+
+# 将实验结果从文件读到列表
+# 输入：
+#   resFileName
+# 输出：
+#   results：结果列表
+def read(resFileName, resNames):
+    results = [0] * len(resNames)
+
+    with open(resFileName, "r") as file:
+        while True:
+            resName = file.readline().strip()
+            try:
+                idRes = resNames.index(resName)
+            except ValueError:
+                break
+
+            res = file.readline().strip().split(",")
+            results[idRes] = [float(elem) for elem in res]
+
+    return results
+
+
+if __name__ == "__main__":
+    nTurns = 100
+    # exp1(nTurns)
     analyzeExp1Res(nTurns)
\ No newline at end of file
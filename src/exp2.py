@@ -1,241 +1,421 @@
-import numpy as np
-import matplotlib.pyplot as plt
-import os
-
-import src.core as core
-import src.exp1 as exp1
-
-#========================= module vars =======================
-
-# 实验
-N_PACKETS_MIN = 1
-N_PACKETS_MAX = 100
-N_PACKETS_STEP = 1
-
-N_TURNS = 100
-
-
-# 画图
-PERCENTAGE_COLOR = "crimson"
-PERCENTAGE_IMPROVED_COLOR = "royalblue"
-
-ACTUAL_COST_COLOR = "red"
-ACTUAL_COST_IMPROVED_COLOR = "orangered"
-OPT_COST_COLOR = "limegreen"
-OPT_COST_IMPROVED_COLOR = "dodgerblue"
-
-NONFEATURE_ORIGIN_LINESTYLE = "solid"
-NONFEATURE_IMPROVED_LINESTYLE = "dashed"
-FEATURE_LINESTYLE = "dotted"
-
-NONFEATURE_ALPHA = 0.7
-FEATURE_ALPHA = 1
-
-# 文件
-PATH = exp1.PATH
-FILE_EXT = exp1.FILE_EXT
-EXP2_RES1_FNAME = os.path.join(PATH, "exp2-originalRes"+FILE_EXT)
-EXP2_RES2_FNAME = os.path.join(PATH, "exp2-improvedRes"+FILE_EXT)
-EXP2_ANALYSIS_FNAME = os.path.join(PATH, "exp2-resAnalysis"+FILE_EXT)
-
-RES_NAMES = ["ineqPerCentagePerNPackets", "actualLatencyPerNPackets", "optLatencyPerNPackets"]
-
-FIG_PATH = exp1.FIG_PATH
-EXP2_FIG1_FNAME = os.path.join(FIG_PATH, "exp2-percentage")
-EXP2_FIG2_FNAME = os.path.join(FIG_PATH, "exp2-cost")
-
-
-
-#=========================== exp 2 ==================================
-
-# 包种类数作自变量，探究percentage、cost和包种类数的关系
-def exp2(nPacketsMin=N_PACKETS_MIN, nPacketsMax=N_PACKETS_MAX, nPacketsStep=N_PACKETS_STEP, nTurns=N_TURNS):
-    # 改进前
-    ineqPerCentagePerNPackets = []
-    actualLatencyPerNPackets = []
-    optLatencyPerNPackets = []
-    # 改进后
-    ineqPerCentageImprovedPerNPackets = []
-    actualLatencyImprovedPerNPackets = []
-    optLatencyImprovedPerNPackets = []
-
-    for nPackets in range(nPacketsMin, nPacketsMax+1, nPacketsStep):
-        print(f"num of packet types = {nPackets}: ", end='')
-        ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies,\
-        ineqPerCentagesImproved, allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved = exp2PerNPackets(nPackets, nTurns)
-        # 改进前
-        ineqPerCentagePerNPackets.append(np.mean(ineqPerCentages))
-        actualLatencyPerNPackets.append(np.mean(allPacketsAvgActualLatencies))
-        optLatencyPerNPackets.append(np.mean(allPacketsAvgOptLatencies))
-        # 改进后
-        ineqPerCentageImprovedPerNPackets.append(np.mean(ineqPerCentagesImproved))
-        actualLatencyImprovedPerNPackets.append(np.mean(allPacketsAvgActualLatenciesImproved))
-        optLatencyImprovedPerNPackets.append(np.mean(allPacketsAvgOptLatenciesImproved))
-
-    # 保存到文件
-    exp1.save(ineqPerCentagePerNPackets, actualLatencyPerNPackets, optLatencyPerNPackets, RES_NAMES, EXP2_RES1_FNAME)
-    exp1.save(ineqPerCentageImprovedPerNPackets, actualLatencyImprovedPerNPackets, optLatencyImprovedPerNPackets, RES_NAMES, EXP2_RES2_FNAME)
-
-
-# 分析结果，并作图
-def analyzeExp2Res(nPacketsMin=N_PACKETS_MIN, nPacketsMax=N_PACKETS_MAX, nPacketsStep=N_PACKETS_STEP):
-    ineqPerCentagePerNPackets, actualLatencyPerNPackets, optLatencyPerNPackets = exp1.read(EXP2_RES1_FNAME, RES_NAMES)
-    ineqPerCentageImprovedPerNPackets, actualLatencyImprovedPerNPackets, optLatencyImprovedPerNPackets = exp1.read(EXP2_RES2_FNAME, RES_NAMES)
-
-    analysis = ""
-    resSeparator = "------------------------------------------------------------------\n"
-
-    # 先分析改进前后的ineqPerCentagePerNPackets
-    ineqPerCentagePerNPacketsMean = np.mean(ineqPerCentagePerNPackets)
-    ineqPerCentageImprovedPerNPacketsMean = np.mean(ineqPerCentageImprovedPerNPackets)
-
-    analysis += resSeparator \
-                + f"ineqPerCentagePerPackets mean of all nPackets:  {ineqPerCentagePerNPacketsMean}\n" \
-                + f"improvedIneqPerCentagePerPackets mean of all nPackets:  {ineqPerCentageImprovedPerNPacketsMean}\n" \
-                + resSeparator \
-                + '\n'
-
-    nPackets = list(range(nPacketsMin, nPacketsMax + 1, nPacketsStep))
-
-    plt.figure(figsize=(6.4,5.5), dpi=300)
-    ax = plt.subplot(111)
-    ax.set_title("Proportion of packets with non-minimized costs\nfor each number of packet groups")
-    ax.set_xlabel("Number of packet types")
-    ax.set_ylabel("Proportion")
-    # 改进前
-    ax.plot(nPackets, ineqPerCentagePerNPackets, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=PERCENTAGE_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Original")
-    ax.axhline(y=ineqPerCentagePerNPacketsMean, linestyle=FEATURE_LINESTYLE, color=PERCENTAGE_COLOR, alpha=FEATURE_ALPHA,
-                label="Original mean")
-    # 改进后
-    ax.plot(nPackets, ineqPerCentageImprovedPerNPackets, linestyle=NONFEATURE_IMPROVED_LINESTYLE, color=PERCENTAGE_IMPROVED_COLOR,
-             alpha=NONFEATURE_ALPHA, label="Improved")
-    ax.axhline(y=ineqPerCentageImprovedPerNPacketsMean, linestyle=FEATURE_LINESTYLE, color=PERCENTAGE_IMPROVED_COLOR,
-                alpha=FEATURE_ALPHA, label="Improved mean")
-
-    # legend设在坐标图下
-    ax.legend(ncol=2, bbox_to_anchor=(0.8, -0.15))
-    plt.tight_layout()
-    plt.savefig(EXP2_FIG1_FNAME)
-
-    # 分析cost
-    maxPower = 1
-    # actual cost
-    fitFuncActualLatencyPerNPackets = np.poly1d(np.polyfit(nPackets, actualLatencyPerNPackets, maxPower))
-    fitFuncActualLatencyImprovedPerNPackets = np.poly1d(np.polyfit(nPackets, actualLatencyImprovedPerNPackets, maxPower))
-    # opt cost
-    fitFuncOptLatencyPerNPackets = np.poly1d(np.polyfit(nPackets, optLatencyPerNPackets, maxPower))
-    fitFuncOptLatencyImprovedPerNPackets = np.poly1d(np.polyfit(nPackets, optLatencyImprovedPerNPackets, maxPower))
-
-    analysis += resSeparator \
-                + f"Fit function with maxpower {maxPower} of actualLatenciesPerNPackets:  {fitFuncActualLatencyPerNPackets}\n" \
-                + f"Fit function with maxpower {maxPower} of optLatenciesPerNPackets:  {fitFuncOptLatencyPerNPackets}\n" \
-                + resSeparator \
-                + f"Fit function with maxpower {maxPower} of actualLatenciesImprovedPerNPackets:  {fitFuncActualLatencyImprovedPerNPackets}\n" \
-                + f"Fit function with maxpower {maxPower} of optLatenciesImprovedPerNPackets:  {fitFuncOptLatencyImprovedPerNPackets}\n" \
-                + resSeparator \
-                + '\n'
-
-    plt.figure(figsize=(6.4, 5.8), dpi=300)
-    ax = plt.subplot(111)
-    ax.set_title("Average cost per packet \nfor each number of packet groups")
-    ax.set_xlabel("Number of packet types")
-    ax.set_ylabel("Cost")
-
-    # actual cost
-    # 改进前
-    ax.plot(nPackets, actualLatencyPerNPackets, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=ACTUAL_COST_COLOR,
-            alpha=NONFEATURE_ALPHA, label="Original actual")
-    ax.plot(nPackets, fitFuncActualLatencyPerNPackets(nPackets), linestyle=FEATURE_LINESTYLE, color=ACTUAL_COST_COLOR,
-               alpha=FEATURE_ALPHA, label="Original actual fit")
-    # 改进后
-    ax.plot(nPackets, actualLatencyImprovedPerNPackets, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
-            color=ACTUAL_COST_IMPROVED_COLOR,
-            alpha=NONFEATURE_ALPHA, label="Improved actual")
-    ax.plot(nPackets, fitFuncActualLatencyImprovedPerNPackets(nPackets), linestyle=FEATURE_LINESTYLE,
-               color=ACTUAL_COST_IMPROVED_COLOR,
-               alpha=FEATURE_ALPHA, label="Improved actual fit")
-
-    # opt cost
-    # 改进前
-    ax.plot(nPackets, optLatencyPerNPackets, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=OPT_COST_COLOR,
-            alpha=NONFEATURE_ALPHA, label="Original optimal")
-    ax.plot(nPackets, fitFuncOptLatencyPerNPackets(nPackets), linestyle=FEATURE_LINESTYLE, color=OPT_COST_COLOR, alpha=FEATURE_ALPHA,
-               label="Original optimal fit")
-    # 改进后
-    ax.plot(nPackets, optLatencyImprovedPerNPackets, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
-            color=OPT_COST_IMPROVED_COLOR,
-            alpha=NONFEATURE_ALPHA, label="Improved optimal")
-    ax.plot(nPackets, fitFuncOptLatencyImprovedPerNPackets(nPackets), linestyle=FEATURE_LINESTYLE, color=OPT_COST_IMPROVED_COLOR,
-               alpha=FEATURE_ALPHA, label="Improved optimal fit")
-
-    ax.legend(ncol=2, bbox_to_anchor=(0.88, -0.1))
-    plt.tight_layout()
-    plt.savefig(EXP2_FIG2_FNAME)
-
-    # 打印分析，并保存到文件
-    print(analysis)
-    with open(EXP2_ANALYSIS_FNAME, 'w') as file:
-        file.write(analysis)
-    print(f"Figures location: {FIG_PATH}")
-    print(f"Analysis location: {EXP2_ANALYSIS_FNAME}")
-
-
-#================================ 子函数 ======================================
-
-# exp2每个nPackets的实验，基于exp1
-# 输入：
-#   nPackets：当前包种类数
-#   nTurns：重nTurns轮取平均值
-def exp2PerNPackets(nPackets, nTurns):
-    # 初始图
-    edges = core.genMesh()
-    bandwidths = core.getBandwidths(edges, 2, 4)
-
-    # 初始latencies
-    latencies = np.full((core.N_NODES,core.N_NODES), core.MAX_LANRTENCY, int)
-    for node in range(core.N_NODES):
-        for neighbor in edges[node]:
-            latencies[node,neighbor] = 0
-    # 初始改进后的延迟
-    modifiedLatencies = core.getModifiedLatencies(latencies)
-
-    # 各轮数据
-    ineqPerCentages = [0]*nTurns
-    allPacketsAvgActualLatencies = [0]*nTurns
-    allPacketsAvgOptLatencies = [0]*nTurns
-    # 改进延迟后的数据
-    ineqPerCentagesImproved = [0] * nTurns
-    allPacketsAvgActualLatenciesImproved = [0] * nTurns
-    allPacketsAvgOptLatenciesImproved = [0] * nTurns
-
-    # 各轮选路，及数据统计
-    print("turn ", end='')
-    for turn in range(nTurns):
-        print(f"{turn}", end=', ')
-        packets = core.genPackets(nPackets)
-
-        # 本轮改进前的选路
-        # 求本轮各边延迟、各包实际/最优延迟
-        latencies, packetsActualLatencies, packetsOptLatencies = exp1.getPacketsLatencies(latencies, packets, bandwidths)
-        exp1.calStatistics(turn, packetsActualLatencies, packetsOptLatencies,
-                      ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies)
-
-        # 改进后
-        modifiedLatencies, packetsActualLatenciesImproved, packetsOptLatenciesImproved = exp1.getPacketsLatencies(modifiedLatencies, packets, bandwidths)
-        exp1.calStatistics(turn, packetsActualLatenciesImproved, packetsOptLatenciesImproved,
-                      ineqPerCentagesImproved, allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved)
-        # 本轮改进后延迟
-        modifiedLatencies = core.getModifiedLatencies(latencies)
-
-    print()
-
-    return ineqPerCentages, allPacketsAvgActualLatencies, allPacketsAvgOptLatencies,\
-        ineqPerCentagesImproved, allPacketsAvgActualLatenciesImproved, allPacketsAvgOptLatenciesImproved
-
-
-if __name__ == "__main__":
-    nPacketsMax, nPacketsMin, nPacketsStep = 1,100,1
-    nTurns = 100
-    # exp2(nPacketsMax, nPacketsMin, nPacketsStep, nTurns)
+import numpy as np
+import numpy.random as random
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import src.exp1 as exp1
+import src.checkpoint as checkpoint
+import src.store as store
+import src.profiling as profiling
+import src.crn as crn
+import src.protocols as protocols
+
+#========================= module vars =======================
+
+# 实验
+N_PACKETS_MIN = 1
+N_PACKETS_MAX = 100
+N_PACKETS_STEP = 1
+
+N_TURNS = 100
+
+
+# 画图
+PERCENTAGE_COLOR = "crimson"
+PERCENTAGE_IMPROVED_COLOR = "royalblue"
+
+ACTUAL_COST_COLOR = "red"
+ACTUAL_COST_IMPROVED_COLOR = "orangered"
+OPT_COST_COLOR = "limegreen"
+OPT_COST_IMPROVED_COLOR = "dodgerblue"
+
+NONFEATURE_ORIGIN_LINESTYLE = "solid"
+NONFEATURE_IMPROVED_LINESTYLE = "dashed"
+FEATURE_LINESTYLE = "dotted"
+
+NONFEATURE_ALPHA = 0.7
+FEATURE_ALPHA = 1
+
+# 各延迟对nPackets拟合多项式的次数
+FIT_MAX_POWER = 1
+
+# 文件
+PATH = exp1.PATH
+FILE_EXT = exp1.FILE_EXT
+EXP2_RES1_FNAME = os.path.join(PATH, "exp2-originalRes"+FILE_EXT)
+EXP2_RES2_FNAME = os.path.join(PATH, "exp2-improvedRes"+FILE_EXT)
+EXP2_ANALYSIS_FNAME = os.path.join(PATH, "exp2-resAnalysis"+FILE_EXT)
+EXP2_CHECKPOINT_FNAME = os.path.join(PATH, "exp2-checkpoint.pkl")
+# 二进制结果目录，含各轮、各包数据
+EXP2_STORE_DIR = os.path.join(PATH, "exp2-store")
+
+RES_NAMES = ["ineqPerCentagePerNPackets", "actualLatencyPerNPackets", "optLatencyPerNPackets"]
+IMPROVED_RES_NAMES = ["ineqPerCentageImprovedPerNPackets", "actualLatencyImprovedPerNPackets",
+                      "optLatencyImprovedPerNPackets"]
+
+FIG_PATH = exp1.FIG_PATH
+EXP2_FIG1_FNAME = os.path.join(FIG_PATH, "exp2-percentage")
+EXP2_FIG2_FNAME = os.path.join(FIG_PATH, "exp2-cost")
+
+
+
+#=========================== exp 2 ==================================
+
+# 包种类数作自变量，探究percentage、cost和包种类数的关系
+# 输入：
+#   nWorkers：并行进程数，None时串行
+#   seed：随机种子，给出时各nPackets用由seed派生的独立随机流，结果与nWorkers无关；
+#         None时串行沿用全局随机状态，并行时随机取种子
+#   checkpointEvery：串行时每checkpointEvery轮、并行时每完成一个nPackets保存一次检查点，None时不保存
+#   resume：是否从上次的检查点继续
+#   adaptive, relHalfWidths：同exp1.exp1，每个nPackets各自停止，nTurns为最大轮数
+#   commonRandomNumbers：是否用公共随机数，各nPackets用由seed派生的同一组随机流，共用同一网络的带宽，见crn
+#   antithetic：每轮的包是否对偶抽样，须commonRandomNumbers为True
+#   protocol：选路协议，同exp1.exp1
+def exp2(nPacketsMin=N_PACKETS_MIN, nPacketsMax=N_PACKETS_MAX, nPacketsStep=N_PACKETS_STEP, nTurns=N_TURNS,
+         nWorkers=None, seed=None, checkpointEvery=None, resume=False, adaptive=False, relHalfWidths=None,
+         commonRandomNumbers=False, antithetic=False, protocol=None):
+    # 改进前
+    ineqPerCentagePerNPackets = []
+    actualLatencyPerNPackets = []
+    optLatencyPerNPackets = []
+    # 改进后
+    ineqPerCentageImprovedPerNPackets = []
+    actualLatencyImprovedPerNPackets = []
+    optLatencyImprovedPerNPackets = []
+
+    nPacketsList = list(range(nPacketsMin, nPacketsMax+1, nPacketsStep))
+    relHalfWidths = exp1.getRelHalfWidths(adaptive, relHalfWidths)
+    sweepState = None
+    if resume:
+        sweepState = loadSweepState(EXP2_CHECKPOINT_FNAME, nPacketsList, nTurns, seed)
+    if sweepState is None:
+        entropy = None
+        if seed is not None or nWorkers is not None or commonRandomNumbers:
+            entropy = np.random.SeedSequence(seed).entropy
+        # pointsResults：已完成的{nPackets序号: 该点结果}；point：进行中的(nPackets序号, 实验状态)
+        sweepState = {"nPacketsList": nPacketsList, "nTurns": nTurns, "seed": seed, "entropy": entropy,
+                      "pointsResults": {}, "point": None}
+    pointsResults = sweepState["pointsResults"]
+
+    if sweepState["entropy"] is None:
+        seedSeqs = [None] * len(nPacketsList)
+    else:
+        seedSeqs = np.random.SeedSequence(sweepState["entropy"]).spawn(len(nPacketsList))
+    # 公共随机数时各点由同一种子新建随机流，相互独立地从头抽取
+    if antithetic and not commonRandomNumbers:
+        raise ValueError("antithetic draws need commonRandomNumbers=True")
+    crnEntropy = sweepState["entropy"] if commonRandomNumbers else None
+
+    def saveSweepState():
+        if checkpointEvery:
+            sweepState["rngState"] = random.get_state()
+            checkpoint.save(EXP2_CHECKPOINT_FNAME, sweepState)
+
+    if nWorkers is None:
+        for idx, nPackets in enumerate(nPacketsList):
+            if idx in pointsResults:
+                continue
+            runState = None
+            if sweepState["point"] is not None and sweepState["point"][0] == idx:
+                runState = sweepState["point"][1]
+
+            def savePointState(runState, idx=idx):
+                sweepState["point"] = (idx, runState)
+                checkpoint.save(EXP2_CHECKPOINT_FNAME, sweepState)
+
+            pointsResults[idx] = exp2PointResults(nPackets, nTurns, seedSeqs[idx], True, runState, checkpointEvery,
+                                                savePointState, relHalfWidths, crnEntropy, antithetic, protocol)
+            sweepState["point"] = None
+            saveSweepState()
+    else:
+        print(f"num of packet types {nPacketsMin}~{nPacketsMax}, {nWorkers} workers")
+        with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            futures = {executor.submit(exp2PointResults, nPacketsList[idx], nTurns, seedSeqs[idx], False, None, None,
+                                       None, relHalfWidths, crnEntropy, antithetic, protocol): idx
+                       for idx in range(len(nPacketsList)) if idx not in pointsResults}
+            for future in as_completed(futures):
+                pointsResults[futures[future]] = future.result()
+                saveSweepState()
+    # 按nPackets顺序
+    pointsResults = [pointsResults[idx] for idx in range(len(nPacketsList))]
+
+    for pointResults in pointsResults:
+        pointMeans = [np.mean(pointResults[resName]) for resName in exp1.TURN_RES_NAMES]
+        # 改进前
+        ineqPerCentagePerNPackets.append(pointMeans[0])
+        actualLatencyPerNPackets.append(pointMeans[1])
+        optLatencyPerNPackets.append(pointMeans[2])
+        # 改进后
+        ineqPerCentageImprovedPerNPackets.append(pointMeans[3])
+        actualLatencyImprovedPerNPackets.append(pointMeans[4])
+        optLatencyImprovedPerNPackets.append(pointMeans[5])
+
+    # 保存到文件
+    exp1.save(ineqPerCentagePerNPackets, actualLatencyPerNPackets, optLatencyPerNPackets, RES_NAMES, EXP2_RES1_FNAME)
+    exp1.save(ineqPerCentageImprovedPerNPackets, actualLatencyImprovedPerNPackets, optLatencyImprovedPerNPackets, RES_NAMES, EXP2_RES2_FNAME)
+
+    # 二进制结果：各nPackets均值、各轮指标（nPoints*nTurns，自适应时实际轮数turnsUsed之后为nan）、
+    # 各包延迟（按nPackets拼接，偏移为packetOffsets）
+    turnsUsed = np.array([len(pointResults[exp1.TURN_RES_NAMES[0]]) for pointResults in pointsResults], int)
+    arrays = {"nPackets": np.array(nPacketsList, int), "turnsUsed": turnsUsed}
+    for resName, res in zip(RES_NAMES + IMPROVED_RES_NAMES,
+                            [ineqPerCentagePerNPackets, actualLatencyPerNPackets, optLatencyPerNPackets,
+                             ineqPerCentageImprovedPerNPackets, actualLatencyImprovedPerNPackets,
+                             optLatencyImprovedPerNPackets]):
+        arrays[resName] = np.array(res, float)
+    for resName in exp1.TURN_RES_NAMES:
+        arrays[resName] = np.full((len(pointsResults), nTurns), np.nan)
+        for idx, pointResults in enumerate(pointsResults):
+            arrays[resName][idx, :turnsUsed[idx]] = pointResults[resName]
+    # 不跑改进后一组时没有改进后的各包延迟
+    improvedArm = protocols.hasImprovedArm(protocol)
+    for resName in exp1.PACKET_RES_NAMES:
+        if resName in pointsResults[0]:
+            arrays[resName], arrays["packetOffsets"] = store.toRagged(
+                [np.ravel(pointResults[resName]) for pointResults in pointsResults])
+    varianceReductions = None
+    if improvedArm:
+        varianceReductions = [crn.getVarianceReduction(pointResults) for pointResults in pointsResults]
+    store.save(EXP2_STORE_DIR, arrays,
+               exp1.getStoreMeta(nTurns, seed, nPackets=nPacketsList, relHalfWidths=relHalfWidths,
+                                 crnEntropy=crnEntropy, antithetic=antithetic,
+                                 varianceReduction=varianceReductions, protocol=protocol, improvedArm=improvedArm))
+    if relHalfWidths is not None:
+        print(f"rounds used: {turnsUsed.sum()} of {nTurns * len(nPacketsList)}")
+    if crnEntropy is not None and varianceReductions is not None:
+        print(getVarianceReductionAnalysis(varianceReductions))
+    if profiling.ENABLED:
+        print(profiling.summary())
+    checkpoint.remove(EXP2_CHECKPOINT_FNAME)
+
+
+# 分析结果，并作图
+# 有二进制结果时从中读（mmap，不复制），否则读文本结果
+# 各图、分析文本按输入结果与作图参数缓存，未变时跳过，变了的图并行生成
+def analyzeExp2Res(nPacketsMin=N_PACKETS_MIN, nPacketsMax=N_PACKETS_MAX, nPacketsStep=N_PACKETS_STEP):
+    import src.analysiscache as analysiscache
+    nPackets = list(range(nPacketsMin, nPacketsMax + 1, nPacketsStep))
+    if store.exists(EXP2_STORE_DIR):
+        arrays, meta = store.load(EXP2_STORE_DIR)
+        nPackets = meta["nPackets"]
+        results = {resName: arrays[resName] for resName in RES_NAMES + IMPROVED_RES_NAMES}
+    else:
+        results = dict(zip(RES_NAMES + IMPROVED_RES_NAMES,
+                           exp1.read(EXP2_RES1_FNAME, RES_NAMES) + exp1.read(EXP2_RES2_FNAME, RES_NAMES)))
+    results = {resName: np.asarray(res, float) for resName, res in results.items()}
+    results["nPackets"] = np.asarray(nPackets, float)
+
+    percentageNames = ["nPackets", "ineqPerCentagePerNPackets", "ineqPerCentageImprovedPerNPackets"]
+    tasks = [
+        analysiscache.Task(EXP2_FIG1_FNAME + exp1.FIG_EXT, plotExp2Percentage,
+                           {resName: results[resName] for resName in percentageNames}),
+        analysiscache.Task(EXP2_FIG2_FNAME + exp1.FIG_EXT, plotExp2Cost,
+                           {resName: results[resName] for resName in results if "Latency" in resName or
+                            resName == "nPackets"}),
+        analysiscache.Task(EXP2_ANALYSIS_FNAME, writeExp2Analysis, results),
+    ]
+    analysiscache.run(tasks, exp1.ANALYSIS_CACHE_FNAME)
+
+    # 打印分析
+    with open(EXP2_ANALYSIS_FNAME) as file:
+        print(file.read())
+    print(f"Figures location: {FIG_PATH}")
+    print(f"Analysis location: {EXP2_ANALYSIS_FNAME}")
+
+
+# 各指标对nPackets的拟合函数
+def getFitFunc(nPackets, values):
+    return np.poly1d(np.polyfit(nPackets, values, FIT_MAX_POWER))
+
+
+# 分析文本：改进前后ineq占比的均值，及各延迟对nPackets的拟合
+# 输入：
+#   fileName：分析文本文件
+#   nPackets：各nPackets
+#   ineqPerCentagePerNPackets, ...：改进前、后各nPackets的指标
+def writeExp2Analysis(fileName, nPackets, ineqPerCentagePerNPackets, actualLatencyPerNPackets, optLatencyPerNPackets,
+                      ineqPerCentageImprovedPerNPackets, actualLatencyImprovedPerNPackets,
+                      optLatencyImprovedPerNPackets):
+    analysis = ""
+    resSeparator = "------------------------------------------------------------------\n"
+
+    # 先分析改进前后的ineqPerCentagePerNPackets
+    analysis += resSeparator \
+                + f"ineqPerCentagePerPackets mean of all nPackets:  {np.mean(ineqPerCentagePerNPackets)}\n" \
+                + f"improvedIneqPerCentagePerPackets mean of all nPackets:  " \
+                  f"{np.mean(ineqPerCentageImprovedPerNPackets)}\n" \
+                + resSeparator \
+                + '\n'
+
+    # 分析cost
+    maxPower = FIT_MAX_POWER
+    analysis += resSeparator \
+                + f"Fit function with maxpower {maxPower} of actualLatenciesPerNPackets:  " \
+                  f"{getFitFunc(nPackets, actualLatencyPerNPackets)}\n" \
+                + f"Fit function with maxpower {maxPower} of optLatenciesPerNPackets:  " \
+                  f"{getFitFunc(nPackets, optLatencyPerNPackets)}\n" \
+                + resSeparator
+    if exp1.hasImprovedArm(actualLatencyImprovedPerNPackets):
+        analysis += f"Fit function with maxpower {maxPower} of actualLatenciesImprovedPerNPackets:  " \
+                    f"{getFitFunc(nPackets, actualLatencyImprovedPerNPackets)}\n" \
+                    + f"Fit function with maxpower {maxPower} of optLatenciesImprovedPerNPackets:  " \
+                      f"{getFitFunc(nPackets, optLatencyImprovedPerNPackets)}\n" \
+                    + resSeparator
+    else:
+        analysis += "improved arm not run: the routing metric is static, so it would repeat the original arm\n" \
+                    + resSeparator
+    analysis += '\n'
+
+    with open(fileName, 'w') as file:
+        file.write(analysis)
+
+
+# 各nPackets的ineq占比的图
+def plotExp2Percentage(fileName, nPackets, ineqPerCentagePerNPackets, ineqPerCentageImprovedPerNPackets):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(6.4,5.5), dpi=300)
+    ax = plt.subplot(111)
+    ax.set_title("Proportion of packets with non-minimized costs\nfor each number of packet groups")
+    ax.set_xlabel("Number of packet types")
+    ax.set_ylabel("Proportion")
+    # 改进前
+    ax.plot(nPackets, ineqPerCentagePerNPackets, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=PERCENTAGE_COLOR,
+             alpha=NONFEATURE_ALPHA, label="Original")
+    ax.axhline(y=np.mean(ineqPerCentagePerNPackets), linestyle=FEATURE_LINESTYLE, color=PERCENTAGE_COLOR,
+               alpha=FEATURE_ALPHA, label="Original mean")
+    # 改进后
+    if exp1.hasImprovedArm(ineqPerCentageImprovedPerNPackets):
+        ax.plot(nPackets, ineqPerCentageImprovedPerNPackets, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
+                color=PERCENTAGE_IMPROVED_COLOR, alpha=NONFEATURE_ALPHA, label="Improved")
+        ax.axhline(y=np.mean(ineqPerCentageImprovedPerNPackets), linestyle=FEATURE_LINESTYLE,
+                   color=PERCENTAGE_IMPROVED_COLOR, alpha=FEATURE_ALPHA, label="Improved mean")
+
+    # legend设在坐标图下
+    ax.legend(ncol=2, bbox_to_anchor=(0.8, -0.15))
+    plt.tight_layout()
+    plt.savefig(fileName)
+    plt.close(fig)
+
+
+# 各nPackets的平均实际、最优延迟及其拟合的图
+def plotExp2Cost(fileName, nPackets, actualLatencyPerNPackets, optLatencyPerNPackets, actualLatencyImprovedPerNPackets,
+                 optLatencyImprovedPerNPackets):
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(6.4, 5.8), dpi=300)
+    ax = plt.subplot(111)
+    ax.set_title("Average cost per packet \nfor each number of packet groups")
+    ax.set_xlabel("Number of packet types")
+    ax.set_ylabel("Cost")
+
+    # actual cost
+    # 改进前
+    ax.plot(nPackets, actualLatencyPerNPackets, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=ACTUAL_COST_COLOR,
+            alpha=NONFEATURE_ALPHA, label="Original actual")
+    ax.plot(nPackets, getFitFunc(nPackets, actualLatencyPerNPackets)(nPackets), linestyle=FEATURE_LINESTYLE,
+            color=ACTUAL_COST_COLOR, alpha=FEATURE_ALPHA, label="Original actual fit")
+    # 改进后
+    if exp1.hasImprovedArm(actualLatencyImprovedPerNPackets):
+        ax.plot(nPackets, actualLatencyImprovedPerNPackets, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
+                color=ACTUAL_COST_IMPROVED_COLOR,
+                alpha=NONFEATURE_ALPHA, label="Improved actual")
+        ax.plot(nPackets, getFitFunc(nPackets, actualLatencyImprovedPerNPackets)(nPackets),
+                linestyle=FEATURE_LINESTYLE, color=ACTUAL_COST_IMPROVED_COLOR,
+                alpha=FEATURE_ALPHA, label="Improved actual fit")
+
+    # opt cost
+    # 改进前
+    ax.plot(nPackets, optLatencyPerNPackets, linestyle=NONFEATURE_ORIGIN_LINESTYLE, color=OPT_COST_COLOR,
+            alpha=NONFEATURE_ALPHA, label="Original optimal")
+    ax.plot(nPackets, getFitFunc(nPackets, optLatencyPerNPackets)(nPackets), linestyle=FEATURE_LINESTYLE,
+            color=OPT_COST_COLOR, alpha=FEATURE_ALPHA, label="Original optimal fit")
+    # 改进后
+    if exp1.hasImprovedArm(optLatencyImprovedPerNPackets):
+        ax.plot(nPackets, optLatencyImprovedPerNPackets, linestyle=NONFEATURE_IMPROVED_LINESTYLE,
+                color=OPT_COST_IMPROVED_COLOR,
+                alpha=NONFEATURE_ALPHA, label="Improved optimal")
+        ax.plot(nPackets, getFitFunc(nPackets, optLatencyImprovedPerNPackets)(nPackets),
+                linestyle=FEATURE_LINESTYLE, color=OPT_COST_IMPROVED_COLOR, alpha=FEATURE_ALPHA,
+                label="Improved optimal fit")
+
+    ax.legend(ncol=2, bbox_to_anchor=(0.88, -0.1))
+    plt.tight_layout()
+    plt.savefig(fileName)
+    plt.close(fig)
+
+
+#================================ 子函数 ======================================
+
+# 各nPackets改进前后差值的方差缩减，取各点的平均
+# 输入：
+#   varianceReductions：各点的crn.getVarianceReduction
+def getVarianceReductionAnalysis(varianceReductions):
+    lines = ["variance reduction of the original - improved gap, mean over nPackets:"]
+    for resName in crn.RES_NAMES:
+        stats = [pointStats[resName] for pointStats in varianceReductions]
+        factors = [stat["turnsFactor"] for stat in stats if stat["turnsFactor"] is not None]
+        factor = f"{np.mean(factors):.2f}x" if factors else "n/a"
+        lines.append(f"  {resName}: paired half-width {np.mean([stat['pairedHalfWidth'] for stat in stats]):.4f}, "
+                     f"independent {np.mean([stat['independentHalfWidth'] for stat in stats]):.4f}, "
+                     f"fewer turns {factor}")
+    return "\n".join(lines)
+
+
+# 由检查点恢复exp2的扫描状态，并恢复随机数状态
+# 输入：
+#   fileName：检查点文件名
+#   nPacketsList, nTurns, seed：本次扫描参数，须与检查点一致
+# 返回：
+#   sweepState：扫描状态，无检查点时为None
+def loadSweepState(fileName, nPacketsList, nTurns, seed):
+    sweepState = checkpoint.load(fileName)
+    if sweepState is None:
+        return None
+    if (sweepState["nPacketsList"], sweepState["nTurns"], sweepState["seed"]) != (nPacketsList, nTurns, seed):
+        raise ValueError(f"checkpoint {fileName} is for different exp2 parameters")
+    if sweepState["point"] is not None:
+        random.set_state(sweepState["point"][1]["rngState"])
+    elif "rngState" in sweepState:
+        random.set_state(sweepState["rngState"])
+    print(f"resume with {len(sweepState['pointsResults'])} nPackets done")
+    return sweepState
+
+
+# exp2一个nPackets点的实验，可在子进程中运行；取代原来的exp2PerNPackets，各轮由exp1.runTurns计算
+# 输入：
+#   nPackets：当前包种类数
+#   nTurns：重nTurns轮取平均值
+#   seedSeq：该点的np.random.SeedSequence，None时沿用全局随机状态
+#   verbose：是否打印进度
+#   runState：由检查点恢复的该点实验状态，None时从头开始
+#   checkpointEvery, saveState：见exp1.runTurns
+#   relHalfWidths：自适应轮数的目标相对半宽，None时跑满nTurns轮
+#   crnEntropy：公共随机数的种子，给出时由它新建随机流，不用seedSeq
+#   antithetic：每轮的包是否对偶抽样，须给出crnEntropy
+#   protocol：选路协议，同exp1.exp1
+# 返回：
+#   pointResults：改进前、后的各轮指标，及各轮各包延迟（实际轮数*nPackets）
+def exp2PointResults(nPackets, nTurns, seedSeq=None, verbose=True, runState=None, checkpointEvery=None,
+                     saveState=None, relHalfWidths=None, crnEntropy=None, antithetic=False, protocol=None):
+    if runState is None:
+        streams = None
+        if crnEntropy is not None:
+            streams = crn.getStreams(crnEntropy, antithetic)
+        elif seedSeq is not None:
+            random.seed(seedSeq.generate_state(4))
+        runState = exp1.newRunState(nTurns, relHalfWidths, streams, protocol)
+    if verbose:
+        print(f"num of packet types = {nPackets}: turn ", end='')
+    exp1.runTurns(runState, nPackets, verbose=verbose, checkpointEvery=checkpointEvery, saveState=saveState)
+    if verbose:
+        print()
+    return exp1.getStoreArrays(runState)
+
+
+if __name__ == "__main__":
+    nPacketsMax, nPacketsMin, nPacketsStep = 1,100,1
+    nTurns = 100
+    # exp2(nPacketsMax, nPacketsMin, nPacketsStep, nTurns)
     analyzeExp2Res(nPacketsMax, nPacketsMin, nPacketsStep)
\ No newline at end of file
@@ -0,0 +1,325 @@
+import numpy as np
+import numpy.random as random
+import heapq
+import math
+
+import src.core as core
+import src.jit as jit
+import src.profiling as profiling
+
+#=========== 稀疏图 =================
+
+# CSR存储的有向图
+# 边按(起点, 终点)升序编号，各边的量（带宽、流量、延迟）都是长度为nEdges的一维数组，
+# 内存随边数而非节点数平方增长
+#   nNodes：节点数
+#   nEdges：边数
+#   indptr：起点为u的边编号为indptr[u]到indptr[u+1]-1
+#   indices：各边终点
+#   edgeSrc：各边起点
+class Graph:
+    __slots__ = ("nNodes", "nEdges", "indptr", "indices", "edgeSrc")
+
+    def __init__(self, nNodes, indptr, indices):
+        self.nNodes = nNodes
+        self.nEdges = len(indices)
+        self.indptr = indptr
+        self.indices = indices
+        self.edgeSrc = np.repeat(np.arange(nNodes), np.diff(indptr))
+
+
+# 由边的起点、终点数组建图，重复的边只保留一条
+# 输入：
+#   nNodes：节点数
+#   srcs, dsts：各边起点、终点
+# 返回：
+#   graph
+def fromEdgeArrays(nNodes, srcs, dsts):
+    keys = np.unique(np.asarray(srcs, np.int64) * nNodes + np.asarray(dsts, np.int64))
+    srcs = keys // nNodes
+    indices = keys % nNodes
+    indptr = np.zeros(nNodes + 1, np.int64)
+    np.cumsum(np.bincount(srcs, minlength=nNodes), out=indptr[1:])
+    return Graph(nNodes, indptr, indices)
+
+
+# 由邻接表（如core.genMesh()的返回）建图
+# 输入：
+#   edges：邻接表
+# 返回：
+#   graph
+def fromEdges(edges):
+    srcs = np.repeat(np.arange(len(edges)), [len(neighbors) for neighbors in edges])
+    dsts = np.fromiter((dst for neighbors in edges for dst in neighbors), np.int64, len(srcs))
+    return fromEdgeArrays(len(edges), srcs, dsts)
+
+
+# 求(pres[i], curs[i])各边的编号
+# 输入：
+#   graph
+#   pres, curs：边的起点、终点数组
+# 返回：
+#   edgeIds：边编号数组，不存在的边为-1
+def getEdgeIds(graph, pres, curs):
+    keys = graph.edgeSrc * graph.nNodes + graph.indices
+    queries = np.asarray(pres, np.int64) * graph.nNodes + np.asarray(curs, np.int64)
+    edgeIds = np.searchsorted(keys, queries)
+    edgeIds[edgeIds == graph.nEdges] = 0
+    edgeIds[keys[edgeIds] != queries] = -1
+    return edgeIds
+
+
+# 二维矩阵中取出各边的量
+# 输入：
+#   graph
+#   matrix：nNodes*nNodes矩阵
+# 返回：
+#   values：各边的量
+def fromDense(graph, matrix):
+    return matrix[graph.edgeSrc, graph.indices]
+
+
+# 各节点的入边表，按入边起点升序，补齐到最大入度，补的为第nEdges条（不存在的边）
+# 用于按终点对所有入边做向量化的松弛
+# 输入：
+#   graph
+# 返回：
+#   inEdges：nNodes*最大入度，inEdges[v]为v的各入边编号
+def getInEdges(graph):
+    order = np.lexsort((graph.edgeSrc, graph.indices))
+    dsts = graph.indices[order]
+    inDegrees = np.bincount(dsts, minlength=graph.nNodes)
+    inEdges = np.full((graph.nNodes, inDegrees.max(initial=0)), graph.nEdges)
+    inEdges[dsts, np.arange(graph.nEdges) - np.repeat(np.cumsum(inDegrees) - inDegrees, inDegrees)] = order
+    return inEdges
+
+
+# 设置带宽，边的顺序与core.getBandwidths逐边抽取的顺序相同
+# 输入：
+#   graph
+#   lowBandwidth：最小带宽
+#   highBandwidth：最大带宽
+#   rng：numpy.random.RandomState或Generator，None时为全局随机状态
+# 返回：
+#   bandwidths：各边带宽
+def getBandwidths(graph, lowBandwidth, highBandwidth, rng=None):
+    if rng is None:
+        rng = random
+    return core.getRandomIntegers(rng, lowBandwidth, highBandwidth, graph.nEdges)
+
+
+#=========== 求最短路径 ==============
+
+# Dijkstra求src到所有节点的最短路径树
+# 以(距离, 跳数)为键，距离相同时取跳数少的，再相同取起点编号小的前驱，
+# 故0延迟的边也不会成环，结果与边的松弛顺序无关
+# 输入：
+#   graph
+#   latencies：各边延迟
+#   src：起点
+# 返回：
+#   dist：src到各节点的最短距离，不连通为inf；距离可超过MAX_LANRTENCY
+#   predEdges：各节点在最短路径上的前一条边，src和不连通的节点为-1
+def getShortestPathTree(graph, latencies, src):
+    profiling.count("sptCalls")
+    n = graph.nNodes
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    lat = latencies.tolist()
+
+    dist = [math.inf] * n
+    hops = [n] * n
+    preds = [n] * n
+    predEdges = [-1] * n
+    dist[src] = 0
+    hops[src] = 0
+    heap = [(0, 0, src)]
+    done = [False] * n
+    while heap:
+        d, h, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            if done[v]:
+                continue
+            nd = d + lat[e]
+            nh = h + 1
+            if nd < dist[v] or (nd == dist[v] and (nh < hops[v] or (nh == hops[v] and u < preds[v]))):
+                dist[v] = nd
+                hops[v] = nh
+                preds[v] = u
+                predEdges[v] = e
+                heapq.heappush(heap, (nd, nh, v))
+    return np.array(dist, float), np.array(predEdges, int)
+
+
+# 求各包src的最短路径树，只存用到的起点，内存为起点数*nNodes
+# 输入：
+#   graph
+#   latencies：各边延迟
+#   srcs：起点
+# 返回：
+#   routes：{src: predEdges}
+def getRoutes(graph, latencies, srcs):
+    routes = {}
+    for src in srcs:
+        src = int(src)
+        if src not in routes:
+            routes[src] = getShortestPathTree(graph, latencies, src)[1]
+    return routes
+
+
+# Dijkstra求src到dst的最短距离，到dst即停止
+# 输入：
+#   graph
+#   latencies：各边延迟，list
+#   src, dst：起点、终点
+# 返回：
+#   src到dst的最短距离，不连通时为inf；距离可超过MAX_LANRTENCY
+def getSrcDstLatency(graph, latencies, src, dst, indptr=None, indices=None):
+    if indptr is None:
+        indptr = graph.indptr.tolist()
+        indices = graph.indices.tolist()
+    dist = {src: 0}
+    heap = [(0, src)]
+    done = set()
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u == dst:
+            return d
+        if u in done:
+            continue
+        done.add(u)
+        for e in range(indptr[u], indptr[u + 1]):
+            v = indices[e]
+            nd = d + latencies[e]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return math.inf
+
+
+#============ 流量、延迟 ==============
+
+# 所有包同步沿最短路径树回溯，求包-边关联矩阵，列为边编号
+# 输入：
+#   graph
+#   packets：所有包
+#   routes：{src: predEdges}
+# 返回：
+#   incidence：core.Incidence
+# dst不可达（predEdges为-1）或src无最短路径树时报错；可达节点的前驱都可达，只需查dst
+def getIncidence(graph, packets, routes):
+    packets = np.asarray(packets, int).reshape(-1, 2)
+    srcList = list(routes.keys())
+    srcRows = np.full(graph.nNodes, -1)
+    srcRows[srcList] = np.arange(len(srcList))
+    predTable = np.array([routes[src] for src in srcList], int).reshape(len(srcList), graph.nNodes)
+
+    srcs = packets[:, 0]
+    curs = packets[:, 1].copy()
+    moving = srcs != curs
+    if np.any(srcRows[srcs[moving]] < 0):
+        raise ValueError("routes have no shortest path tree for some packet src")
+    unreachable = np.flatnonzero(moving)[predTable[srcRows[srcs[moving]], curs[moving]] < 0]
+    if unreachable.size > 0:
+        src, dst = packets[unreachable[0]]
+        raise ValueError(f"dst {dst} is unreachable from src {src} ({unreachable.size} packets unreachable)")
+    if core.useJit():
+        rows, cols = jit.walkTreeIncidence(predTable, srcRows, graph.edgeSrc, srcs, curs)
+        profiling.count("pathWalkSteps", len(rows))
+        return core.Incidence(len(packets), graph.nEdges, rows, cols)
+
+    active = np.flatnonzero(srcs != curs)
+    rows = [np.zeros(0, int)]
+    cols = [np.zeros(0, int)]
+    while active.size > 0:
+        edgeIds = predTable[srcRows[srcs[active]], curs[active]]
+        rows.append(active)
+        cols.append(edgeIds)
+        curs[active] = graph.edgeSrc[edgeIds]
+        active = active[curs[active] != srcs[active]]
+    profiling.count("pathWalkSteps", sum(len(r) for r in rows))
+    return core.Incidence(len(packets), graph.nEdges, np.concatenate(rows), np.concatenate(cols))
+
+
+# 由关联矩阵拆出各包经过的边编号
+def getIncidencePaths(incidence):
+    if incidence.nPackets == 0:
+        return []
+    order = np.argsort(incidence.rows, kind="stable")
+    splits = np.cumsum(np.bincount(incidence.rows, minlength=incidence.nPackets))[:-1]
+    return np.split(incidence.cols[order], splits)
+
+
+# 由各包经过的边求各边流量
+# 输入：
+#   graph
+#   paths：各包经过的边
+# 返回：
+#   flows：各边流量
+def getPathsFlows(graph, paths):
+    if len(paths) == 0:
+        return np.zeros(graph.nEdges, int)
+    return np.bincount(np.concatenate(paths), minlength=graph.nEdges)
+
+
+# 由各边流量、带宽求各边延迟ceil(flow/bandwidth)
+def getLinkLatencies(flows, bandwidths):
+    return -(-flows // bandwidths)
+
+
+# 由packets的选路routes，以及网络bandwidths，确定各链路latencies
+# 输入：
+#   graph
+#   packets：记录包src和dst的列表
+#   routes：各起点最短路径树
+#   bandwidths：各边带宽
+# 返回：
+#   latencies：各边延迟
+def getLatencies(graph, packets, routes, bandwidths):
+    return getLinkLatencies(core.getIncidenceFlows(getIncidence(graph, packets, routes)), bandwidths)
+
+
+# 求各包实际延迟
+# 输入：
+#   paths：各包经过的边
+#   linkLatencies：各边延迟
+# 返回：
+#   packetsActualLatencies：各包实际延迟
+def getPacketsActualLatencies(paths, linkLatencies):
+    return np.array([linkLatencies[path].sum() for path in paths], int)
+
+
+# 求各包单方面偏离时的最优延迟，与core.getPacketsOptLatencies(method="bestResponse")相同
+# 输入：
+#   graph
+#   packets：所有包
+#   paths：各包经过的边
+#   bandwidths：各边带宽
+#   packetsActualLatencies：各包实际延迟
+# 返回：
+#   packetsOptLatencies：各包最优延迟
+def getPacketsOptLatencies(graph, packets, paths, bandwidths, packetsActualLatencies):
+    flows = getPathsFlows(graph, paths)
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    # 包i路径外的边流量为flows+1，路径上为flows；
+    # 只转一次list，每个包改写其路径上的边，求完再改回
+    tmpLatencies = getLinkLatencies(flows + 1, bandwidths).tolist()
+    onPathLatencies = getLinkLatencies(flows, bandwidths).tolist()
+    profiling.count("packetsEvaluated", len(packets))
+    packetsOptLatencies = np.zeros(len(packets), int)
+    for i, path in enumerate(paths):
+        path = path.tolist()
+        saved = [tmpLatencies[e] for e in path]
+        for e in path:
+            tmpLatencies[e] = onPathLatencies[e]
+        src, dst = packets[i]
+        optLatency = getSrcDstLatency(graph, tmpLatencies, src, dst, indptr, indices)
+        for e, latency in zip(path, saved):
+            tmpLatencies[e] = latency
+        packetsOptLatencies[i] = min(optLatency, packetsActualLatencies[i])
+    return packetsOptLatencies
@@ -0,0 +1,180 @@
+import numpy as np
+
+import src.core as core
+import src.graph as graph
+import src.profiling as profiling
+
+# ============== 增量全源最短路 =============
+# 保留上一轮的D、PI，本轮只重算受变化的边影响的起点行，变化的边太多时全部重算
+# 选路与core.getShortestPaths（Floyd-Warshall，仅严格更短时更新）完全相同：
+#   Floyd-Warshall在第k轮首次达到最短距离时把PI[i, j]取为PI[k, j]，之后不再变；
+#   k即所有最短路径中最大中间节点最小者的最大中间节点k*(i, j)，直接相连的边已最短时k*为-1，PI[i, j] = i
+#   k*(i, j)只由起点i的最短路径DAG（D[i, u] + 延迟 == D[i, v]的边）决定，按中间节点的minimax路径求；
+#   PI[k*, j]中k*(k*, j) < k*，按k*从小到大即可逐个取得
+# 起点到自身：D[i, i]为经过i的最短环长，PI[i, i]同样按k*(i, i)取；无环时为MAX_LANRTENCY、-1
+# 只走有带宽的边；设各节点对的最短距离小于MAX_LANRTENCY，与Floyd-Warshall把MAX_LANRTENCY当作无边一致
+
+# 变化的边超过该比例时全部重算
+MAX_CHANGED_FRACTION = 0.5
+# 不可达的距离，相加不溢出
+INF_DIST = np.iinfo(np.int64).max // 4
+
+
+# 增量全源最短路的状态
+#   graph：有带宽的边构成的graph.Graph
+#   inEdges：graph.getInEdges(graph)
+#   latencies：上次求解时各边延迟，None时下次全部重算
+#   D, PI：上次的结果，与core.getShortestPaths的返回格式相同
+#   maxChangedFraction：变化的边超过该比例时全部重算，None时为MAX_CHANGED_FRACTION
+class ShortestPathsEngine:
+    __slots__ = ("graph", "inEdges", "latencies", "D", "PI", "maxChangedFraction")
+
+    def __init__(self, bandwidths, maxChangedFraction=None):
+        if maxChangedFraction is None:
+            maxChangedFraction = MAX_CHANGED_FRACTION
+        self.graph = graph.fromEdgeArrays(bandwidths.shape[0], *np.nonzero(bandwidths))
+        self.inEdges = graph.getInEdges(self.graph)
+        self.latencies = None
+        self.D = None
+        self.PI = None
+        self.maxChangedFraction = maxChangedFraction
+
+
+# 求所有节点对最短路径，修补上次的结果
+# 输入：
+#   engine：ShortestPathsEngine
+#   latencies：当前各边延迟，二维矩阵
+# 返回：
+#   D, PI：同core.getShortestPaths；为engine中的数组，下次调用时原地修改
+def getShortestPaths(engine, latencies):
+    csrGraph = engine.graph
+    edgeLatencies = graph.fromDense(csrGraph, latencies).astype(np.int64)
+
+    if engine.latencies is None:
+        srcs = np.arange(csrGraph.nNodes)
+    else:
+        changed = np.flatnonzero(edgeLatencies != engine.latencies)
+        if len(changed) > engine.maxChangedFraction * csrGraph.nEdges:
+            srcs = np.arange(csrGraph.nNodes)
+        else:
+            srcs = getAffectedSrcs(engine, changed, edgeLatencies)
+
+    if len(srcs) == csrGraph.nNodes:
+        profiling.count("apspFullRecomputes")
+        engine.D = np.empty((csrGraph.nNodes, csrGraph.nNodes), int)
+        engine.PI = np.empty((csrGraph.nNodes, csrGraph.nNodes), int)
+    else:
+        profiling.count("apspRepairs")
+    if len(srcs) > 0:
+        updateSrcsShortestPaths(engine, edgeLatencies, srcs)
+    profiling.count("apspRowsComputed", len(srcs))
+    engine.latencies = edgeLatencies
+    return engine.D, engine.PI
+
+
+# 求要重算的起点：起点i的最短路径DAG变化时，其D、PI行才可能变化
+#   延迟增大的边(u, v)原在DAG上：D[i, u] + 原延迟 == D[i, v]；
+#   或延迟减小的边(u, v)使D[i, u] + 新延迟 <= D[i, v]，加入DAG或缩短距离；
+#   或变化的边指向起点，经过起点的最短环可能变化
+# 其余起点的DAG不变，其PI行引用的各行k*也不变
+# 输入：
+#   engine
+#   changed：延迟变化的边编号
+#   edgeLatencies：当前各边延迟
+# 返回：
+#   srcs：要重算的起点
+def getAffectedSrcs(engine, changed, edgeLatencies):
+    csrGraph = engine.graph
+    n = csrGraph.nNodes
+    us = csrGraph.edgeSrc[changed]
+    vs = csrGraph.indices[changed]
+    increased = edgeLatencies[changed] > engine.latencies[changed]
+    # 起点到自身的距离取0
+    D = engine.D.astype(np.int64)
+    D[np.arange(n), np.arange(n)] = 0
+    reachable = D[:, us] < core.MAX_LANRTENCY
+
+    affected = np.zeros(n, bool)
+    affected[vs] = True
+    if np.any(increased):
+        tight = D[:, us[increased]] + engine.latencies[changed[increased]] == D[:, vs[increased]]
+        affected |= np.any(tight & reachable[:, increased], axis=1)
+    decreased = ~increased
+    if np.any(decreased):
+        viaEdge = D[:, us[decreased]] + edgeLatencies[changed[decreased]]
+        affected |= np.any((viaEdge <= D[:, vs[decreased]]) & reachable[:, decreased], axis=1)
+    return np.flatnonzero(affected)
+
+
+# 重算srcs各起点的D、PI行，写入engine
+# 先批量Bellman-Ford求距离，再在各起点的最短路径DAG上求k*，最后按k*从小到大取PI[k*, j]
+# 各数组存为(nNodes, 起点数)，起点维在最后，按入边取起点的值时为整行连续复制
+# 输入：
+#   engine：D、PI中srcs以外的行须为当前的结果
+#   edgeLatencies：各边延迟
+#   srcs：起点
+def updateSrcsShortestPaths(engine, edgeLatencies, srcs):
+    csrGraph = engine.graph
+    n = csrGraph.nNodes
+    nSrcs = len(srcs)
+    cols = np.arange(nSrcs)
+    inEdges = engine.inEdges
+    # 各入边的起点、延迟，补的边为INF_DIST
+    valid = inEdges < csrGraph.nEdges
+    inSrcs = np.append(csrGraph.edgeSrc, 0)[inEdges]
+    inLatencies = np.append(edgeLatencies, INF_DIST)[inEdges][:, :, None]
+
+    # 距离，起点到自身为0
+    dists = np.full((n, nSrcs), INF_DIST, np.int64)
+    dists[srcs, cols] = 0
+    for _ in range(n - 1):
+        newDists = dists.copy()
+        for k in range(inEdges.shape[1]):
+            np.minimum(newDists, dists[inSrcs[:, k]] + inLatencies[:, k], out=newDists)
+        if np.array_equal(newDists, dists):
+            break
+        dists = newDists
+    # 经过起点的最短环长
+    cycles = np.full(nSrcs, INF_DIST, np.int64)
+    for k in range(inEdges.shape[1]):
+        np.minimum(cycles, dists[inSrcs[srcs, k], cols] + inLatencies[srcs, k, 0], out=cycles)
+    reachable = dists < core.MAX_LANRTENCY
+    reachable[srcs, cols] = cycles < core.MAX_LANRTENCY
+
+    # 最短路径DAG上的边：tight[v, k, 起点]为v的第k条入边是否在DAG上；到起点自身的按最短环
+    targets = dists.copy()
+    targets[srcs, cols] = cycles
+    tight = np.stack([valid[:, k, None] & (dists[inSrcs[:, k]] + inLatencies[:, k] == targets)
+                      for k in range(inEdges.shape[1])], axis=1) & reachable[:, None, :]
+    # k*：最大中间节点的最小值，从起点直接到达时为-1；不可达为n
+    isSrc = inSrcs[:, :, None] == srcs
+    kStars = np.full((n, nSrcs), n)
+    for _ in range(n):
+        newKStars = np.full((n, nSrcs), n)
+        for k in range(inEdges.shape[1]):
+            u = inSrcs[:, k, None]
+            viaU = np.where(isSrc[:, k], -1, np.maximum(kStars[inSrcs[:, k]], u))
+            np.minimum(newKStars, np.where(tight[:, k], viaU, n), out=newKStars)
+        # 到起点自身的路径从起点出发，起点不是中间节点
+        kStarsFromSrc = newKStars[srcs, cols].copy()
+        newKStars[srcs, cols] = -1
+        if np.array_equal(newKStars, kStars):
+            break
+        kStars = newKStars
+    kStars[srcs, cols] = kStarsFromSrc
+
+    D = np.where(reachable, dists, core.MAX_LANRTENCY).T.astype(int)
+    D[cols, srcs] = np.where(reachable[srcs, cols], cycles, core.MAX_LANRTENCY)
+    engine.D[srcs] = D
+    kStars = kStars.T
+    PI = np.full((nSrcs, n), -1)
+    PI[kStars == -1] = np.broadcast_to(srcs[:, None], (nSrcs, n))[kStars == -1]
+    engine.PI[srcs] = PI
+    # PI[i, j] = PI[k*, j]，k*(k*, j) < k*，按k*从小到大时PI[k*, j]已是本轮的结果
+    rows, dsts = np.nonzero((kStars >= 0) & (kStars < n))
+    order = np.argsort(kStars[rows, dsts], kind="stable")
+    rows, dsts = rows[order], dsts[order]
+    kStarValues = kStars[rows, dsts]
+    bounds = np.flatnonzero(np.diff(kStarValues)) + 1
+    for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(rows)]):
+        engine.PI[srcs[rows[start:stop]], dsts[start:stop]] = engine.PI[kStarValues[start], dsts[start:stop]]
@@ -0,0 +1,162 @@
+import functools
+import importlib.util
+import warnings
+
+import numpy as np
+
+# ============== Numba编译的路径回溯 =============
+# 沿前驱回溯路径、累计流量的循环，用Numba编译后每跳不再经过Python的逐元素索引
+# Numba为可选依赖，未安装时AVAILABLE为False，core、graph使用原来的NumPy实现；
+# 导入本模块时只查找Numba，不导入；core.useJit首次判断后端时由isAvailable导入，
+# 装了但导入失败（版本不配、llvmlite损坏等）时告警，AVAILABLE置为False，回退到NumPy实现；
+# 各函数首次调用时才编译，编译结果缓存到__pycache__，之后的运行不再重新编译
+# 各函数与对应的NumPy实现结果完全相同，包括关联矩阵中非零元的顺序
+
+# 找到Numba时先为True，isAvailable导入失败后为False
+AVAILABLE = importlib.util.find_spec("numba") is not None
+# isAvailable是否已尝试导入
+imported = False
+
+
+# Numba能否使用：首次调用时导入，失败则告警并把AVAILABLE置为False
+def isAvailable():
+    global AVAILABLE, imported
+    if AVAILABLE and not imported:
+        imported = True
+        try:
+            import numba
+        except Exception as error:
+            warnings.warn(f"numba is installed but failed to import, using the NumPy path walks: {error!r}")
+            AVAILABLE = False
+    return AVAILABLE
+
+
+# 首次调用时导入Numba、编译并缓存到磁盘，之后直接调用编译结果
+def njit(func):
+    compiled = None
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        nonlocal compiled
+        if compiled is None:
+            import numba
+            compiled = numba.njit(cache=True)(func)
+        return compiled(*args)
+    return wrapper
+
+
+# 所有包同步沿前驱节点矩阵回溯，同core.getIncidence：
+# 先逐包数出总跳数，再按步、同一步内按包编号填入关联矩阵
+# 输入：
+#   PI：(B, N, N)前驱节点矩阵
+#   batches, srcs, dsts：各包所在网络、起点、终点
+# 返回：
+#   rows, cols：关联矩阵的非零元，列为(batch*N+pre)*N+cur
+@njit
+def walkIncidence(PI, batches, srcs, dsts):
+    n = PI.shape[-1]
+    nPackets = len(srcs)
+    nSteps = 0
+    for i in range(nPackets):
+        cur = dsts[i]
+        while cur != srcs[i]:
+            cur = PI[batches[i], srcs[i], cur]
+            nSteps += 1
+
+    rows = np.empty(nSteps, np.int64)
+    cols = np.empty(nSteps, np.int64)
+    curs = dsts.copy()
+    active = np.empty(nPackets, np.int64)
+    nActive = 0
+    for i in range(nPackets):
+        if srcs[i] != curs[i]:
+            active[nActive] = i
+            nActive += 1
+    k = 0
+    while nActive > 0:
+        nNext = 0
+        for a in range(nActive):
+            i = active[a]
+            pre = PI[batches[i], srcs[i], curs[i]]
+            rows[k] = i
+            cols[k] = (batches[i] * n + pre) * n + curs[i]
+            k += 1
+            curs[i] = pre
+            if pre != srcs[i]:
+                active[nNext] = i
+                nNext += 1
+        nActive = nNext
+    return rows, cols
+
+
+# 所有包同步沿最短路径树回溯，同graph.getIncidence；各包dst的可达性由调用方先查过
+# 输入：
+#   predTable：各起点的predEdges，(起点数, N)
+#   srcRows：起点在predTable中的行
+#   edgeSrc：各边起点
+#   srcs, dsts：各包起点、终点
+# 返回：
+#   rows, cols：关联矩阵的非零元，列为边编号
+@njit
+def walkTreeIncidence(predTable, srcRows, edgeSrc, srcs, dsts):
+    nPackets = len(srcs)
+    nSteps = 0
+    for i in range(nPackets):
+        cur = dsts[i]
+        while cur != srcs[i]:
+            cur = edgeSrc[predTable[srcRows[srcs[i]], cur]]
+            nSteps += 1
+
+    rows = np.empty(nSteps, np.int64)
+    cols = np.empty(nSteps, np.int64)
+    curs = dsts.copy()
+    active = np.empty(nPackets, np.int64)
+    nActive = 0
+    for i in range(nPackets):
+        if srcs[i] != curs[i]:
+            active[nActive] = i
+            nActive += 1
+    k = 0
+    while nActive > 0:
+        nNext = 0
+        for a in range(nActive):
+            i = active[a]
+            e = predTable[srcRows[srcs[i]], curs[i]]
+            rows[k] = i
+            cols[k] = e
+            k += 1
+            curs[i] = edgeSrc[e]
+            if curs[i] != srcs[i]:
+                active[nNext] = i
+                nNext += 1
+        nActive = nNext
+    return rows, cols
+
+
+# 沿前驱节点矩阵累计包延迟，同core.getPacketLatency
+@njit
+def walkPacketLatency(PI, linkLatencies, src, dst):
+    cur = dst
+    pre = PI[src, dst]
+    packetLatency = linkLatencies[pre, cur]
+    while pre != src:
+        cur = pre
+        pre = PI[src, cur]
+        packetLatency += linkLatencies[pre, cur]
+    return packetLatency
+
+
+# 除第skip个包外，各包沿前驱节点矩阵回溯，在flows上累计流量，同core.getLeaveOneOutLatencies
+@njit
+def walkFlows(PI, srcs, dsts, skip, flows):
+    for i in range(len(srcs)):
+        if i == skip:
+            continue
+        src = srcs[i]
+        mid = dsts[i]
+        pre = PI[src, mid]
+        while pre != src:
+            flows[pre, mid] += 1
+            mid = pre
+            pre = PI[src, mid]
+        flows[pre, mid] += 1
@@ -0,0 +1,112 @@
+import numpy as np
+
+import src.core as core
+import src.incremental as incremental
+import src.protocols as protocols
+import src.profiling as profiling
+
+#=========== 网络 =================
+
+# 一个稠密网络的仿真上下文：拓扑、带宽，及各轮、各包复用的工作缓冲区
+# 大小、包数、求最优延迟的方法都属于实例，不读写core的MESH_LEN、N_NODES、N_PACKETS，
+# 同一进程中可同时运行多个不同大小的网络
+#   nNodes：节点数
+#   edges：邻接表
+#   bandwidths：各边带宽的二维矩阵
+#   neighbors：各节点邻居列表
+#   nPackets：每轮包数
+#   optLatencyMethod：求最优延迟的方法，None时为core.OPT_LATENCY_METHOD
+#   shortestPathsBuffers：本轮实际选路的全源最短路缓冲区
+#   optLatencyBuffers：求各包最优延迟的缓冲区
+#   lastPI：上一次getPacketsLatencies实际选路的前驱节点矩阵，供记录；可能为缓冲区，下一次调用前有效
+class Network:
+    __slots__ = ("nNodes", "edges", "bandwidths", "neighbors", "nPackets", "optLatencyMethod",
+                 "shortestPathsBuffers", "optLatencyBuffers", "lastPI")
+
+    def __init__(self, edges, bandwidths, nPackets=core.N_PACKETS, optLatencyMethod=None):
+        self.nNodes = len(edges)
+        self.edges = edges
+        self.bandwidths = bandwidths
+        self.neighbors = core.getNeighbors(bandwidths)
+        self.nPackets = nPackets
+        self.optLatencyMethod = optLatencyMethod
+        self.shortestPathsBuffers = core.ShortestPathsBuffers(self.nNodes)
+        self.optLatencyBuffers = core.OptLatencyBuffers(self.nNodes)
+        self.lastPI = None
+
+
+# 由meshLen*meshLen的网格建网络，随机设置带宽
+# 输入：
+#   meshLen：网格边长
+#   lowBandwidth, highBandwidth：带宽上下界
+#   nPackets, optLatencyMethod：同Network
+# 返回：
+#   network
+def fromMesh(meshLen, lowBandwidth, highBandwidth, nPackets=core.N_PACKETS, optLatencyMethod=None):
+    edges = core.genMesh(meshLen)
+    bandwidths = core.getBandwidths(edges, lowBandwidth, highBandwidth)
+    return Network(edges, bandwidths, nPackets, optLatencyMethod)
+
+
+# 由已有的带宽矩阵建网络，有带宽的边即为网络的边
+# 输入：
+#   bandwidths：各边带宽的二维矩阵
+#   nPackets, optLatencyMethod：同Network
+# 返回：
+#   network
+def fromBandwidths(bandwidths, nPackets=core.N_PACKETS, optLatencyMethod=None):
+    edges = [np.flatnonzero(row).tolist() for row in bandwidths]
+    return Network(edges, bandwidths, nPackets, optLatencyMethod)
+
+
+# 产生本轮的包
+# 输入：
+#   network
+#   nPackets：包数，None时为network.nPackets
+# 返回：
+#   packets
+def genPackets(network, nPackets=None):
+    if nPackets is None:
+        nPackets = network.nPackets
+    return core.genPackets(nPackets, network.nNodes)
+
+
+# 求本轮各包实际、最优延迟，全源最短路及串行求最优延迟时用network的缓冲区
+# 输入：
+#   network
+#   lastLinkLatencies：上一轮各边延迟
+#   packets：包，或traffic.Demand，此时各包延迟为各(src, dst)对的延迟
+#   executor：求各包最优延迟用的线程池或进程池，None时串行
+#   engine：incremental.ShortestPathsEngine，给出时修补其上一轮的最短路径，None时用Floyd-Warshall
+#   routing：protocols.Routing，给出时按其协议的度量选路，None时按lastLinkLatencies
+# 输出：
+#   curLinklatencies：本轮各边延迟，新分配，可留作下一轮的lastLinkLatencies
+#   packetsActualLatencies, packetsOptLatencies：本轮各包实际、最优延迟
+def getPacketsLatencies(network, lastLinkLatencies, packets, executor=None, engine=None, routing=None):
+    bandwidths = network.bandwidths
+    # 这一轮的实际选路
+    with profiling.stage("getShortestPaths"):
+        if routing is not None:
+            D, PI = protocols.getShortestPaths(routing, lastLinkLatencies, network.shortestPathsBuffers, engine)
+        elif engine is None:
+            D, PI = core.getShortestPaths(lastLinkLatencies, network.shortestPathsBuffers)
+        else:
+            D, PI = incremental.getShortestPaths(engine, lastLinkLatencies)
+    network.lastPI = PI
+    # 这一轮选路的包-边关联矩阵，选路造成的延迟
+    with profiling.stage("getLatencies"):
+        pairs, counts = core.getPairs(packets)
+        incidence = core.getIncidence(pairs, PI)
+        curLinklatencies = core.getLinkLatencies(core.getIncidenceFlows(incidence, counts).reshape(PI.shape),
+                                                 bandwidths)
+
+    # 这一轮各包实际、最优延迟
+    with profiling.stage("getPacketsActualLatencies"):
+        packetsActualLatencies = core.getIncidenceLatencies(incidence, curLinklatencies)
+    with profiling.stage("getPacketsOptLatencies"):
+        packetsOptLatencies = core.getPacketsOptLatencies(packets, PI, bandwidths, packetsActualLatencies,
+                                                          method=network.optLatencyMethod, executor=executor,
+                                                          neighbors=network.neighbors,
+                                                          buffers=network.optLatencyBuffers)
+
+    return curLinklatencies, packetsActualLatencies, packetsOptLatencies
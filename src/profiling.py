@@ -0,0 +1,134 @@
+import json
+import time
+
+# ============== 性能剖析 =============
+# 各阶段计时、计数器（全源最短路次数、路径回溯步数、求最优延迟的包数等），以及每轮的回调或结构化日志
+# 未开启时stage()返回空的上下文，count()只做一次判断，几乎无开销
+# 只统计当前进程，exp2并行时子进程中的不计入
+
+ENABLED = False
+
+# 累计：{阶段: [调用次数, 总用时]}，{计数器: 值}
+stageTotals = {}
+counters = {}
+# 本轮：{阶段: 用时}，{计数器: 值}
+roundTimes = {}
+roundCounters = {}
+# 每轮结束时调用roundCallback(record)，并写一行json到roundLog
+roundCallback = None
+roundLog = None
+
+
+# 开启剖析，清空已有统计
+# 输入：
+#   callback：每轮结束时调用callback(record)，record为该轮各阶段用时和计数
+#   logFileName：每轮的record按json逐行追加到该文件
+def enable(callback=None, logFileName=None):
+    global ENABLED, roundCallback, roundLog
+    disable()
+    reset()
+    roundCallback = callback
+    if logFileName is not None:
+        roundLog = open(logFileName, "a")
+    ENABLED = True
+
+
+# 关闭剖析，保留已有统计
+def disable():
+    global ENABLED, roundCallback, roundLog
+    ENABLED = False
+    roundCallback = None
+    if roundLog is not None:
+        roundLog.close()
+        roundLog = None
+
+
+# 清空统计
+def reset():
+    stageTotals.clear()
+    counters.clear()
+    roundTimes.clear()
+    roundCounters.clear()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *excInfo):
+        seconds = time.perf_counter() - self.start
+        total = stageTotals.setdefault(self.name, [0, 0.0])
+        total[0] += 1
+        total[1] += seconds
+        roundTimes[self.name] = roundTimes.get(self.name, 0.0) + seconds
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+# 阶段计时，用法：with profiling.stage("getShortestPaths"): ...
+def stage(name):
+    if ENABLED:
+        return _Stage(name)
+    return _NULL_STAGE
+
+
+# 计数器加n
+def count(name, n=1):
+    if ENABLED:
+        counters[name] = counters.get(name, 0) + n
+        roundCounters[name] = roundCounters.get(name, 0) + n
+
+
+# 一轮结束：生成该轮的record，交给回调和日志，再清空本轮统计
+# 输入：
+#   info：写入record的其他信息，如turn、nPackets
+def endRound(**info):
+    if not ENABLED:
+        return
+    record = dict(info)
+    record["stages"] = dict(roundTimes)
+    record["counters"] = dict(roundCounters)
+    if roundCallback is not None:
+        roundCallback(record)
+    if roundLog is not None:
+        roundLog.write(json.dumps(record) + "\n")
+        roundLog.flush()
+    roundTimes.clear()
+    roundCounters.clear()
+
+
+# 汇总表：各阶段调用次数、总用时、平均用时、占比，及各计数器
+def summary():
+    lines = []
+    allSeconds = sum(total[1] for total in stageTotals.values())
+    lines.append(f"{'stage':<32}{'calls':>10}{'total s':>12}{'mean ms':>12}{'share':>9}")
+    for name, (calls, seconds) in sorted(stageTotals.items(), key=lambda item: -item[1][1]):
+        share = seconds / allSeconds if allSeconds > 0 else 0
+        lines.append(f"{name:<32}{calls:>10}{seconds:>12.3f}{seconds / calls * 1e3:>12.3f}{share:>9.1%}")
+    if counters:
+        lines.append(f"{'counter':<32}{'value':>10}")
+        for name, value in sorted(counters.items()):
+            lines.append(f"{name:<32}{value:>10}")
+    # 求最优延迟时同(src, dst)类的命中率
+    lookups = counters.get("optLatencyCacheHits", 0) + counters.get("optLatencyCacheMisses", 0)
+    if lookups > 0:
+        lines.append(f"{'optLatencyCacheHitRate':<32}{counters.get('optLatencyCacheHits', 0) / lookups:>10.1%}")
+    return "\n".join(lines)
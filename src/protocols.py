@@ -0,0 +1,138 @@
+import numpy as np
+
+import src.core as core
+import src.incremental as incremental
+import src.profiling as profiling
+
+# ============== 路由协议的选路度量 =============
+# 原有的选路依据为上一轮各边延迟ceil(flow/bandwidth)；各协议由带宽、上一轮延迟求各边代价，再按代价求全源最短路：
+#   rip：跳数，每条边代价为1
+#   ospf：参考带宽/带宽，取整且至少为1，同OSPF的接口代价
+#   isis：同ospf，取值限于窄度量的[1, ISIS_MAX_METRIC]
+#   eigrp：K1*参考带宽/带宽 + K3*延迟，延迟为上一轮各边延迟
+#          EIGRP的带宽项按路径上的最小带宽计，不能沿路径相加，选路也就无法用前驱节点矩阵表示，这里按各边相加
+# 代价与上一轮延迟无关的度量为静态，最短路只在第一轮求一次，之后各轮直接用缓存；改进前后选路相同，不跑改进后一组
+# 代价须为整数，无边处为MAX_LANRTENCY；新的度量可用register加入
+
+# 原有的选路依据，不经过本模块
+LATENCY = "latency"
+OSPF_REFERENCE_BANDWIDTH = 12
+ISIS_REFERENCE_BANDWIDTH = 12
+ISIS_MAX_METRIC = 63
+EIGRP_REFERENCE_BANDWIDTH = 12
+EIGRP_K1 = 1
+EIGRP_K3 = 1
+
+
+# 选路度量
+#   name：协议名
+#   getCosts：getCosts(bandwidths, lastLatencies)求各边代价
+#   static：代价是否与lastLatencies无关
+class Metric:
+    __slots__ = ("name", "getCosts", "static")
+
+    def __init__(self, name, getCosts, static):
+        self.name = name
+        self.getCosts = getCosts
+        self.static = static
+
+
+# {协议名: Metric}
+METRICS = {}
+
+
+# 加入选路度量，同名时替换
+def register(name, getCosts, static):
+    METRICS[name] = Metric(name, getCosts, static)
+
+
+def getMetric(name):
+    if name not in METRICS:
+        raise ValueError(f"unknown routing protocol: {name}, expected {LATENCY} or one of {sorted(METRICS)}")
+    return METRICS[name]
+
+
+# 有边处取costs，无边处为MAX_LANRTENCY
+def getEdgeCosts(bandwidths, costs):
+    edgeCosts = np.full(bandwidths.shape, core.MAX_LANRTENCY, int)
+    hasEdge = bandwidths != 0
+    edgeCosts[hasEdge] = np.broadcast_to(costs, bandwidths.shape)[hasEdge]
+    return edgeCosts
+
+
+# 参考带宽/带宽，取整，限于[1, maxMetric]
+def getInverseBandwidthCosts(bandwidths, reference, maxMetric=None):
+    costs = np.maximum(reference // np.maximum(bandwidths, 1), 1)
+    if maxMetric is not None:
+        costs = np.minimum(costs, maxMetric)
+    return getEdgeCosts(bandwidths, costs)
+
+
+def getRipCosts(bandwidths, lastLatencies):
+    return getEdgeCosts(bandwidths, 1)
+
+
+def getOspfCosts(bandwidths, lastLatencies):
+    return getInverseBandwidthCosts(bandwidths, OSPF_REFERENCE_BANDWIDTH)
+
+
+def getIsisCosts(bandwidths, lastLatencies):
+    return getInverseBandwidthCosts(bandwidths, ISIS_REFERENCE_BANDWIDTH, ISIS_MAX_METRIC)
+
+
+def getEigrpCosts(bandwidths, lastLatencies):
+    bandwidthCosts = EIGRP_REFERENCE_BANDWIDTH // np.maximum(bandwidths, 1)
+    return getEdgeCosts(bandwidths, EIGRP_K1 * bandwidthCosts + EIGRP_K3 * np.asarray(lastLatencies, int))
+
+
+register("rip", getRipCosts, True)
+register("ospf", getOspfCosts, True)
+register("isis", getIsisCosts, True)
+register("eigrp", getEigrpCosts, False)
+
+
+# 是否跑改进后一组：改进只改上一轮延迟，静态度量的选路与之无关，改进前后完全相同，只跑改进前一组
+def hasImprovedArm(name):
+    return name is None or name == LATENCY or not getMetric(name).static
+
+
+# 一个网络上按某协议选路，缓存静态度量的最短路
+#   metric：Metric
+#   bandwidths：各边带宽
+#   D, PI：静态度量的最短路，第一次求之前为None
+class Routing:
+    __slots__ = ("metric", "bandwidths", "D", "PI")
+
+    def __init__(self, name, bandwidths):
+        self.metric = getMetric(name)
+        self.bandwidths = bandwidths
+        self.D = None
+        self.PI = None
+
+
+# 按协议选路的Routing，原有的选路依据时为None
+def getRouting(name, bandwidths):
+    if name is None or name == LATENCY:
+        return None
+    return Routing(name, bandwidths)
+
+
+# 本轮按协议的最短路
+# 输入：
+#   routing：Routing
+#   lastLatencies：上一轮各边延迟，静态度量时不用
+#   buffers：core.ShortestPathsBuffers，动态度量且不给engine时使用
+#   engine：incremental.ShortestPathsEngine，给出时动态度量修补其上一轮的最短路径
+# 返回：
+#   D, PI：静态度量时为缓存，不可修改
+def getShortestPaths(routing, lastLatencies, buffers=None, engine=None):
+    if routing.metric.static:
+        if routing.PI is None:
+            routing.D, routing.PI = core.getShortestPaths(routing.metric.getCosts(routing.bandwidths, None))
+        else:
+            profiling.count("staticRoutingCacheHits")
+        return routing.D, routing.PI
+    costs = routing.metric.getCosts(routing.bandwidths, lastLatencies)
+    if engine is None:
+        return core.getShortestPaths(costs, buffers)
+    return incremental.getShortestPaths(engine, costs)
@@ -0,0 +1,70 @@
+import numpy as np
+
+# ============== 自适应轮数 =============
+# 每轮后求各指标均值的置信区间，各指标的半宽都不超过均值的目标比例时提前停止，否则跑满最大轮数
+# 用相对半宽：各包平均延迟随包数增长，同一绝对半宽对不同nPackets的难度不同
+# 相邻轮的指标相关（上一轮延迟决定本轮选路），用批均值法：前面的各轮平均分成N_BATCHES批，
+# 由各批均值的标准差估计总均值的标准误，比把各轮当作独立样本保守
+
+# 置信水平95%的正态分位数
+Z = 1.959963984540054
+# 95%双侧置信区间的t分布分位数，自由度1到30；更大的自由度用getTQuantile中的展开式
+T_QUANTILES = [12.7062, 4.3027, 3.1824, 2.7764, 2.5706, 2.4469, 2.3646, 2.3060, 2.2622, 2.2281,
+               2.2010, 2.1788, 2.1604, 2.1448, 2.1314, 2.1199, 2.1098, 2.1009, 2.0930, 2.0860,
+               2.0796, 2.0739, 2.0687, 2.0639, 2.0595, 2.0555, 2.0518, 2.0484, 2.0452, 2.0423]
+# 批数；批均值的t分位数自由度为N_BATCHES-1，10批时为2.262
+N_BATCHES = 10
+# 至少跑的轮数
+MIN_TURNS = 20
+# 默认目标相对半宽：{指标名: 半宽/|均值|}，改进前、后分别判断
+REL_HALF_WIDTHS = {
+    "ineqPerCentages": 0.05,
+    "allPacketsAvgActualLatencies": 0.05,
+    "ineqPerCentagesImproved": 0.05,
+    "allPacketsAvgActualLatenciesImproved": 0.05,
+}
+
+
+# 95%双侧置信区间的t分布分位数
+# 输入：
+#   df：自由度
+# 返回：
+#   分位数；df超过30时用正态分位数的Cornish-Fisher展开，误差小于1e-6
+def getTQuantile(df):
+    if df <= len(T_QUANTILES):
+        return T_QUANTILES[df - 1]
+    g1 = (Z**3 + Z) / 4
+    g2 = (5 * Z**5 + 16 * Z**3 + 3 * Z) / 96
+    g3 = (3 * Z**7 + 19 * Z**5 + 17 * Z**3 - 15 * Z) / 384
+    g4 = (79 * Z**9 + 776 * Z**7 + 1482 * Z**5 - 1920 * Z**3 - 945 * Z) / 92160
+    return Z + g1 / df + g2 / df**2 + g3 / df**3 + g4 / df**4
+
+
+# 批均值法求各轮值均值的置信区间半宽，各批均值近似独立正态，用自由度N_BATCHES-1的t分位数
+# 输入：
+#   values：各轮值
+# 返回：
+#   halfWidth：每批不足一轮时为inf
+def getHalfWidth(values):
+    batchSize = len(values) // N_BATCHES
+    if batchSize == 0:
+        return np.inf
+    batchMeans = np.mean(np.reshape(values[:batchSize * N_BATCHES], (N_BATCHES, batchSize)), axis=1)
+    return getTQuantile(N_BATCHES - 1) * np.std(batchMeans, ddof=1) / np.sqrt(N_BATCHES)
+
+
+# 前nTurns轮后是否可停止
+# 输入：
+#   results：{指标名: 各轮值列表}，如exp1的实验状态
+#   nTurns：已完成的轮数
+#   relHalfWidths：{指标名: 目标相对半宽}
+# 返回：
+#   是否所有指标的半宽都已不超过目标相对半宽*|均值|；各轮全相同（如ineq全为0）时半宽为0，可停止
+def isConverged(results, nTurns, relHalfWidths):
+    if nTurns < MIN_TURNS:
+        return False
+    for resName, relHalfWidth in relHalfWidths.items():
+        values = results[resName][:nTurns]
+        if getHalfWidth(values) > relHalfWidth * abs(np.mean(values)):
+            return False
+    return True
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# ============== 二进制结果存储 =============
+# 一个结果为一个目录：每个数组一个.npy文件，加一个meta.json元数据（MESH_LEN、带宽上下界、种子、轮数等）
+# 读取时以mmap方式打开.npy，不复制数据
+
+META_FNAME = "meta.json"
+ARRAY_EXT = ".npy"
+
+
+# 保存结果：先写到同级临时目录，再替换旧目录
+# 输入：
+#   dirName：结果目录
+#   arrays：{名字: 数组}
+#   meta：元数据字典，可json序列化
+def save(dirName, arrays, meta):
+    dirName = os.path.abspath(dirName)
+    parent = os.path.dirname(dirName)
+    os.makedirs(parent, exist_ok=True)
+    tmpDirName = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmpDirName, name + ARRAY_EXT), np.ascontiguousarray(array))
+        with open(os.path.join(tmpDirName, META_FNAME), "w") as file:
+            json.dump(meta, file, indent=2)
+
+        oldDirName = None
+        if os.path.exists(dirName):
+            oldDirName = tempfile.mkdtemp(dir=parent, prefix=".old-")
+            os.rmdir(oldDirName)
+            os.replace(dirName, oldDirName)
+        os.replace(tmpDirName, dirName)
+        if oldDirName is not None:
+            shutil.rmtree(oldDirName)
+    except BaseException:
+        shutil.rmtree(tmpDirName, ignore_errors=True)
+        raise
+
+
+# 读结果，数组为只读mmap
+# 输入：
+#   dirName：结果目录
+# 返回：
+#   arrays：{名字: 数组}
+#   meta：元数据字典
+def load(dirName):
+    with open(os.path.join(dirName, META_FNAME)) as file:
+        meta = json.load(file)
+    arrays = {}
+    for fileName in os.listdir(dirName):
+        if fileName.endswith(ARRAY_EXT):
+            arrays[fileName[:-len(ARRAY_EXT)]] = np.load(os.path.join(dirName, fileName), mmap_mode="r")
+    return arrays, meta
+
+
+# 结果目录是否存在
+def exists(dirName):
+    return os.path.exists(os.path.join(dirName, META_FNAME))
+
+
+# 变长数组拼接为一维数组和偏移，第k个为flat[offsets[k]:offsets[k+1]]
+# 输入：
+#   arrays：一维数组列表
+# 返回：
+#   flat, offsets
+def toRagged(arrays):
+    offsets = np.zeros(len(arrays) + 1, np.int64)
+    np.cumsum([len(array) for array in arrays], out=offsets[1:])
+    if len(arrays) == 0:
+        return np.zeros(0, int), offsets
+    return np.concatenate(arrays), offsets
@@ -0,0 +1,188 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import numpy.random as random
+
+import src.core as core
+import src.exp1 as exp1
+import src.store as store
+
+# ============== 参数扫描 =============
+# 由JSON/TOML的扫描描述展开为各次实验（参数的笛卡尔积），每次实验同exp1：nTurns轮，改进前、后两组
+# 每次实验的结果存到SWEEP_PATH下以参数哈希（含种子）命名的目录，已有结果的实验跳过，
+# 改了部分参数重跑时只计算新的实验
+# 描述的键，值为单个值或列表：
+#   meshLen, lowBandwidth, highBandwidth, nPackets, nTurns, seed（或seeds）, optLatencyMethod, shortestPathsMethod
+#   nPackets还可为{"min", "max", "step"}，同exp2
+#   name：扫描名，汇总写到SWEEP_PATH/name.json
+# 未给出的参数取各模块的默认值
+# 改进方法只有core.getModifiedLatencies一种，没有可扫描的改进方法参数；
+# 每次实验可选的方法是求最优延迟的optLatencyMethod和求最短路径的shortestPathsMethod
+
+SWEEP_PATH = os.path.join(exp1.PATH, "sweeps")
+# 各次实验的参数，按此顺序展开
+PARAM_NAMES = ["meshLen", "lowBandwidth", "highBandwidth", "nPackets", "nTurns", "seed", "optLatencyMethod",
+               "shortestPathsMethod"]
+# 哈希取的十六进制位数
+KEY_LEN = 16
+
+
+# 未给出时的参数值
+def getDefaultParams():
+    return {
+        "meshLen": core.MESH_LEN,
+        "lowBandwidth": exp1.LOW_BANDWIDTH,
+        "highBandwidth": exp1.HIGH_BANDWIDTH,
+        "nPackets": core.N_PACKETS,
+        "nTurns": exp1.N_TURNS,
+        "seed": 0,
+        "optLatencyMethod": core.OPT_LATENCY_METHOD,
+        "shortestPathsMethod": core.SHORTEST_PATHS_METHOD,
+    }
+
+
+# 读扫描描述，按扩展名为.toml或.json
+def readSpec(fileName):
+    if fileName.endswith(".toml"):
+        import tomllib
+        with open(fileName, "rb") as file:
+            return tomllib.load(file)
+    with open(fileName) as file:
+        return json.load(file)
+
+
+# 展开扫描描述
+# 输入：
+#   spec：扫描描述字典
+# 返回：
+#   jobs：各次实验的参数字典列表
+def expandSpec(spec):
+    spec = dict(spec)
+    spec.pop("name", None)
+    if "seeds" in spec:
+        spec["seed"] = spec.pop("seeds")
+    unknown = set(spec) - set(PARAM_NAMES)
+    if unknown:
+        raise ValueError(f"unknown sweep spec keys: {sorted(unknown)}")
+
+    params = getDefaultParams()
+    params.update(spec)
+    nPackets = params["nPackets"]
+    if isinstance(nPackets, dict):
+        params["nPackets"] = list(range(nPackets["min"], nPackets["max"] + 1, nPackets.get("step", 1)))
+    axes = [value if isinstance(value, list) else [value] for value in (params[name] for name in PARAM_NAMES)]
+    return [dict(zip(PARAM_NAMES, values)) for values in itertools.product(*axes)]
+
+
+# 实验的键：参数（含种子）的哈希
+def getKey(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:KEY_LEN]
+
+
+def getJobDirName(params, sweepPath=SWEEP_PATH):
+    return os.path.join(sweepPath, getKey(params))
+
+
+# 按参数跑一次实验并保存结果，可在子进程中运行；跑完恢复各模块的参数及全局随机状态
+# 输入：
+#   params：实验参数
+#   dirName：结果目录
+def runJob(params, dirName):
+    saved = (core.MESH_LEN, core.N_NODES, exp1.LOW_BANDWIDTH, exp1.HIGH_BANDWIDTH, core.OPT_LATENCY_METHOD,
+             core.SHORTEST_PATHS_METHOD)
+    savedRandomState = random.get_state()
+    try:
+        core.MESH_LEN = params["meshLen"]
+        core.N_NODES = params["meshLen"]**2
+        exp1.LOW_BANDWIDTH = params["lowBandwidth"]
+        exp1.HIGH_BANDWIDTH = params["highBandwidth"]
+        core.OPT_LATENCY_METHOD = params["optLatencyMethod"]
+        core.SHORTEST_PATHS_METHOD = params["shortestPathsMethod"]
+
+        random.seed(params["seed"])
+        state = exp1.newRunState(params["nTurns"])
+        exp1.runTurns(state, params["nPackets"], verbose=False)
+        meta = exp1.getStoreMeta(params["nTurns"], params["seed"], nPackets=params["nPackets"],
+                                 shortestPathsMethod=params["shortestPathsMethod"], params=params,
+                                 key=getKey(params))
+        store.save(dirName, exp1.getStoreArrays(state), meta)
+    finally:
+        core.MESH_LEN, core.N_NODES, exp1.LOW_BANDWIDTH, exp1.HIGH_BANDWIDTH, core.OPT_LATENCY_METHOD, \
+            core.SHORTEST_PATHS_METHOD = saved
+        random.set_state(savedRandomState)
+
+
+# 跑扫描中还没有结果的实验
+# 输入：
+#   spec：扫描描述
+#   nWorkers：并行进程数，None时串行
+#   sweepPath：结果目录
+#   dryRun：只列出要跑的实验
+# 返回：
+#   jobs：各次实验的参数
+#   nRun：本次跑的实验数
+def runSweep(spec, nWorkers=None, sweepPath=SWEEP_PATH, dryRun=False):
+    jobs = expandSpec(spec)
+    todo = [params for params in jobs if not store.exists(getJobDirName(params, sweepPath))]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(todo)} with stored results, {len(todo)} to run")
+    if dryRun:
+        for params in todo:
+            print(f"{getKey(params)}: {params}")
+        return jobs, 0
+
+    if nWorkers is None:
+        for idx, params in enumerate(todo):
+            print(f"[{idx + 1}/{len(todo)}] {getKey(params)}: {params}")
+            runJob(params, getJobDirName(params, sweepPath))
+    else:
+        with ProcessPoolExecutor(max_workers=nWorkers) as executor:
+            futures = {executor.submit(runJob, params, getJobDirName(params, sweepPath)): params for params in todo}
+            for idx, future in enumerate(as_completed(futures)):
+                future.result()
+                print(f"[{idx + 1}/{len(todo)}] {getKey(futures[future])}: {futures[future]}")
+
+    if "name" in spec:
+        saveSummary(os.path.join(sweepPath, spec["name"] + ".json"), jobs, sweepPath)
+    return jobs, len(todo)
+
+
+# 各次实验各指标的均值
+# 返回：
+#   summary：[{"key", "params", 指标名: 均值}]
+def getSummary(jobs, sweepPath=SWEEP_PATH):
+    summary = []
+    for params in jobs:
+        arrays, _ = store.load(getJobDirName(params, sweepPath))
+        row = {"key": getKey(params), "params": params}
+        row.update({resName: float(np.mean(arrays[resName])) for resName in exp1.TURN_RES_NAMES})
+        summary.append(row)
+    return summary
+
+
+def saveSummary(fileName, jobs, sweepPath=SWEEP_PATH):
+    with open(fileName, "w") as file:
+        json.dump(getSummary(jobs, sweepPath), file, indent=2)
+    print(f"Summary location: {fileName}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of Experiment I from a JSON/TOML spec, "
+                                                 "skipping jobs whose results are already stored.")
+    parser.add_argument("spec", help="sweep spec file (.json or .toml)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, serial when omitted")
+    parser.add_argument("--out-dir", default=SWEEP_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="only list the jobs to run")
+    args = parser.parse_args(argv)
+
+    runSweep(readSpec(args.spec), args.workers, args.out_dir, args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
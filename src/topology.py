@@ -0,0 +1,153 @@
+import numpy as np
+import numpy.random as random
+
+# ============== 拓扑 =============
+# 各生成函数返回(nNodes, srcs, dsts)：节点数，及按(起点, 终点)升序、无重复的有向边数组，
+# 无向链路存为两条方向相反的边；全部向量化构造
+# 可用graph.fromEdgeArrays(nNodes, srcs, dsts)建稀疏图，或toEdges()转为core使用的邻接表
+
+
+# MESH_LEN*MESH_LEN的二维网格
+# 输入：
+#   meshLen：网格边长
+# 返回：
+#   nNodes, srcs, dsts
+def genMesh(meshLen):
+    nodes = np.arange(meshLen * meshLen).reshape(meshLen, meshLen)
+    # 右邻、下邻
+    srcs = np.concatenate([nodes[:, :-1].ravel(), nodes[:-1, :].ravel()])
+    dsts = np.concatenate([nodes[:, 1:].ravel(), nodes[1:, :].ravel()])
+    return meshLen * meshLen, *bidirect(srcs, dsts)
+
+
+# MESH_LEN*MESH_LEN的二维环面，每行、每列首尾相连
+# 输入：
+#   meshLen：边长，至少为3，否则首尾相连的边与网格边重复
+# 返回：
+#   nNodes, srcs, dsts
+def genTorus(meshLen):
+    nodes = np.arange(meshLen * meshLen).reshape(meshLen, meshLen)
+    srcs = np.concatenate([nodes.ravel(), nodes.ravel()])
+    dsts = np.concatenate([np.roll(nodes, -1, axis=1).ravel(), np.roll(nodes, -1, axis=0).ravel()])
+    return meshLen * meshLen, *bidirect(srcs, dsts)
+
+
+# k叉胖树：(k/2)^2个核心交换机，k个pod各k/2个汇聚、k/2个接入交换机，每个接入交换机接k/2台主机
+# 节点编号依次为核心、汇聚、接入、主机
+# 输入：
+#   k：偶数
+#   withHosts：是否包含主机
+# 返回：
+#   nNodes, srcs, dsts
+def genFatTree(k, withHosts=True):
+    if k % 2 != 0:
+        raise ValueError(f"fat-tree k must be even, got {k}")
+    half = k // 2
+    nCore = half * half
+    aggIds = nCore + np.arange(k * half).reshape(k, half)
+    edgeIds = nCore + k * half + np.arange(k * half).reshape(k, half)
+
+    # 同一pod内接入-汇聚全连接：[pod, 接入, 汇聚]
+    edgeAggSrcs = np.broadcast_to(edgeIds[:, :, None], (k, half, half)).ravel()
+    edgeAggDsts = np.broadcast_to(aggIds[:, None, :], (k, half, half)).ravel()
+    # 第a个汇聚交换机连核心a*half到a*half+half-1：[pod, 汇聚, j]
+    coreIds = np.arange(nCore).reshape(half, half)
+    aggCoreSrcs = np.broadcast_to(aggIds[:, :, None], (k, half, half)).ravel()
+    aggCoreDsts = np.broadcast_to(coreIds[None, :, :], (k, half, half)).ravel()
+    srcs = [edgeAggSrcs, aggCoreSrcs]
+    dsts = [edgeAggDsts, aggCoreDsts]
+
+    nNodes = nCore + 2 * k * half
+    if withHosts:
+        nHosts = k * half * half
+        srcs.append(np.repeat(edgeIds.ravel(), half))
+        dsts.append(nNodes + np.arange(nHosts))
+        nNodes += nHosts
+    return nNodes, *bidirect(np.concatenate(srcs), np.concatenate(dsts))
+
+
+# 随机几何图：节点均匀分布在单位正方形内，距离不超过radius的节点对相连
+# 按边长不小于radius分格，只比较相邻格内的点；格数不超过节点数，radius很小时格表不随1/radius**2膨胀
+# 输入：
+#   nNodes：节点数
+#   radius：连接半径
+#   rng：numpy.random.RandomState或Generator，None时为全局随机状态
+# 返回：
+#   nNodes, srcs, dsts
+def genRandomGeometric(nNodes, radius, rng=None):
+    if rng is None:
+        rng = random
+    points = rng.random((nNodes, 2))
+    nCells = max(1, min(int(1 / radius), int(np.sqrt(nNodes))))
+    cellXY = np.minimum((points / (1 / nCells)).astype(np.int64), nCells - 1)
+    cells = cellXY[:, 0] * nCells + cellXY[:, 1]
+    order = np.argsort(cells, kind="stable")
+    cellStarts = np.searchsorted(cells[order], np.arange(nCells * nCells + 1))
+
+    srcs = []
+    dsts = []
+    # 本格及右、上、右上、右下4个相邻格，每对格只比较一次
+    for dx, dy in [(0, 0), (1, 0), (0, 1), (1, 1), (1, -1)]:
+        nx = cellXY[:, 0] + dx
+        ny = cellXY[:, 1] + dy
+        valid = (nx >= 0) & (nx < nCells) & (ny >= 0) & (ny < nCells)
+        us = np.flatnonzero(valid)
+        neighborCells = nx[us] * nCells + ny[us]
+        starts = cellStarts[neighborCells]
+        counts = cellStarts[neighborCells + 1] - starts
+        # 每个u展开为相邻格内所有点
+        us = np.repeat(us, counts)
+        offsets = np.arange(len(us)) - np.repeat(np.cumsum(counts) - counts, counts)
+        vs = order[np.repeat(starts, counts) + offsets]
+        if dx == 0 and dy == 0:
+            keep = us < vs
+        else:
+            keep = np.ones(len(us), bool)
+        keep &= np.sum((points[us] - points[vs]) ** 2, axis=1) <= radius * radius
+        srcs.append(us[keep])
+        dsts.append(vs[keep])
+    return nNodes, *bidirect(np.concatenate(srcs), np.concatenate(dsts))
+
+
+# 读边表文件：每行"src dst"，#开头为注释
+# 输入：
+#   fileName：文件名
+#   directed：False时每条边加反向边
+#   nNodes：节点数，None时为最大编号+1
+# 返回：
+#   nNodes, srcs, dsts
+def loadEdgeList(fileName, directed=False, nNodes=None):
+    pairs = np.loadtxt(fileName, dtype=np.int64, comments="#", ndmin=2)
+    srcs = pairs[:, 0]
+    dsts = pairs[:, 1]
+    if nNodes is None:
+        nNodes = int(max(srcs.max(initial=-1), dsts.max(initial=-1))) + 1
+    if directed:
+        return nNodes, *sortEdges(nNodes, srcs, dsts)
+    return nNodes, *bidirect(srcs, dsts)
+
+
+# 加反向边，去掉自环和重复边，按(起点, 终点)升序
+def bidirect(srcs, dsts):
+    srcs = np.asarray(srcs, np.int64)
+    dsts = np.asarray(dsts, np.int64)
+    nNodes = int(max(srcs.max(initial=-1), dsts.max(initial=-1))) + 1
+    return sortEdges(nNodes, np.concatenate([srcs, dsts]), np.concatenate([dsts, srcs]))
+
+
+# 去掉自环和重复边，按(起点, 终点)升序
+def sortEdges(nNodes, srcs, dsts):
+    srcs = np.asarray(srcs, np.int64)
+    dsts = np.asarray(dsts, np.int64)
+    keys = np.unique((srcs * nNodes + dsts)[srcs != dsts])
+    return keys // nNodes, keys % nNodes
+
+
+# 转为core使用的邻接表，edges[u]为u的出边终点列表
+# 输入：
+#   nNodes, srcs, dsts：按起点升序的边
+# 返回：
+#   edges：邻接表
+def toEdges(nNodes, srcs, dsts):
+    splits = np.searchsorted(srcs, np.arange(1, nNodes))
+    return [neighbors.tolist() for neighbors in np.split(np.asarray(dsts), splits)]
@@ -0,0 +1,190 @@
+import json
+import os
+
+import numpy as np
+
+import src.core as core
+
+# ============== 逐轮状态的记录与回放 =============
+# 记录每轮改进前、后的输入延迟，实际选路的前驱节点矩阵PI，及本轮的包，写入预分配的.npy文件（mmap），
+# 按取值范围用紧凑的整数类型；带宽只记一次
+# 回放时以只读mmap打开，可直接取第t轮的状态重算各包实际、最优延迟，或换一种改进策略重新选路，不必重放之前各轮
+# 目录下的文件：
+#   bandwidths：(N, N)
+#   latencies：(nTurns+1, N, N)，第t轮改进前的输入延迟，即第t-1轮的各边延迟；最后一项为最后一轮的各边延迟
+#   modifiedLatencies：(nTurns, N, N)，第t轮改进后的输入延迟
+#   PI, PIImproved：(nTurns, N, N)，第t轮改进前、后选路的前驱节点矩阵
+#   packets：(nTurns, nPackets, 2)，第t轮各包的(src, dst)
+#   meta.json：形状、类型，及已记录的轮数nRecorded
+
+META_FNAME = "meta.json"
+ARRAY_EXT = ".npy"
+# 每轮的数组
+ROUND_ARRAY_NAMES = ["modifiedLatencies", "PI", "PIImproved", "packets"]
+
+
+# 能表示[-1, maxValue]的最小有符号整数类型
+def getIntDtype(maxValue):
+    for dtype in (np.int8, np.int16, np.int32):
+        if maxValue <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+# 各数组的形状和类型
+# 各边延迟不超过MAX_LANRTENCY或一轮的包数（每个包至多经过一条边一次，带宽至少为1）
+# 返回：
+#   {名字: (形状, 类型)}
+def getLayout(nNodes, nPackets, nTurns, maxBandwidth):
+    latencyDtype = getIntDtype(max(int(core.MAX_LANRTENCY), nPackets))
+    nodeDtype = getIntDtype(nNodes)
+    return {
+        "bandwidths": ((nNodes, nNodes), getIntDtype(maxBandwidth)),
+        "latencies": ((nTurns + 1, nNodes, nNodes), latencyDtype),
+        "modifiedLatencies": ((nTurns, nNodes, nNodes), latencyDtype),
+        "PI": ((nTurns, nNodes, nNodes), nodeDtype),
+        "PIImproved": ((nTurns, nNodes, nNodes), nodeDtype),
+        "packets": ((nTurns, nPackets, 2), nodeDtype),
+    }
+
+
+# 记录或回放的逐轮状态
+#   dirName：目录
+#   meta：{"nNodes", "nPackets", "nTurns", "nRecorded", "dtypes"}
+#   arrays：{名字: mmap数组}
+class Trace:
+    __slots__ = ("dirName", "meta", "arrays")
+
+    def __init__(self, dirName, meta, arrays):
+        self.dirName = dirName
+        self.meta = meta
+        self.arrays = arrays
+
+
+# 新建记录，预分配各文件，写入带宽，已记录的轮数为0
+# 从检查点继续时，目录中已有形状、带宽相同的记录则以读写方式打开，续写
+# 输入：
+#   dirName：目录
+#   bandwidths：各边带宽
+#   nPackets：每轮包数
+#   nTurns：最多的轮数
+#   resume：是否从检查点继续；为False时总是重新记录，不沿用目录中的内容
+# 返回：
+#   Trace
+def create(dirName, bandwidths, nPackets, nTurns, resume=False):
+    nNodes = bandwidths.shape[0]
+    layout = getLayout(nNodes, nPackets, nTurns, int(bandwidths.max()))
+    meta = {"nNodes": nNodes, "nPackets": nPackets, "nTurns": nTurns, "nRecorded": 0,
+            "dtypes": {name: dtype.str for name, (_, dtype) in layout.items()}}
+    oldMeta = readMeta(dirName) if resume else None
+    if oldMeta is not None and all(oldMeta[key] == meta[key] for key in ("nNodes", "nPackets", "nTurns", "dtypes")):
+        arrays = {name: np.load(getFileName(dirName, name), mmap_mode="r+") for name in layout}
+        if np.array_equal(arrays["bandwidths"], bandwidths):
+            return Trace(dirName, oldMeta, arrays)
+        del arrays
+
+    os.makedirs(dirName, exist_ok=True)
+    arrays = {name: np.lib.format.open_memmap(getFileName(dirName, name), mode="w+", dtype=dtype, shape=shape)
+              for name, (shape, dtype) in layout.items()}
+    arrays["bandwidths"][:] = bandwidths
+    trace = Trace(dirName, meta, arrays)
+    writeMeta(trace)
+    return trace
+
+
+# 记录一轮
+# 输入：
+#   trace：create得到的Trace
+#   turn：轮
+#   latencies, modifiedLatencies：本轮改进前、后的输入延迟
+#   packets：本轮的包
+#   PI, PIImproved：本轮改进前、后选路的前驱节点矩阵
+#   curLatencies：本轮改进前的各边延迟，即下一轮的输入
+def record(trace, turn, latencies, modifiedLatencies, packets, PI, PIImproved, curLatencies):
+    arrays = trace.arrays
+    arrays["latencies"][turn] = latencies
+    arrays["latencies"][turn + 1] = curLatencies
+    arrays["modifiedLatencies"][turn] = modifiedLatencies
+    arrays["PI"][turn] = PI
+    arrays["PIImproved"][turn] = PIImproved
+    arrays["packets"][turn] = packets
+    trace.meta["nRecorded"] = max(trace.meta["nRecorded"], turn + 1)
+
+
+# 写回文件，更新已记录的轮数
+def flush(trace):
+    for array in trace.arrays.values():
+        array.flush()
+    writeMeta(trace)
+
+
+# 以只读mmap打开记录
+def load(dirName):
+    meta = readMeta(dirName)
+    if meta is None:
+        raise FileNotFoundError(f"no trace in {dirName}")
+    arrays = {name: np.load(getFileName(dirName, name), mmap_mode="r")
+              for name in ["bandwidths", "latencies"] + ROUND_ARRAY_NAMES}
+    return Trace(dirName, meta, arrays)
+
+
+# 第turn轮的状态
+# 返回：
+#   {"bandwidths", "latencies", "modifiedLatencies", "PI", "PIImproved", "packets", "curLatencies"}，
+#   为int的普通数组
+def getRound(trace, turn):
+    checkTurn(trace, turn)
+    arrays = trace.arrays
+    state = {name: np.asarray(arrays[name][turn], int) for name in ["latencies"] + ROUND_ARRAY_NAMES}
+    state["bandwidths"] = np.asarray(arrays["bandwidths"], int)
+    state["curLatencies"] = np.asarray(arrays["latencies"][turn + 1], int)
+    return state
+
+
+# 由第turn轮记录的状态重算本轮各边延迟、各包实际/最优延迟
+# 输入：
+#   trace：load得到的Trace
+#   turn：轮
+#   improved：False用改进前的选路，True用改进后的
+#   optLatencyMethod：求最优延迟的方法，None时为core.OPT_LATENCY_METHOD
+#   policy：改进策略，由本轮改进前的输入延迟求选路依据，如core.getModifiedLatencies；
+#           给出时按policy(latencies)重新求最短路选路，不用记录的PI，improved被忽略
+# 返回：
+#   curLatencies：本轮各边延迟
+#   packetsActualLatencies, packetsOptLatencies：本轮各包实际、最优延迟
+def replay(trace, turn, improved=False, optLatencyMethod=None, policy=None):
+    state = getRound(trace, turn)
+    packets, bandwidths = state["packets"], state["bandwidths"]
+    if policy is not None:
+        _, PI = core.getShortestPaths(policy(state["latencies"]))
+    else:
+        PI = state["PIImproved" if improved else "PI"]
+    curLatencies = core.getLatencies(packets, PI, bandwidths)
+    packetsActualLatencies = core.getPacketsActualLatencies(packets, PI, curLatencies)
+    packetsOptLatencies = core.getPacketsOptLatencies(packets, PI, bandwidths, packetsActualLatencies,
+                                                      method=optLatencyMethod)
+    return curLatencies, packetsActualLatencies, packetsOptLatencies
+
+
+def checkTurn(trace, turn):
+    if not 0 <= turn < trace.meta["nRecorded"]:
+        raise IndexError(f"turn {turn} not recorded, {trace.meta['nRecorded']} rounds in {trace.dirName}")
+
+
+def getFileName(dirName, name):
+    return os.path.join(dirName, name + ARRAY_EXT)
+
+
+def readMeta(dirName):
+    fileName = os.path.join(dirName, META_FNAME)
+    if not os.path.exists(fileName):
+        return None
+    with open(fileName) as file:
+        return json.load(file)
+
+
+def writeMeta(trace):
+    fileName = os.path.join(trace.dirName, META_FNAME)
+    with open(fileName + ".tmp", "w") as file:
+        json.dump(trace.meta, file, indent=2)
+    os.replace(fileName + ".tmp", fileName)
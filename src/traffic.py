@@ -0,0 +1,156 @@
+import numpy as np
+import numpy.random as random
+
+# ============== 流量模型 =============
+# 一轮的流量聚合为需求：各不同的(src, dst)对及其包数，代价随不同的对数而非包数增长
+# 各模型先给出各(src, dst)对的概率矩阵（对角为0），再一次抽取各对的包数：
+# 固定总包数时为多项分布，泊松到达时各对独立泊松
+# core.getLatencies、getPacketsActualLatencies、getPacketsOptLatencies可直接接受Demand
+
+
+# 聚合的流量需求
+#   nNodes：节点数
+#   srcs, dsts：各(src, dst)对，按src*nNodes+dst升序、无重复
+#   counts：各对的包数，均大于0
+class Demand:
+    __slots__ = ("nNodes", "srcs", "dsts", "counts")
+
+    def __init__(self, nNodes, srcs, dsts, counts):
+        self.nNodes = nNodes
+        self.srcs = srcs
+        self.dsts = dsts
+        self.counts = counts
+
+
+# 由包列表聚合
+# 输入：
+#   packets：记录每个包src和dst的列表
+#   nNodes：节点数
+# 返回：
+#   demand
+def fromPackets(packets, nNodes):
+    packets = np.asarray(packets, np.int64).reshape(-1, 2)
+    keys, counts = np.unique(packets[:, 0] * nNodes + packets[:, 1], return_counts=True)
+    return Demand(nNodes, keys // nNodes, keys % nNodes, counts)
+
+
+# 由nNodes*nNodes的包数矩阵聚合
+def fromMatrix(matrix):
+    srcs, dsts = np.nonzero(matrix)
+    return Demand(matrix.shape[0], srcs, dsts, matrix[srcs, dsts].astype(np.int64))
+
+
+# 转为nNodes*nNodes的包数矩阵
+def toMatrix(demand):
+    matrix = np.zeros((demand.nNodes, demand.nNodes), np.int64)
+    matrix[demand.srcs, demand.dsts] = demand.counts
+    return matrix
+
+
+# 展开为逐包的(P, 2)数组，按(src, dst)对排列
+def toPackets(demand):
+    return np.repeat(np.stack([demand.srcs, demand.dsts], axis=1), demand.counts, axis=0)
+
+
+# 总包数
+def getNPackets(demand):
+    return int(demand.counts.sum())
+
+
+#=========== 各(src, dst)对的概率 =================
+
+# 均匀：src均匀，dst在其余节点中均匀，与core.genPackets的分布相同
+def getUniformProbs(nNodes):
+    probs = np.full((nNodes, nNodes), 1 / (nNodes * (nNodes - 1)))
+    np.fill_diagonal(probs, 0)
+    return probs
+
+
+# 重力模型：(src, dst)对的概率正比于weights[src]*weights[dst]
+# 输入：
+#   weights：各节点的权重（如人口、接入带宽），非负
+def getGravityProbs(weights):
+    weights = np.asarray(weights, float)
+    probs = np.outer(weights, weights)
+    np.fill_diagonal(probs, 0)
+    return probs / probs.sum()
+
+
+# 热点：hotFraction的包发往热点节点（src均匀，dst在除src外的热点中均匀），其余均匀
+# 输入：
+#   nNodes：节点数
+#   hotspots：热点节点
+#   hotFraction：发往热点的包的比例
+def getHotspotProbs(nNodes, hotspots, hotFraction):
+    isHot = np.zeros((nNodes, nNodes), bool)
+    isHot[:, np.asarray(hotspots, int)] = True
+    np.fill_diagonal(isHot, False)
+    nHot = isHot.sum(axis=1, keepdims=True)
+    hotProbs = np.divide(isHot, nHot * nNodes, out=np.zeros((nNodes, nNodes)), where=nHot > 0)
+    probs = (1 - hotFraction) * getUniformProbs(nNodes) + hotFraction * hotProbs
+    return probs / probs.sum()
+
+
+#=========== 抽取需求 =================
+
+# 固定总包数，按概率矩阵一次多项分布抽取各对包数
+# 输入：
+#   probs：各(src, dst)对的概率矩阵
+#   nPackets：总包数
+#   rng：numpy.random.RandomState或Generator，None时为全局随机状态
+# 返回：
+#   demand
+def genDemand(probs, nPackets, rng=None):
+    if rng is None:
+        rng = random
+    counts = rng.multinomial(nPackets, (probs / probs.sum()).ravel())
+    return fromMatrix(counts.reshape(probs.shape))
+
+
+# 泊松到达：各(src, dst)对在duration内的到达数独立服从均值rate*duration*probs的泊松分布
+# 输入：
+#   probs：各(src, dst)对的概率矩阵
+#   rate：总到达率
+#   duration：时长
+#   rng：同genDemand
+# 返回：
+#   demand
+def genPoisson(probs, rate, duration=1.0, rng=None):
+    if rng is None:
+        rng = random
+    return fromMatrix(rng.poisson(rate * duration * probs / probs.sum()))
+
+
+# 均匀模型的需求，同getUniformProbs
+# 输入：
+#   nNodes：节点数
+#   nPackets：总包数
+#   rng：同genDemand
+# 返回：
+#   demand
+def genUniform(nNodes, nPackets, rng=None):
+    return genDemand(getUniformProbs(nNodes), nPackets, rng)
+
+
+# 重力模型的需求，同getGravityProbs
+# 输入：
+#   weights：各节点的权重，非负
+#   nPackets：总包数
+#   rng：同genDemand
+# 返回：
+#   demand
+def genGravity(weights, nPackets, rng=None):
+    return genDemand(getGravityProbs(weights), nPackets, rng)
+
+
+# 热点模型的需求，同getHotspotProbs
+# 输入：
+#   nNodes：节点数
+#   nPackets：总包数
+#   hotspots：热点节点
+#   hotFraction：发往热点的包的比例
+#   rng：同genDemand
+# 返回：
+#   demand
+def genHotspot(nNodes, nPackets, hotspots, hotFraction, rng=None):
+    return genDemand(getHotspotProbs(nNodes, hotspots, hotFraction), nPackets, rng)